@@ -0,0 +1,220 @@
+"""
+Артефакты отладки только по делу: вместо скриншота после каждого поиска в памяти
+держится кольцевой буфер последних состояний страницы (ссылка, первые элементы DOM, консоль),
+а на диск он попадает только при ошибке или с вероятностью ARTIFACT_SAMPLE_RATE.
+
+Скриншот снимается в основном потоке (драйвер не потокобезопасен), а сжатие и запись
+выполняет фоновый поток. Каталог ARTIFACT_DIR ограничен по объёму и возрасту.
+
+    artifacts/<время>_<причина>/state.json.gz   — буфер состояний и ошибка
+    artifacts/<время>_<причина>/screen.webp      — скриншот (png, если нет Pillow)
+"""
+import io
+import os
+import gzip
+import json
+import time
+import queue
+import random
+import shutil
+import atexit
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+import metrics
+
+ARTIFACT_DIR = 'artifacts'
+RING_SIZE = 20  # Сколько последних состояний страницы помнить
+ARTIFACT_SAMPLE_RATE = float(os.environ.get('ARTIFACT_SAMPLE_RATE', 0))  # Доля успешных шагов, сохраняемых для контроля
+SNIPPET_CHARS = 4000  # Сколько символов DOM сохранять в состоянии
+SNIPPET_NODES = 200  # Сколько первых элементов DOM копировать во фрагмент (весь контейнер не сериализуется)
+CONSOLE_LINES = 20  # Сколько последних сообщений консоли сохранять
+MAX_TOTAL_MB = 200  # Предельный объём каталога артефактов
+MAX_AGE_DAYS = 7  # Артефакты старше удаляются
+SCREENSHOT_QUALITY = 60  # Качество WebP
+
+# Ставится на каждую страницу (Page.addScriptToEvaluateOnNewDocument): ошибки и предупреждения
+# консоли копятся в window.__consoleLog, читать их отдельным запросом к браузеру не нужно
+CONSOLE_HOOK_JS = """
+(() => {
+    if (window.__consoleLog) return;
+    const log = window.__consoleLog = [];
+    const push = (line) => { log.push(line.slice(0, 500)); if (log.length > 50) log.shift(); };
+    for (const level of ['error', 'warn']) {
+        const original = console[level];
+        console[level] = function (...args) {
+            push(level + ': ' + args.map(String).join(' '));
+            return original.apply(this, args);
+        };
+    }
+    window.addEventListener('error', (e) => push('uncaught: ' + e.message));
+})();
+"""
+
+# Состояние страницы одним вызовом: arguments[0] — селектор фрагмента DOM, [1] — длина, [2] — строк консоли,
+# [3] — сколько первых элементов копировать. Фрагмент собирается из неглубоких копий первых элементов
+# в порядке документа: outerHTML всего контейнера с сотнями сниппетов на каждом шаге не строится
+PAGE_STATE_JS = """
+    const [selector, maxChars, consoleLines, maxNodes] = arguments;
+    const root = document.querySelector(selector) || document.body;
+    let budget = maxNodes;
+    const copy = (el) => {
+        const clone = el.cloneNode(false);
+        for (let child = el.firstChild; child && budget > 0; child = child.nextSibling) {
+            if (child.nodeType === Node.ELEMENT_NODE) {
+                budget--;
+                clone.appendChild(copy(child));
+            } else if (child.nodeType === Node.TEXT_NODE) {
+                clone.appendChild(child.cloneNode(false));
+            }
+        }
+        return clone;
+    };
+    return {
+        url: location.href,
+        title: document.title,
+        snippet: root ? copy(root).outerHTML.slice(0, maxChars) : null,
+        elements: root ? root.getElementsByTagName('*').length : 0,
+        console: (window.__consoleLog || []).slice(-consoleLines)
+    };
+"""
+
+_recorder = None
+
+
+def compress_screenshot(png):
+    """PNG -> WebP (в несколько раз меньше); без Pillow остаётся PNG"""
+    if Image is None:
+        return png, 'png'
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(png)).convert('RGB').save(buffer, 'WEBP', quality=SCREENSHOT_QUALITY)
+    return buffer.getvalue(), 'webp'
+
+
+class ArtifactRecorder:
+    """
+    Кольцевой буфер состояний страницы и фоновая запись артефактов.
+    record() — дёшево запомнить состояние, capture() — сохранить буфер и скриншот на диск.
+    """
+
+    def __init__(self, root=ARTIFACT_DIR, ring_size=RING_SIZE, sample_rate=ARTIFACT_SAMPLE_RATE):
+        self.root = root
+        self.ring = deque(maxlen=ring_size)
+        self.sample_rate = sample_rate
+        self.tasks = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def record(self, driver, stage, selector='body', **context):
+        """Запоминает состояние страницы после шага stage (один вызов в браузер, без записи на диск)"""
+        entry = {'time': datetime.now().isoformat(timespec='seconds'), 'stage': stage, **context}
+        try:
+            entry.update(driver.execute_script(PAGE_STATE_JS, selector, SNIPPET_CHARS, CONSOLE_LINES, SNIPPET_NODES))
+        except Exception as e:
+            entry['state_error'] = str(e)
+        self.ring.append(entry)
+        return entry
+
+    def maybe_sample(self, driver, stage):
+        """Сохраняет артефакт успешного шага с вероятностью sample_rate"""
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.capture(driver, f"sample_{stage}")
+        return None
+
+    def capture(self, driver, reason, error=None, **context):
+        """
+        Сохраняет буфер состояний и скриншот. Снимок экрана делается сразу,
+        сжатие и запись — в фоновом потоке.
+        :return: каталог артефакта
+        """
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{reason}"
+        state = {
+            'reason': reason,
+            'context': context,
+            'error': None if error is None else ''.join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            ),
+            'ring': list(self.ring),
+        }
+        png = None
+        if driver is not None:
+            try:
+                png = driver.get_screenshot_as_png()
+            except Exception as e:
+                state['screenshot_error'] = str(e)
+
+        path = os.path.join(self.root, name)
+        self.tasks.put((path, state, png))
+        metrics.inc('artifacts_total', reason=reason)
+        print(f"[ARTIFACT] Сохраняется {path}")
+        return path
+
+    def _write_loop(self):
+        while True:
+            path, state, png = self.tasks.get()
+            try:
+                self._write(path, state, png)
+                self.enforce_retention()
+            except Exception as e:
+                print(f"[ARTIFACT] Не удалось записать {path}: {e}")
+            finally:
+                self.tasks.task_done()
+
+    def _write(self, path, state, png):
+        os.makedirs(path, exist_ok=True)
+        with gzip.open(os.path.join(path, 'state.json.gz'), 'wt', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1, default=str)
+        if png:
+            data, ext = compress_screenshot(png)
+            with open(os.path.join(path, f"screen.{ext}"), 'wb') as f:
+                f.write(data)
+
+    def enforce_retention(self, max_total_mb=MAX_TOTAL_MB, max_age_days=MAX_AGE_DAYS):
+        """Удаляет артефакты старше max_age_days, затем самые старые, пока каталог не уложится в max_total_mb"""
+        if not os.path.isdir(self.root):
+            return 0
+        bundles = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            bundles.append((os.path.getmtime(path), size, path))
+        bundles.sort()
+
+        cutoff = time.time() - max_age_days * 86400
+        total = sum(size for _, size, _ in bundles)
+        removed = 0
+        for mtime, size, path in bundles:
+            if mtime >= cutoff and total <= max_total_mb * 1024 * 1024:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def flush(self):
+        """Дожидается записи всех поставленных артефактов"""
+        self.tasks.join()
+
+
+def get_recorder():
+    """Общий буфер артефактов процесса"""
+    global _recorder
+    if _recorder is None:
+        _recorder = ArtifactRecorder()
+    return _recorder
+
+
+@atexit.register
+def flush_all():
+    """Дописывает артефакты, поставленные перед завершением процесса"""
+    if _recorder is not None:
+        _recorder.flush()
@@ -0,0 +1,192 @@
+"""
+Офлайн-бенчмарк горячих участков парсера на фикстурах из fixtures/.
+
+Страницы раздаются локальным HTTP-сервером, стадии запускаются в headless Chrome.
+Для каждой стадии считаются перцентили задержки, обращения к WebDriver на организацию
+и организаций в секунду. С --baseline сравнивает результат с прошлым прогоном и
+завершается с кодом 1, если какая-то стадия замедлилась сильнее --max-regression.
+
+    python3 benchmark.py --rounds 5 --output bench.json
+    python3 benchmark.py --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from selenium.webdriver.common.by import By
+
+import scraper
+import review_parser
+import phone_scraper
+from driver_factory import create_driver
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server():
+    """Запускает HTTP-сервер с фикстурами на свободном порту"""
+    handler = partial(QuietHandler, directory=FIXTURES_DIR)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def count_commands(driver):
+    """Подсчитывает обращения к chromedriver (включая вызовы через WebElement)"""
+    counter = {'commands': 0}
+    original = driver.execute
+
+    def execute(command, params=None):
+        counter['commands'] += 1
+        return original(command, params)
+
+    driver.execute = execute
+    return counter
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# --- СТАДИИ ---
+# Каждая стадия готовит страницу (не входит в замер) и возвращает функцию замера,
+# которая отдаёт количество обработанных организаций.
+
+def stage_parse_organization(driver, base_url, orgs):
+    driver.get(f"{base_url}/search.html?total={orgs}&batch={orgs}")
+    elements = driver.find_elements(By.CSS_SELECTOR, '.search-business-snippet-view')
+    return lambda: sum(1 for el in elements if scraper.parse_organization(el))
+
+
+def stage_get_coords(driver, base_url, orgs):
+    driver.get(f"{base_url}/search.html?total={orgs}&batch={orgs}")
+    elements = driver.find_elements(By.CSS_SELECTOR, '.search-business-snippet-view')
+    return lambda: sum(1 for el in elements if scraper.get_coords_from_element(el))
+
+
+def stage_parse_batch(driver, base_url, orgs):
+    driver.get(f"{base_url}/search.html?total={orgs}&batch={orgs}")
+    return lambda: len(scraper.parse_organizations_batch())
+
+
+def stage_scroll(driver, base_url, orgs):
+    driver.get(f"{base_url}/search.html?total={orgs}&batch=20&delay=150")
+    return lambda: len(scraper.scroll_to_load_organizations(max_orgs=orgs, idle_timeout=1))
+
+
+def stage_collect_reviews(driver, base_url, orgs):
+    driver.get(f"{base_url}/reviews.html?total=50&batch=10")
+    return lambda: 1 if review_parser.collect_reviews(driver, review_parser.REVIEWS_PER_CATEGORY) else 0
+
+
+def stage_iter_reviews(driver, base_url, orgs):
+    driver.get(f"{base_url}/reviews.html?total={orgs}&batch=20")
+    return lambda: sum(1 for _ in review_parser.iter_reviews(driver, orgs, idle_timeout=1))
+
+
+def stage_parse_contacts(driver, base_url, orgs):
+    driver.get(f"{base_url}/search.html")
+    return lambda: 1 if phone_scraper.parse_contacts_for_link(driver, f"{base_url}/org.html")['phone'] else 0
+
+
+STAGES = {
+    'parse_organization': stage_parse_organization,
+    'get_coords_from_element': stage_get_coords,
+    'parse_organizations_batch': stage_parse_batch,
+    'scroll_to_load_organizations': stage_scroll,
+    'collect_reviews': stage_collect_reviews,
+    'iter_reviews': stage_iter_reviews,
+    'parse_contacts_for_link': stage_parse_contacts,
+}
+
+
+def run_stage(name, driver, counter, base_url, orgs, rounds):
+    latencies = []
+    total_orgs = 0
+    total_commands = 0
+
+    for _ in range(rounds):
+        measure = STAGES[name](driver, base_url, orgs)
+        counter['commands'] = 0
+        started = time.perf_counter()
+        total_orgs += measure()
+        latencies.append(time.perf_counter() - started)
+        total_commands += counter['commands']
+
+    elapsed = sum(latencies)
+    return {
+        'p50': statistics.median(latencies),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'orgs_per_s': total_orgs / elapsed if elapsed > 0 else 0.0,
+        'commands_per_org': total_commands / total_orgs if total_orgs else None,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Возвращает список стадий, где p50 вырос больше чем на max_regression"""
+    regressions = []
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if old and old['p50'] > 0 and stats['p50'] > old['p50'] * (1 + max_regression):
+            regressions.append((name, old['p50'], stats['p50']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк стадий парсера")
+    parser.add_argument('--stages', nargs='*', default=list(STAGES), choices=list(STAGES))
+    parser.add_argument('--rounds', type=int, default=5, help="Сколько раз прогонять каждую стадию")
+    parser.add_argument('--orgs', type=int, default=100, help="Организаций в синтетической выдаче")
+    parser.add_argument('--output', help="Куда сохранить результаты (JSON)")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="Допустимое замедление p50 (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    driver = create_driver(headless=True, profile='full')
+    counter = count_commands(driver)
+    # Функции scraper.py работают с глобальным драйвером модуля
+    scraper.driver = driver
+
+    results = {}
+    try:
+        for name in args.stages:
+            results[name] = run_stage(name, driver, counter, base_url, args.orgs, args.rounds)
+            stats = results[name]
+            commands = f"{stats['commands_per_org']:.1f}" if stats['commands_per_org'] is not None else '-'
+            print(f"{name:30} p50 {stats['p50']:.3f} с  p90 {stats['p90']:.3f} с  p99 {stats['p99']:.3f} с  "
+                  f"{stats['orgs_per_s']:.1f} орг/с  {commands} команд/орг")
+    finally:
+        driver.quit()
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        for name, old, new in regressions:
+            print(f"[REGRESSION] {name}: p50 {old:.3f} с -> {new:.3f} с")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
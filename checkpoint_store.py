@@ -0,0 +1,144 @@
+import os
+import json
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+# --- ПУТИ ---
+CHECKPOINT_DB = 'enrichment.sqlite'
+CSV_FILE = 'output_raw.csv'
+
+# Этапы обогащения и колонки, которые они добавляют в CSV
+STAGE_COLUMNS = {
+    'reviews': ['negative', 'positive'],
+    'contacts': ['phone', 'telegram', 'vk'],
+}
+
+
+def org_key(link):
+    """Ключ организации: ссылка на карточку без '/reviews/' и завершающего слэша"""
+    return str(link).replace('reviews/', '').rstrip('/')
+
+
+class CheckpointStore:
+    """
+    Хранилище результатов обогащения в SQLite (WAL): каждая организация — отдельный
+    upsert по ключу (этап, ссылка), поэтому падение посреди записи не портит CSV.
+    Неудачные попытки хранятся со status = 'failed' и повторяются в следующем запуске.
+    """
+
+    def __init__(self, path=CHECKPOINT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                stage TEXT NOT NULL,
+                link TEXT NOT NULL,
+                data TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'ok',
+                error TEXT,
+                PRIMARY KEY (stage, link)
+            )
+        """)
+        self.conn.commit()
+
+    def upsert(self, stage, link, data):
+        """Сохраняет результат для одной организации (перезаписывает прежний)"""
+        self.upsert_many(link, {stage: data})
+
+    def upsert_many(self, link, results):
+        """Сохраняет результаты нескольких этапов для одной организации одной транзакцией"""
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO results (stage, link, data, updated_at, status, error) VALUES (?, ?, ?, ?, 'ok', NULL)
+                ON CONFLICT (stage, link) DO UPDATE SET
+                    data = excluded.data, updated_at = excluded.updated_at, status = 'ok', error = NULL
+                """,
+                [(stage, org_key(link), json.dumps(data, ensure_ascii=False), now)
+                 for stage, data in results.items()]
+            )
+
+    def mark_failed(self, stage, link, error=None):
+        """
+        Отмечает неудачную попытку: организация не считается обработанной и попадёт
+        в следующий запуск. Уже сохранённый успешный результат не затирается.
+        """
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO results (stage, link, data, updated_at, status, error) VALUES (?, ?, 'null', ?, 'failed', ?)
+                ON CONFLICT (stage, link) DO UPDATE SET
+                    updated_at = excluded.updated_at, status = 'failed', error = excluded.error
+                WHERE results.status != 'ok'
+                """,
+                (stage, org_key(link), datetime.now().isoformat(), None if error is None else str(error))
+            )
+
+    def is_done(self, stage, link):
+        """Проверяет по первичному ключу, есть ли уже результат"""
+        row = self.conn.execute(
+            "SELECT 1 FROM results WHERE stage = ? AND link = ? AND status = 'ok'", (stage, org_key(link))
+        ).fetchone()
+        return row is not None
+
+    def done_links(self, stage):
+        """Множество ключей, для которых этап уже выполнен (неудачные попытки сюда не входят)"""
+        rows = self.conn.execute("SELECT link FROM results WHERE stage = ? AND status = 'ok'", (stage,))
+        return {link for (link,) in rows}
+
+    def results(self, stage):
+        """Словарь ключ -> результат этапа"""
+        rows = self.conn.execute("SELECT link, data FROM results WHERE stage = ? AND status = 'ok'", (stage,))
+        return {link: json.loads(data) for link, data in rows}
+
+    def failed_links(self, stage):
+        """Словарь ключ -> текст ошибки для организаций, на которых этап пока не удался"""
+        rows = self.conn.execute("SELECT link, error FROM results WHERE stage = ? AND status = 'failed'", (stage,))
+        return dict(rows)
+
+    def merge_into(self, df, stage, columns=None):
+        """Переносит результаты этапа в колонки DataFrame (по ключу ссылки)"""
+        columns = columns or STAGE_COLUMNS[stage]
+        results = self.results(stage)
+        keys = df['link'].map(org_key)
+
+        for col in columns:
+            values = keys.map(lambda key: results[key].get(col) if key in results else None)
+            if col in df.columns:
+                df[col] = values.where(keys.isin(list(results)), df[col])
+            else:
+                df[col] = values
+        return df
+
+    def close(self):
+        self.conn.close()
+
+
+def write_csv_atomic(df, path):
+    """Пишет CSV во временный файл и атомарно подменяет им исходный"""
+    tmp_path = f"{path}.tmp"
+    df.to_csv(tmp_path, index=False, encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def export_csv(store, csv_file=CSV_FILE, stages=None):
+    """Выгружает накопленные результаты этапов в CSV (одна запись файла)"""
+    df = pd.read_csv(csv_file)
+    for stage in stages or STAGE_COLUMNS:
+        df = store.merge_into(df, stage)
+    write_csv_atomic(df, csv_file)
+    print(f"[EXPORT] Результаты выгружены в {csv_file}")
+    return df
+
+
+if __name__ == "__main__":
+    # Выгрузка по требованию: python checkpoint_store.py
+    checkpoint = CheckpointStore()
+    export_csv(checkpoint)
+    checkpoint.close()
@@ -0,0 +1,182 @@
+import re
+import json
+import time
+import asyncio
+from urllib.parse import urlsplit
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from checkpoint_store import org_key
+from parsing import extract_org_id
+from snapshot_store import capture as capture_snapshot
+
+# --- НАСТРОЙКИ ---
+CONCURRENCY = 8  # Сколько страниц скачивается одновременно
+HOST_RATE_PER_SECOND = 2  # Не больше стольких запросов в секунду на один хост
+REQUEST_TIMEOUT = 20
+
+HEADERS = {
+    'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    'Accept-Language': 'ru-RU,ru;q=0.9',
+}
+
+
+# Ключи узла организации в JSON состояния: телефоны и ссылки (сайт, соцсети)
+CONTACT_KEYS = ('phones', 'links', 'socialLinks')
+
+
+def empty_contacts():
+    return {'phone': None, 'telegram': None, 'vk': None}
+
+
+def classify_social(href, label=''):
+    """Определяет, к какой соцсети относится ссылка: 'telegram', 'vk' или None"""
+    text = f"{label} {href}".lower()
+    if 'telegram' in text or 't.me/' in text:
+        return 'telegram'
+    if 'vkontakte' in text or 'vk.com' in text or re.search(r'\bvk\b', text):
+        return 'vk'
+    return None
+
+
+def _find_org_node(node, org_id=None):
+    """
+    Ищет во встроенном JSON состояния узел самой организации: словарь с её id и контактами.
+    Контакты похожих организаций, рекламы и подвала страницы лежат в других узлах и не берутся.
+    Без org_id берётся первый узел с контактами.
+    """
+    if isinstance(node, dict):
+        if any(key in node for key in CONTACT_KEYS) and (org_id is None or str(node.get('id')) == org_id):
+            return node
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+
+    for child in children:
+        found = _find_org_node(child, org_id)
+        if found is not None:
+            return found
+    return None
+
+
+def _contacts_from_org_node(node, contacts):
+    """Заполняет contacts телефоном и соцсетями из узла организации"""
+    phones = node.get('phones')
+    if not contacts['phone'] and isinstance(phones, list) and phones:
+        first = phones[0]
+        if isinstance(first, dict):
+            contacts['phone'] = first.get('formatted') or first.get('number') or first.get('value')
+        elif isinstance(first, str):
+            contacts['phone'] = first
+
+    for key in CONTACT_KEYS[1:]:
+        for entry in node.get(key) or []:
+            if isinstance(entry, dict):
+                href = entry.get('href') or entry.get('url') or ''
+                label = ' '.join(str(entry.get(field, '')) for field in ('type', 'aref', 'name', 'title'))
+            else:
+                href, label = str(entry), ''
+            kind = classify_social(href, label)
+            if kind and href and not contacts[kind]:
+                contacts[kind] = href
+
+
+def parse_contacts_from_html(html, org_id=None):
+    """
+    Достаёт телефон, Telegram и VK из HTML карточки организации без браузера:
+    сначала по тем же селекторам, что и parse_contacts_for_link, затем из узла
+    организации org_id в JSON состояния.
+    """
+    contacts = empty_contacts()
+    soup = BeautifulSoup(html, 'html.parser')
+
+    phone = soup.select_one('.orgpage-phones-view__phone-number')
+    if phone:
+        contacts['phone'] = phone.get_text(strip=True)
+
+    for btn in soup.select('.business-contacts-view__social-button a.button._link'):
+        kind = classify_social(btn.get('href', ''), btn.get('aria-label', ''))
+        if kind and not contacts[kind]:
+            contacts[kind] = btn.get('href')
+
+    if not all(contacts.values()):
+        for script in soup.select('script.state-view, script[type="application/json"]'):
+            try:
+                state = json.loads(script.string or '')
+            except ValueError:
+                continue
+            node = _find_org_node(state, org_id)
+            if node is not None:
+                _contacts_from_org_node(node, contacts)
+
+    return contacts
+
+
+class HostRateLimiter:
+    """Разносит запросы к одному хосту не чаще чем rate в секунду"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = {}
+        self.lock = asyncio.Lock()
+
+    async def wait(self, host):
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, 0))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def fetch_contacts_for_link(session, limiter, semaphore, link, base_url=None):
+    """Скачивает одну карточку и разбирает контакты. При ошибке возвращает пустые контакты"""
+    url = link
+    if base_url:
+        # Подмена хоста, например на локальный сервер с сохранёнными страницами
+        parts = urlsplit(link)
+        url = base_url.rstrip('/') + parts.path + (f"?{parts.query}" if parts.query else '')
+
+    async with semaphore:
+        await limiter.wait(urlsplit(url).netloc)
+        try:
+            async with session.get(url) as response:
+                if response.status != 200 or 'showcaptcha' in str(response.url):
+                    print(f"[HTTP] {url}: статус {response.status}, {response.url}")
+                    return empty_contacts()
+                html = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"[HTTP] Ошибка загрузки {url}: {e}")
+            return empty_contacts()
+
+    capture_snapshot('org', link, html, org_key(link))
+    return parse_contacts_from_html(html, extract_org_id(link))
+
+
+async def fetch_contacts(links, concurrency=CONCURRENCY, host_rate=HOST_RATE_PER_SECOND, base_url=None):
+    """
+    Параллельно скачивает карточки организаций через общий пул соединений.
+    :return: dict link -> {'phone', 'telegram', 'vk'}
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = HostRateLimiter(host_rate)
+
+    started = time.time()
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS) as session:
+        results = await asyncio.gather(*(
+            fetch_contacts_for_link(session, limiter, semaphore, link, base_url) for link in links
+        ))
+
+    found = sum(1 for contacts in results if any(contacts.values()))
+    print(f"[HTTP] Скачано {len(links)} карточек за {time.time() - started:.1f} с, с контактами: {found}")
+    return dict(zip(links, results))
+
+
+def fetch_contacts_sync(links, **kwargs):
+    """Синхронная обёртка над fetch_contacts"""
+    return asyncio.run(fetch_contacts(links, **kwargs))
@@ -0,0 +1,135 @@
+import os
+import csv
+from datetime import datetime
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+from search_capture import enable_performance_logging, get_performance_log
+from artifacts import CONSOLE_HOOK_JS
+import metrics
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+PAGE_STATS_CSV = 'page_stats.csv'  # Куда записываются трафик и время загрузки страниц по профилям
+
+# Профили ресурсов: что блокируется через DevTools (Network.setBlockedURLs)
+BLOCKED_URLS = {
+    'full': [],
+    'lean': [
+        # Картинки
+        '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*avatars.mds.yandex.net*',
+        # Тайлы карты
+        '*core-renderer-tiles.maps.yandex.net*', '*tiles.api-maps.yandex.ru*', '*core-jams-rdr*',
+        '*core-stv-renderer*', '*/tiles?*',
+        # Видео и шрифты
+        '*.mp4', '*.webm', '*.woff', '*.woff2', '*.ttf', '*.otf',
+        # Счётчики и реклама
+        '*mc.yandex.ru*', '*an.yandex.ru*', '*yandex.ru/ads*', '*adfstat.yandex.ru*',
+        '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*top-fwz1.mail.ru*',
+    ],
+}
+
+# Увеличиваем буфер Resource Timing, иначе после 250 запросов браузер перестаёт их учитывать
+RESOURCE_BUFFER_JS = "performance.setResourceTimingBufferSize(100000);"
+
+# Время загрузки из Navigation Timing. Байты отсюда — только запасной вариант: для чужих доменов
+# без Timing-Allow-Origin transferSize равен 0, поэтому трафик считается по performance-логу
+PAGE_STATS_JS = """
+    const nav = performance.getEntriesByType('navigation')[0];
+    const resources = performance.getEntriesByType('resource');
+    return {
+        load_ms: nav ? Math.round(nav.loadEventEnd - nav.startTime) : null,
+        bytes: (nav ? nav.transferSize : 0) + resources.reduce((sum, r) => sum + (r.transferSize || 0), 0),
+        requests: resources.length + 1
+    };
+"""
+
+
+def create_driver(headless=True, profile='full'):
+    """
+    Общая фабрика Chrome для всех скриптов. Performance-лог включён всегда:
+    из него считается трафик страниц и перехватываются ответы поиска.
+    :param profile: 'full' — страница грузится целиком, 'lean' — без картинок, тайлов, медиа, шрифтов и счётчиков
+    """
+    chrome_options = Options()
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_argument("--start-maximized")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument(f"user-agent={USER_AGENT}")
+    if profile == 'lean':
+        chrome_options.add_experimental_option(
+            'prefs', {'profile.managed_default_content_settings.images': 2}
+        )
+    enable_performance_logging(chrome_options)
+
+    with metrics.timer('driver_startup', profile=profile):
+        driver = webdriver.Chrome(options=chrome_options)
+    driver.resource_profile = profile
+    metrics.instrument_driver(driver)
+
+    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': RESOURCE_BUFFER_JS})
+    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': CONSOLE_HOOK_JS})
+    if BLOCKED_URLS[profile]:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS[profile]})
+
+    return driver
+
+
+def record_page_stats(driver, path=PAGE_STATS_CSV):
+    """
+    Записывает трафик (байты) и время загрузки текущей страницы вместе с профилем,
+    чтобы профили можно было сравнить (см. summarize_page_stats).
+    Байты и запросы — сумма encodedDataLength из Network.loadingFinished с прошлого замера
+    (со всех доменов); без performance-лога — transferSize из Resource Timing.
+    """
+    try:
+        stats = driver.execute_script(PAGE_STATS_JS)
+    except Exception as e:
+        print(f"[STATS] Не удалось получить статистику страницы: {e}")
+        return None
+
+    log = get_performance_log(driver)
+    if log.pull(driver):
+        stats['bytes'], stats['requests'] = log.take_traffic()
+
+    row = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'profile': getattr(driver, 'resource_profile', 'full'),
+        'url': driver.current_url,
+        'load_ms': stats.get('load_ms'),
+        'bytes': stats.get('bytes'),
+        'requests': stats.get('requests'),
+    }
+
+    write_header = not os.path.exists(path)
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(row))
+        if write_header:
+            writer.writeheader()
+        writer.writerow(row)
+    return row
+
+
+def summarize_page_stats(path=PAGE_STATS_CSV):
+    """Печатает средний трафик и время загрузки по каждому профилю"""
+    totals = {}
+    with open(path, encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            item = totals.setdefault(row['profile'], {'pages': 0, 'bytes': 0, 'load_ms': 0})
+            item['pages'] += 1
+            item['bytes'] += int(row['bytes'] or 0)
+            item['load_ms'] += int(float(row['load_ms'] or 0))
+
+    for profile, item in totals.items():
+        print(f"[STATS] {profile}: страниц {item['pages']}, "
+              f"в среднем {item['bytes'] / item['pages'] / 1024:.0f} КБ, "
+              f"{item['load_ms'] / item['pages']:.0f} мс")
+    return totals
+
+
+if __name__ == "__main__":
+    summarize_page_stats()
@@ -0,0 +1,86 @@
+import time
+
+import metrics
+
+MAX_USES = 50  # Через сколько выдач браузер пересоздаётся даже без падений
+
+
+def is_alive(driver):
+    """Дешёвая проверка живости: один вызов в браузер без перехода по страницам"""
+    try:
+        return driver.execute_script("return 1") == 1
+    except Exception:
+        return False
+
+
+class DriverPool:
+    """
+    Пул тёплых браузеров. Драйвер переиспользуется между запросами и пересоздаётся
+    только если проверка живости не прошла, драйвер помечен сломанным или
+    исчерпал max_uses выдач. Считает перезапуски и потерянное на них время.
+    """
+
+    def __init__(self, factory, max_uses=MAX_USES):
+        self.factory = factory
+        self.max_uses = max_uses
+        self.idle = []
+        self.uses = {}
+        self.restarts = {}
+        self.time_lost = 0.0
+
+    def _create(self):
+        driver = self.factory()
+        self.uses[id(driver)] = 0
+        return driver
+
+    def _quit(self, driver):
+        self.uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def recycle(self, driver, reason):
+        """Закрывает драйвер и поднимает новый, учитывая перезапуск"""
+        started = time.time()
+        self._quit(driver)
+        new_driver = self._create()
+        elapsed = time.time() - started
+
+        self.restarts[reason] = self.restarts.get(reason, 0) + 1
+        self.time_lost += elapsed
+        metrics.inc('driver_restarts_total', reason=reason)
+        metrics.observe('driver_restart_seconds', elapsed, reason=reason)
+        print(f"[POOL] Браузер пересоздан ({reason}) за {elapsed:.1f} с")
+        return new_driver
+
+    def acquire(self):
+        """Выдаёт тёплый драйвер; при необходимости пересоздаёт его"""
+        if not self.idle:
+            driver = self._create()
+        else:
+            driver = self.idle.pop()
+            if not is_alive(driver):
+                driver = self.recycle(driver, 'crash')
+            elif self.uses.get(id(driver), 0) >= self.max_uses:
+                driver = self.recycle(driver, 'max_uses')
+
+        self.uses[id(driver)] = self.uses.get(id(driver), 0) + 1
+        return driver
+
+    def release(self, driver, broken=False):
+        """Возвращает драйвер в пул. Сломанный драйвер сразу пересоздаётся"""
+        if broken:
+            driver = self.recycle(driver, 'crash')
+        self.idle.append(driver)
+
+    def close(self):
+        """Закрывает все свободные драйверы и печатает статистику"""
+        while self.idle:
+            self._quit(self.idle.pop())
+        self.report()
+
+    def report(self):
+        total = sum(self.restarts.values())
+        details = ', '.join(f"{reason}: {count}" for reason, count in self.restarts.items()) or 'нет'
+        print(f"[POOL] Перезапусков браузера: {total} ({details}), потеряно {self.time_lost:.1f} с")
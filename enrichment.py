@@ -0,0 +1,160 @@
+import os
+import time
+from collections import namedtuple
+
+import pandas as pd
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from checkpoint_store import CheckpointStore, org_key, write_csv_atomic
+from driver_factory import create_driver, record_page_stats
+from driver_pool import DriverPool, is_alive
+from rate_limiter import get_limiter
+from phone_scraper import extract_contacts
+from review_parser import extract_reviews, reviews_url
+import metrics
+from snapshot_store import SNAPSHOTS_ENABLED, capture as capture_snapshot
+
+# --- НАСТРОЙКИ ---
+CSV_FILE = 'output_raw.csv'
+HEADLESS = True
+BROWSER_PROFILE = 'lean'
+DRIVER_MAX_USES = 100  # Через сколько организаций браузер пересоздаётся даже без падений
+
+# Шаг обогащения: name — этап в CheckpointStore, page — какая страница организации нужна,
+# extract(driver) -> dict со значениями columns. Новый шаг — просто новый элемент STEPS.
+EnrichmentStep = namedtuple('EnrichmentStep', ['name', 'page', 'extract', 'columns'])
+
+# Страницы организации в порядке посещения
+PAGES = {
+    'card': lambda link: link.rstrip('/') + '/',
+    'reviews': reviews_url,
+}
+
+STEPS = [
+    EnrichmentStep('contacts', 'card', extract_contacts, ['phone', 'telegram', 'vk']),
+    EnrichmentStep('reviews', 'reviews', extract_reviews, ['negative', 'positive']),
+]
+
+
+def open_page(driver, url, timeout=10):
+    """Открывает страницу организации и ждёт загрузки"""
+    print(f"[INFO] Открываем ссылку: {url}")
+    driver.get(url)
+    WebDriverWait(driver, timeout).until(
+        EC.presence_of_element_located((By.TAG_NAME, 'body'))
+    )
+    record_page_stats(driver)
+    # Карточку сохраняем целиком; отзывы сохраняет iter_reviews по мере прокрутки
+    if SNAPSHOTS_ENABLED and '/reviews' not in url:
+        capture_snapshot('org', url, driver.page_source, org_key(url))
+
+
+def enrich_link(driver, link, steps=STEPS):
+    """
+    Выполняет шаги для одной организации за один визит: каждая нужная страница
+    открывается один раз, на ней выполняются все относящиеся к ней шаги.
+    :return: dict name шага -> результат
+    """
+    results = {}
+    for page, build_url in PAGES.items():
+        page_steps = [step for step in steps if step.page == page]
+        if not page_steps:
+            continue
+
+        try:
+            with metrics.timer('enrich_page', page=page):
+                open_page(driver, build_url(link))
+        except Exception as e:
+            print(f"[ERROR] Не удалось открыть {page} для {link}: {e}")
+            continue
+
+        for step in page_steps:
+            try:
+                with metrics.timer('enrich_step', step=step.name):
+                    results[step.name] = step.extract(driver)
+            except Exception as e:
+                print(f"[ERROR] Шаг '{step.name}' упал на {link}: {e}")
+
+    return results
+
+
+def enrich_csv(steps=STEPS, csv_file=CSV_FILE):
+    """Обогащает все организации из CSV одним проходом и выгружает объединённый результат"""
+    metrics.set_job('enrichment')
+    if not os.path.exists(csv_file):
+        print(f"[ERROR] Файл {csv_file} не найден.")
+        return
+
+    df = pd.read_csv(csv_file)
+    if 'link' not in df.columns:
+        print("[ERROR] В CSV отсутствует столбец 'link'.")
+        return
+
+    # Сохраняем чистые ссылки
+    df['link'] = df['link'].str.replace('reviews/', '', regex=False)
+
+    store = CheckpointStore()
+    done = {step.name: store.done_links(step.name) for step in steps}
+
+    # Для каждой организации — только шаги, которые ещё не выполнены
+    tasks = []
+    seen = set()
+    for link in df['link'].dropna():
+        key = org_key(link)
+        pending = [step for step in steps if key not in done[step.name]]
+        if pending and key not in seen:
+            seen.add(key)
+            tasks.append((link, pending))
+
+    print(f"[INFO] Организаций к обогащению: {len(tasks)} из {len(df)}, шаги: {[s.name for s in steps]}")
+
+    pool = DriverPool(
+        lambda: create_driver(headless=HEADLESS, profile=BROWSER_PROFILE), max_uses=DRIVER_MAX_USES
+    )
+    limiter = get_limiter()
+    started = time.time()
+
+    try:
+        for i, (link, pending) in enumerate(tasks, start=1):
+            print(f"\n[PROCESS] [{i}/{len(tasks)}] {link}")
+            limiter.acquire('org_page')  # Анти-бан
+            visit_started = time.time()
+            driver = pool.acquire()
+            try:
+                results = enrich_link(driver, link, pending)
+            except Exception:
+                pool.release(driver, broken=True)
+                raise
+            # Ошибки страниц enrich_link ловит сам: после неудачных шагов проверяем, жив ли браузер
+            pool.release(driver, broken=len(results) < len(pending) and not is_alive(driver))
+
+            if len(results) < len(pending):
+                limiter.report_failure('org_page')
+            else:
+                limiter.report_success('org_page', time.time() - visit_started)
+
+            if results:
+                store.upsert_many(link, results)
+                metrics.inc('orgs_parsed_total', script='enrichment')
+            # Неудавшиеся шаги не считаются выполненными и повторяются в следующем запуске
+            for step in pending:
+                if step.name not in results:
+                    store.mark_failed(step.name, link)
+
+            elapsed = time.time() - started
+            print(f"[PROGRESS] {i}/{len(tasks)}, {i / elapsed * 60:.1f} орг/мин")
+    finally:
+        pool.close()
+        limiter.report()
+        for step in steps:
+            df = store.merge_into(df, step.name, step.columns)
+        write_csv_atomic(df, csv_file)
+        store.close()
+        metrics.write_prometheus()
+        print(f"[SAVED] Результаты выгружены в {csv_file}")
+
+
+if __name__ == "__main__":
+    enrich_csv()
@@ -0,0 +1,695 @@
+"""
+Очередь заданий для распределённого сбора: поисковые запросы и обогащение организаций.
+
+Задание берётся в аренду (lease) на LEASE_SECONDS; пока обработчик работает, фоновый
+поток продлевает аренду (heartbeat). Если воркер умер, аренда истекает и задание
+достаётся другому воркеру. Упавшее задание повторяется с паузой до MAX_ATTEMPTS раз,
+затем уходит в dead-letter. Результат фиксируется по ключу задания один раз, поэтому
+повторное выполнение (после потерянной аренды) не создаёт дублей.
+
+Бэкенды: 'sqlite' — один хост, файл JOB_QUEUE_DB; 'redis' — несколько хостов
+(клиент redis или совместимая замена, например fakeredis, передаётся в RedisQueue).
+
+    python3 job_queue.py enqueue-query "кафе Москва" moscow_cafe
+    python3 job_queue.py enqueue-links output_raw.csv --kinds reviews contacts
+    python3 job_queue.py work --kinds reviews contacts
+    python3 job_queue.py stats
+    python3 job_queue.py requeue-dead
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from checkpoint_store import CheckpointStore, org_key
+from driver_factory import create_driver
+from driver_pool import DriverPool, is_alive
+from rate_limiter import get_limiter
+from review_parser import parse_reviews_for_link
+from phone_scraper import parse_contacts_for_link
+import metrics
+
+# --- НАСТРОЙКИ ---
+QUEUE_BACKEND = os.environ.get('QUEUE_BACKEND', 'sqlite')  # 'sqlite' или 'redis'
+JOB_QUEUE_DB = 'jobs.sqlite'
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+LEASE_SECONDS = 300  # На сколько задание закрепляется за воркером без продления
+HEARTBEAT_INTERVAL = 60  # Как часто воркер продлевает аренду
+MAX_ATTEMPTS = 3  # После стольких неудач задание уходит в dead-letter
+RETRY_DELAY = 30  # Пауза перед повтором (удваивается с каждой попыткой)
+IDLE_POLL = 5  # Пауза воркера, когда готовых заданий нет
+HEADLESS = True
+BROWSER_PROFILE = 'lean'
+DRIVER_MAX_USES = 100  # Через сколько организаций браузер пересоздаётся даже без падений
+
+# lease — токен аренды: продлить, завершить или провалить задание может только его владелец
+Job = namedtuple('Job', ['id', 'kind', 'key', 'payload', 'attempts', 'lease'])
+
+_queue = None
+_driver_pool = None
+_checkpoints = None
+
+
+def job_key(kind, payload):
+    """Ключ задания: одно и то же задание не ставится в очередь дважды, результат фиксируется один раз"""
+    return f"{kind}:{json.dumps(payload, ensure_ascii=False, sort_keys=True)}"
+
+
+def retry_delay(attempts):
+    return RETRY_DELAY * 2 ** max(0, attempts - 1)
+
+
+class SqliteQueue:
+    """
+    Очередь в SQLite (WAL). Аренда выдаётся внутри BEGIN IMMEDIATE, поэтому несколько
+    процессов одного хоста не получат одно задание. Соединение общее для потока
+    воркера и потока heartbeat, доступ к нему — под блокировкой.
+    """
+
+    def __init__(self, path=JOB_QUEUE_DB):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease TEXT,
+                lease_expires REAL,
+                last_error TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, kind, available_at)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL,
+                committed_at TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def enqueue(self, kind, payload, max_attempts=MAX_ATTEMPTS):
+        """Ставит задание в очередь. :return: False, если такое задание уже есть"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (kind, key, payload, status, max_attempts, available_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (kind, job_key(kind, payload), json.dumps(payload, ensure_ascii=False), max_attempts,
+                 time.time(), datetime.now().isoformat())
+            )
+        return cursor.rowcount == 1
+
+    def lease(self, kinds=None, lease_seconds=LEASE_SECONDS):
+        """
+        Выдаёт готовое задание (или задание с истёкшей арендой) и закрепляет его за вызывающим.
+        :return: Job или None, если готовых заданий нет
+        """
+        now = time.time()
+        kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})" if kinds else ''
+        with self._transaction() as conn:
+            # Истёкшие аренды без оставшихся попыток — в dead-letter, а не на новый круг
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', lease = NULL, last_error = 'lease expired', updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (datetime.now().isoformat(), now)
+            )
+            row = conn.execute(
+                "SELECT id, kind, key, payload, attempts FROM jobs "
+                "WHERE ((status = 'queued' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?))"
+                + kind_filter + " ORDER BY available_at, id LIMIT 1",
+                [now, now] + list(kinds or [])
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kind, key, payload, attempts = row
+            lease = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease = ?, lease_expires = ?, "
+                "updated_at = ? WHERE id = ?",
+                (lease, now + lease_seconds, datetime.now().isoformat(), job_id)
+            )
+        return Job(job_id, kind, key, json.loads(payload), attempts + 1, lease)
+
+    def heartbeat(self, job, lease_seconds=LEASE_SECONDS):
+        """Продлевает аренду. :return: False, если аренда уже потеряна"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease = ? AND status = 'leased'",
+                (time.time() + lease_seconds, job.id, job.lease)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job, result=None):
+        """
+        Фиксирует результат и закрывает задание одной транзакцией. Результат записывается
+        один раз (первый выигрывает); если задание уже арендовал другой воркер, его аренда
+        не трогается — он закроет задание сам.
+        :return: True, если результат записан этим вызовом (повтор того же задания ничего не меняет)
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO results (key, kind, data, committed_at) VALUES (?, ?, ?, ?)",
+                (job.key, job.kind, json.dumps(result, ensure_ascii=False), datetime.now().isoformat())
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'done', lease = NULL, updated_at = ? "
+                "WHERE id = ? AND (status != 'leased' OR lease = ?)",
+                (datetime.now().isoformat(), job.id, job.lease)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job, error):
+        """
+        Возвращает задание в очередь с паузой или, если попытки кончились, в dead-letter.
+        :return: новый статус ('queued', 'dead') или None, если аренда уже потеряна
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease = ? AND status = 'leased'",
+                (job.id, job.lease)
+            ).fetchone()
+            if row is None:
+                return None
+            attempts, max_attempts = row
+            status = 'dead' if attempts >= max_attempts else 'queued'
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease = NULL, available_at = ?, last_error = ?, updated_at = ? "
+                "WHERE id = ?",
+                (status, time.time() + retry_delay(attempts), str(error)[:1000], datetime.now().isoformat(), job.id)
+            )
+        return status
+
+    def dead_letters(self):
+        """Задания в dead-letter: список (id, kind, payload, attempts, last_error)"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, kind, payload, attempts, last_error FROM jobs WHERE status = 'dead' ORDER BY id"
+            ).fetchall()
+        return [(job_id, kind, json.loads(payload), attempts, error) for job_id, kind, payload, attempts, error in rows]
+
+    def requeue_dead(self, kind=None):
+        """Возвращает задания из dead-letter в очередь с обнулённым счётчиком попыток"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? "
+                "WHERE status = 'dead'" + (" AND kind = ?" if kind else ''),
+                [time.time(), datetime.now().isoformat()] + ([kind] if kind else [])
+            )
+        return cursor.rowcount
+
+    def results(self, kind):
+        """Словарь ключ задания -> зафиксированный результат"""
+        with self.lock:
+            rows = self.conn.execute("SELECT key, data FROM results WHERE kind = ?", (kind,)).fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+    def stats(self):
+        """Количество заданий по (вид, статус)"""
+        with self.lock:
+            rows = self.conn.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status").fetchall()
+        return {(kind, status): count for kind, status, count in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+class RedisQueue:
+    """
+    Та же очередь поверх Redis для нескольких хостов. Готовые задания лежат в sorted set
+    по времени готовности (отдельно для каждого вида), арендованные — в sorted set по
+    сроку аренды, состояние задания — в hash. Каждое изменение выполняется одной
+    транзакцией WATCH/MULTI/EXEC: состояние читается под WATCH, записи уходят в MULTI,
+    и если наблюдаемый ключ успел измениться, транзакция повторяется. Поэтому задание
+    не теряется между множествами, а захватить его может только один воркер.
+    :param client: клиент redis.Redis (decode_responses=True) или совместимая замена
+    """
+
+    def __init__(self, client=None, url=REDIS_URL, prefix='jobs'):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    def _ready(self, kind):
+        return self._key('ready', kind)
+
+    def _job(self, job_id):
+        return self._key('job', str(job_id))
+
+    def _atomic(self, watch, step):
+        """
+        Выполняет step(pipe) как транзакцию: step читает состояние (ключи watch под WATCH),
+        вызывает pipe.multi() и ставит записи. Если step вернул результат, не вызвав multi,
+        записей нет. При конфликте (WatchError) step выполняется заново.
+        :return: (результат step, результаты команд MULTI)
+        """
+        from redis.exceptions import WatchError
+
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(*watch)
+                    result = step(pipe)
+                    if not pipe.explicit_transaction:
+                        pipe.unwatch()
+                        return result, []
+                    return result, pipe.execute()
+                except WatchError:
+                    pipe.reset()
+
+    def enqueue(self, kind, payload, max_attempts=MAX_ATTEMPTS):
+        key = job_key(kind, payload)
+
+        def step(pipe):
+            if pipe.hexists(self._key('keys'), key):
+                return False
+            job_id = str(pipe.incr(self._key('next_id')))  # Пропуск номера при сбое безвреден
+            pipe.multi()
+            pipe.hset(self._job(job_id), mapping={
+                'kind': kind, 'key': key, 'payload': json.dumps(payload, ensure_ascii=False),
+                'status': 'queued', 'attempts': 0, 'max_attempts': max_attempts,
+                'lease': '', 'last_error': '',
+            })
+            pipe.hset(self._key('keys'), key, job_id)
+            pipe.sadd(self._key('kinds'), kind)
+            pipe.zadd(self._ready(kind), {job_id: time.time()})
+            return True
+
+        return self._atomic([self._key('keys')], step)[0]
+
+    def _reclaim_expired(self, now):
+        """Возвращает в очередь (или в dead-letter) задания, аренда которых истекла"""
+        for job_id in self.client.zrangebyscore(self._key('leased'), '-inf', now):
+            def step(pipe, job_id=job_id):
+                expires = pipe.zscore(self._key('leased'), job_id)
+                if expires is None or expires >= now:
+                    return  # Аренду продлили или задание уже забрал другой воркер
+                job = pipe.hgetall(self._job(job_id))
+                pipe.multi()
+                pipe.zrem(self._key('leased'), job_id)
+                if int(job['attempts']) >= int(job['max_attempts']):
+                    pipe.hset(self._job(job_id), mapping={
+                        'status': 'dead', 'lease': '', 'last_error': 'lease expired'
+                    })
+                    pipe.zadd(self._key('dead'), {job_id: now})
+                else:
+                    pipe.hset(self._job(job_id), mapping={'status': 'queued', 'lease': ''})
+                    pipe.zadd(self._ready(job['kind']), {job_id: now})
+
+            # heartbeat меняет только срок в leased, поэтому под WATCH и он, а не только хэш задания
+            self._atomic([self._job(job_id), self._key('leased')], step)
+
+    def lease(self, kinds=None, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        self._reclaim_expired(now)
+        for kind in kinds or sorted(self.client.smembers(self._key('kinds'))):
+            def step(pipe, kind=kind):
+                ready = pipe.zrangebyscore(self._ready(kind), '-inf', now, start=0, num=1)
+                if not ready:
+                    return None
+                job_id = ready[0]
+                job = pipe.hgetall(self._job(job_id))
+                lease = uuid.uuid4().hex
+                attempts = int(job['attempts']) + 1
+                pipe.multi()
+                pipe.zrem(self._ready(kind), job_id)
+                pipe.zadd(self._key('leased'), {job_id: now + lease_seconds})
+                pipe.hset(self._job(job_id), mapping={'status': 'leased', 'lease': lease, 'attempts': attempts})
+                return Job(job_id, kind, job['key'], json.loads(job['payload']), attempts, lease)
+
+            job, _ = self._atomic([self._ready(kind)], step)
+            if job is not None:
+                return job
+        return None
+
+    def heartbeat(self, job, lease_seconds=LEASE_SECONDS):
+        def step(pipe):
+            if pipe.hget(self._job(job.id), 'lease') != job.lease:
+                return False
+            pipe.multi()
+            pipe.zadd(self._key('leased'), {job.id: time.time() + lease_seconds})
+            return True
+
+        return self._atomic([self._job(job.id)], step)[0]
+
+    def complete(self, job, result=None):
+        """
+        Фиксирует результат (первый записанный выигрывает) и закрывает задание. Если задание
+        уже арендовал другой воркер, его аренда не трогается — он закроет задание сам.
+        """
+        def step(pipe):
+            status, lease = pipe.hmget(self._job(job.id), 'status', 'lease')
+            pipe.multi()
+            pipe.hsetnx(self._key('results', job.kind), job.key, json.dumps(result, ensure_ascii=False))
+            if status == 'leased' and lease != job.lease:
+                return
+            pipe.zrem(self._key('leased'), job.id)
+            pipe.zrem(self._ready(job.kind), job.id)
+            pipe.hset(self._job(job.id), mapping={'status': 'done', 'lease': ''})
+
+        _, replies = self._atomic([self._job(job.id)], step)
+        return bool(replies[0])
+
+    def fail(self, job, error):
+        def step(pipe):
+            job_hash = pipe.hgetall(self._job(job.id))
+            if job_hash.get('lease') != job.lease or job_hash.get('status') != 'leased':
+                return None
+            attempts = int(job_hash['attempts'])
+            status = 'dead' if attempts >= int(job_hash['max_attempts']) else 'queued'
+            pipe.multi()
+            pipe.zrem(self._key('leased'), job.id)
+            pipe.hset(self._job(job.id), mapping={'status': status, 'lease': '', 'last_error': str(error)[:1000]})
+            if status == 'dead':
+                pipe.zadd(self._key('dead'), {job.id: time.time()})
+            else:
+                pipe.zadd(self._ready(job.kind), {job.id: time.time() + retry_delay(attempts)})
+            return status
+
+        return self._atomic([self._job(job.id)], step)[0]
+
+    def dead_letters(self):
+        letters = []
+        for job_id in self.client.zrange(self._key('dead'), 0, -1):
+            job = self.client.hgetall(self._job(job_id))
+            letters.append((job_id, job['kind'], json.loads(job['payload']), int(job['attempts']), job['last_error']))
+        return letters
+
+    def requeue_dead(self, kind=None):
+        requeued = 0
+        for job_id, job_kind, _, _, _ in self.dead_letters():
+            if kind and job_kind != kind:
+                continue
+
+            def step(pipe, job_id=job_id, job_kind=job_kind):
+                if pipe.hget(self._job(job_id), 'status') != 'dead':
+                    return False
+                pipe.multi()
+                pipe.zrem(self._key('dead'), job_id)
+                pipe.hset(self._job(job_id), mapping={'status': 'queued', 'attempts': 0})
+                pipe.zadd(self._ready(job_kind), {job_id: time.time()})
+                return True
+
+            requeued += self._atomic([self._job(job_id)], step)[0]
+        return requeued
+
+    def results(self, kind):
+        return {key: json.loads(data) for key, data in self.client.hgetall(self._key('results', kind)).items()}
+
+    def stats(self):
+        counts = {}
+        for kind in self.client.smembers(self._key('kinds')):
+            counts[(kind, 'queued')] = self.client.zcard(self._ready(kind))
+            counts[(kind, 'done')] = self.client.hlen(self._key('results', kind))
+        counts[('*', 'leased')] = self.client.zcard(self._key('leased'))
+        counts[('*', 'dead')] = self.client.zcard(self._key('dead'))
+        return counts
+
+    def close(self):
+        self.client.close()
+
+
+def get_queue(backend=QUEUE_BACKEND):
+    """Очередь процесса выбранного бэкенда"""
+    global _queue
+    if _queue is None:
+        _queue = RedisQueue() if backend == 'redis' else SqliteQueue()
+    return _queue
+
+
+# --- ОБРАБОТЧИКИ ЗАДАНИЙ ---
+
+def get_driver_pool():
+    """Пул браузеров воркера для заданий по карточкам организаций"""
+    global _driver_pool
+    if _driver_pool is None:
+        _driver_pool = DriverPool(
+            lambda: create_driver(headless=HEADLESS, profile=BROWSER_PROFILE), max_uses=DRIVER_MAX_USES
+        )
+    return _driver_pool
+
+
+def get_checkpoints():
+    global _checkpoints
+    if _checkpoints is None:
+        _checkpoints = CheckpointStore()
+    return _checkpoints
+
+
+def run_with_driver(parse, link):
+    """
+    Вызывает parse(driver, link) на драйвере из пула с паузой планировщика 'org_page'.
+    Ошибка (таймаут, бан, упавший браузер) пробрасывается: задание уходит на повтор через fail()
+    """
+    limiter = get_limiter()
+    limiter.acquire('org_page')
+    started = time.time()
+    pool = get_driver_pool()
+    driver = pool.acquire()
+    try:
+        result = parse(driver, link)
+    except Exception:
+        limiter.report_failure('org_page')
+        pool.release(driver, broken=not is_alive(driver))
+        raise
+    limiter.report_success('org_page', time.time() - started)
+    pool.release(driver)
+    return result
+
+
+def handle_scrape(payload):
+    """Поисковый запрос: {'query', 'category', 'map_url'?}. Организации пишутся выходами scraper.py"""
+    import scraper  # Драйвер и выходы scraper поднимаются только у воркеров, которые берут запросы
+
+    if scraper.driver is None:
+        scraper.setup_dirs()
+        scraper.init_driver()
+    limiter = get_limiter()
+    limiter.acquire('query')
+    started = time.time()
+    if not scraper.scrape(payload['query'], payload['category'], map_url=payload.get('map_url')):
+        limiter.report_failure('query')
+        raise RuntimeError(f"Поиск не удался: {payload['query']}")
+    limiter.report_success('query', time.time() - started)
+    scraper.flush_results()  # Пачки записаны до того, как задание будет закрыто
+    return {'category': payload['category']}
+
+
+def handle_reviews(payload):
+    """Отзывы организации: {'link'}. Результат — upsert в enrichment.sqlite (повтор перезаписывает)"""
+    data = run_with_driver(parse_reviews_for_link, payload['link'])
+    get_checkpoints().upsert('reviews', payload['link'], data)
+    return data
+
+
+def handle_contacts(payload):
+    """Контакты организации: {'link'}"""
+    data = run_with_driver(parse_contacts_for_link, payload['link'])
+    get_checkpoints().upsert('contacts', payload['link'], data)
+    return data
+
+
+HANDLERS = {
+    'scrape': handle_scrape,
+    'reviews': handle_reviews,
+    'contacts': handle_contacts,
+}
+
+
+def close_resources():
+    """Закрывает браузеры и хранилища воркера"""
+    global _driver_pool, _checkpoints
+    if _driver_pool is not None:
+        _driver_pool.close()
+        _driver_pool = None
+    if _checkpoints is not None:
+        _checkpoints.close()
+        _checkpoints = None
+    if 'scraper' in sys.modules:
+        sys.modules['scraper'].close_driver()
+
+
+# --- ПОСТАНОВКА И ВЫПОЛНЕНИЕ ---
+
+def enqueue_queries(job_queue, queries):
+    """Ставит поисковые запросы: список (запрос, метка) или (запрос, метка, ссылка)"""
+    added = 0
+    for query, category, *map_url in queries:
+        payload = {'query': query, 'category': category}
+        if map_url:
+            payload['map_url'] = map_url[0]
+        added += job_queue.enqueue('scrape', payload)
+    print(f"[QUEUE] Поставлено запросов: {added} из {len(queries)}")
+    return added
+
+
+def enqueue_links(job_queue, csv_file, kinds=('reviews', 'contacts')):
+    """Ставит задания обогащения для организаций из CSV, пропуская уже обработанные"""
+    df = pd.read_csv(csv_file)
+    links = df['link'].dropna().str.replace('reviews/', '', regex=False).drop_duplicates()
+    store = CheckpointStore()
+    added = 0
+    for kind in kinds:
+        done = store.done_links(kind)
+        for link in links:
+            if org_key(link) not in done:
+                added += job_queue.enqueue(kind, {'link': org_key(link)})
+    store.close()
+    print(f"[QUEUE] Поставлено заданий: {added} ({', '.join(kinds)}, организаций {len(links)})")
+    return added
+
+
+class Heartbeat(threading.Thread):
+    """Фоновое продление аренды, пока обработчик работает"""
+
+    def __init__(self, job_queue, job, interval=HEARTBEAT_INTERVAL):
+        super().__init__(daemon=True)
+        self.job_queue = job_queue
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                if not self.job_queue.heartbeat(self.job):
+                    self.lost = True
+                    print(f"[QUEUE] Аренда задания {self.job.id} потеряна")
+                    return
+            except Exception as e:
+                print(f"[QUEUE] Не удалось продлить аренду задания {self.job.id}: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(job_queue=None, kinds=None, exit_when_idle=True, max_jobs=None):
+    """
+    Берёт задания из очереди и выполняет обработчики из HANDLERS, пока задания не кончатся
+    (exit_when_idle=False — ждать новых).
+    :return: {'done': n, 'failed': n}
+    """
+    job_queue = job_queue or get_queue()
+    metrics.set_job(f"job_worker_{os.getpid()}")
+    counts = {'done': 0, 'failed': 0}
+
+    try:
+        while max_jobs is None or counts['done'] + counts['failed'] < max_jobs:
+            job = job_queue.lease(kinds)
+            if job is None:
+                if exit_when_idle:
+                    break
+                time.sleep(IDLE_POLL)
+                continue
+
+            print(f"\n[JOB] {job.kind} #{job.id} (попытка {job.attempts}): {job.payload}")
+            heartbeat = Heartbeat(job_queue, job)
+            heartbeat.start()
+            try:
+                with metrics.timer('job', kind=job.kind):
+                    result = HANDLERS[job.kind](job.payload)
+            except Exception as e:
+                heartbeat.stop()
+                status = job_queue.fail(job, e)
+                counts['failed'] += 1
+                metrics.inc('jobs_total', kind=job.kind, status=status or 'lease_lost')
+                print(f"[ERROR] Задание {job.id} упало ({status}): {e}")
+                continue
+            heartbeat.stop()
+
+            committed = job_queue.complete(job, result)
+            counts['done'] += 1
+            metrics.inc('jobs_total', kind=job.kind, status='done' if committed else 'duplicate')
+    finally:
+        close_resources()
+        metrics.write_prometheus()
+
+    print(f"[QUEUE] Воркер завершён: выполнено {counts['done']}, неудачно {counts['failed']}")
+    return counts
+
+
+def print_stats(job_queue):
+    for (kind, status), count in sorted(job_queue.stats().items()):
+        print(f"[QUEUE] {kind} {status}: {count}")
+    for job_id, kind, payload, attempts, error in job_queue.dead_letters():
+        print(f"[DEAD] #{job_id} {kind} {payload}, попыток {attempts}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Очередь заданий сбора и обогащения")
+    parser.add_argument('--backend', choices=['sqlite', 'redis'], default=QUEUE_BACKEND)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query_cmd = commands.add_parser('enqueue-query', help="Поставить поисковый запрос")
+    query_cmd.add_argument('query')
+    query_cmd.add_argument('category')
+    query_cmd.add_argument('--map-url', help="Ссылка на участок карты или выдачу")
+
+    links_cmd = commands.add_parser('enqueue-links', help="Поставить обогащение организаций из CSV")
+    links_cmd.add_argument('csv_file', nargs='?', default='output_raw.csv')
+    links_cmd.add_argument('--kinds', nargs='+', default=['reviews', 'contacts'], choices=['reviews', 'contacts'])
+
+    work_cmd = commands.add_parser('work', help="Выполнять задания")
+    work_cmd.add_argument('--kinds', nargs='+', choices=list(HANDLERS))
+    work_cmd.add_argument('--wait', action='store_true', help="Не завершаться, когда задания кончились")
+
+    commands.add_parser('stats', help="Задания по статусам и dead-letter")
+    requeue_cmd = commands.add_parser('requeue-dead', help="Вернуть задания из dead-letter")
+    requeue_cmd.add_argument('--kind', choices=list(HANDLERS))
+
+    args = parser.parse_args()
+    job_queue = get_queue(args.backend)
+
+    if args.command == 'enqueue-query':
+        enqueue_queries(job_queue, [(args.query, args.category) + ((args.map_url,) if args.map_url else ())])
+    elif args.command == 'enqueue-links':
+        enqueue_links(job_queue, args.csv_file, args.kinds)
+    elif args.command == 'work':
+        if metrics.METRICS_PORT:
+            metrics.start_http_server(metrics.METRICS_PORT)
+        run_worker(job_queue, args.kinds, exit_when_idle=not args.wait)
+    elif args.command == 'stats':
+        print_stats(job_queue)
+    elif args.command == 'requeue-dead':
+        print(f"[QUEUE] Возвращено в очередь: {job_queue.requeue_dead(args.kind)}")
+
+    job_queue.close()
+
+
+if __name__ == "__main__":
+    main()
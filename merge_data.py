@@ -0,0 +1,377 @@
+"""
+Объединение выгрузок парсера в один датасет без Spark.
+
+Новые строки читаются по частям, приводятся к общим колонкам (как в scraper.ipynb)
+и дедуплицируются по id организации. Ключи уже объединённых организаций и
+позиции (в байтах) прочитанных частей входных файлов хранятся в merge_state.sqlite,
+поэтому повторный запуск дочитывает только новые записи и не перечитывает итоговый файл.
+Позиция всегда стоит на границе записи CSV, так что поля в кавычках с переносами строк
+не сбивают дочитывание.
+
+    python3 merge_data.py output_raw.csv output_raw_new.csv
+    python3 merge_data.py output_parquet                     # датасет из parquet_sink
+    python3 merge_data.py --compare-spark output_raw.csv output_raw_new.csv
+"""
+import io
+import os
+import sys
+import glob
+import time
+import sqlite3
+import argparse
+import importlib.util
+import tempfile
+import subprocess
+from datetime import datetime
+from urllib.parse import unquote
+
+import pandas as pd
+
+from org_index import org_index_key
+
+# --- НАСТРОЙКИ ---
+MERGED_CSV = 'merged_cafe_data.csv'
+MERGED_SEP = ';'  # Разделитель итогового файла (как в scraper.ipynb)
+MERGE_STATE_DB = 'merge_state.sqlite'
+CHUNK_ROWS = 50000  # Сколько строк читать и обрабатывать за раз
+
+# Общие колонки выгрузок (см. scraper.ipynb)
+COMMON_COLUMNS = ('name', 'address', 'rating', 'avg_price', 'reviews_count',
+                  'link', 'lat', 'lon', 'category', 'insert_date')
+FLOAT_COLUMNS = ('rating', 'lat', 'lon')
+INT_COLUMNS = ('avg_price', 'reviews_count')
+
+# Тот же путь через Spark, что в scraper.ipynb, — для сравнения (--compare-spark)
+SPARK_MERGE_SCRIPT = """
+import sys
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+
+*inputs, output_path = sys.argv[1:]
+common_columns = %r
+
+spark = SparkSession.builder.appName("MergeCompare").getOrCreate()
+frames = [spark.read.csv(path, header=True, inferSchema=True).select(*common_columns) for path in inputs]
+result = frames[0]
+for frame in frames[1:]:
+    result = result.unionByName(frame)
+result = result.withColumn('rating', F.regexp_replace('rating', ',', '.')).distinct()
+result.toPandas().drop_duplicates(subset=['name', 'address']).to_csv(output_path, index=False, sep=';')
+spark.stop()
+""" % (COMMON_COLUMNS,)
+
+
+def normalize_chunk(df):
+    """
+    Приводит часть выгрузки к общим колонкам: недостающие добавляются пустыми,
+    повторные строки заголовка (дописывание CSV с header) отбрасываются,
+    рейтинг "4,5" -> 4.5, числовые колонки — числа.
+    """
+    df = df.reindex(columns=list(COMMON_COLUMNS))
+    df = df[df['name'].notna() & (df['name'].astype(str) != 'name')].copy()
+
+    for col in ('name', 'address'):
+        df[col] = df[col].astype(str).str.strip()
+    for col in FLOAT_COLUMNS:
+        values = df[col].astype(object).where(df[col].notna(), None).astype(str)
+        df[col] = pd.to_numeric(values.str.replace(',', '.', regex=False), errors='coerce')
+    for col in INT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int64')
+    return df
+
+
+class MergeState:
+    """Ключи уже объединённых организаций и прочитанные части входов (SQLite)"""
+
+    def __init__(self, path=MERGE_STATE_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS merged_keys (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                merged_at TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # Позиция — байт после последней прочитанной записи (а не номер строки файла:
+        # запись с переносом внутри кавычек занимает несколько строк)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS source_positions (
+                path TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def known_keys(self, keys, chunk_size=500):
+        """Какие из ключей уже есть в объединённом датасете"""
+        keys = list(keys)
+        found = set()
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(f"SELECT key FROM merged_keys WHERE key IN ({placeholders})", chunk)
+            found.update(key for (key,) in rows)
+        return found
+
+    def source_position(self, path, size):
+        """До какого байта источник уже прочитан; если файл уменьшился (перезаписан) — 0"""
+        row = self.conn.execute("SELECT position, size FROM source_positions WHERE path = ?", (path,)).fetchone()
+        if row is None or size < row[1]:
+            return 0
+        return row[0]
+
+    def commit_chunk(self, keys, source, position, size):
+        """Одной транзакцией запоминает новые ключи и позицию в источнике"""
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO merged_keys (key, source, merged_at) VALUES (?, ?, ?)",
+                [(key, source, now) for key in keys]
+            )
+            self.conn.execute(
+                """
+                INSERT INTO source_positions (path, position, size) VALUES (?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET position = excluded.position, size = excluded.size
+                """,
+                (source, position, size)
+            )
+
+    def remember_keys(self, keys, source):
+        """Запоминает ключи без позиции в источнике (строки уже лежат в итоговом файле)"""
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO merged_keys (key, source, merged_at) VALUES (?, ?, ?)",
+                [(key, source, now) for key in keys]
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def chunk_keys(chunk):
+    """Ключи организаций части (id из ссылки либо название+адрес)"""
+    return [org_index_key(record) for record in chunk[['link', 'name', 'address']].to_dict('records')]
+
+
+def adopt_output(output, state, chunk_rows=CHUNK_ROWS):
+    """
+    Итоговый файл есть, а состояния нет (например, файл остался от Spark-пути в scraper.ipynb):
+    файл переписывается в общие колонки без дублей, а его ключи заносятся в состояние,
+    чтобы дописывание не повторяло уже объединённые организации и не ломало колонки CSV.
+    :return: сколько организаций в файле
+    """
+    with open(output, encoding='utf-8-sig') as f:
+        header = f.readline()
+    sep = MERGED_SEP if MERGED_SEP in header else ','
+
+    tmp_path = f"{output}.tmp"
+    kept = 0
+    first = True
+    for chunk in pd.read_csv(output, sep=sep, dtype=str, chunksize=chunk_rows):
+        chunk = normalize_chunk(chunk)
+        chunk['key'] = chunk_keys(chunk)
+        chunk = chunk.drop_duplicates(subset='key')
+        chunk = chunk[~chunk['key'].isin(state.known_keys(chunk['key']))]
+        chunk.drop(columns='key').to_csv(tmp_path, mode='w' if first else 'a', index=False,
+                                         sep=MERGED_SEP, header=first)
+        state.remember_keys(chunk['key'], output)
+        kept += len(chunk)
+        first = False
+
+    if first:
+        pd.DataFrame(columns=list(COMMON_COLUMNS)).to_csv(tmp_path, index=False, sep=MERGED_SEP)
+    os.replace(tmp_path, output)
+    print(f"[MERGE] {output} без состояния: организаций в файле {kept}, ключи восстановлены")
+    return kept
+
+
+def iter_csv_records(path, position=0, chunk_rows=CHUNK_ROWS):
+    """
+    Читает CSV с байтовой позиции position частями по chunk_rows записей.
+    Запись заканчивается переводом строки вне кавычек (чётное число '"' с начала записи).
+    Недописанная последняя запись (файл дописывается прямо сейчас) не отдаётся.
+    :return: генератор (позиция после части, текст части с заголовком)
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        header_text = header.decode('utf-8-sig')
+        if position < f.tell():
+            position = f.tell()
+        f.seek(position)
+
+        records = []
+        record = []
+        quotes = 0
+        for line in f:
+            record.append(line)
+            quotes += line.count(b'"')
+            if quotes % 2 or not line.endswith(b'\n'):
+                continue
+            records.append(b''.join(record))
+            position += sum(len(part) for part in record)
+            record = []
+            quotes = 0
+            if len(records) >= chunk_rows:
+                yield position, header_text + b''.join(records).decode('utf-8')
+                records = []
+        if records:
+            yield position, header_text + b''.join(records).decode('utf-8')
+
+
+def iter_source_chunks(path, state, chunk_rows=CHUNK_ROWS):
+    """
+    Отдаёт (источник, позиция после части, размер, DataFrame) только для непрочитанных записей.
+    CSV дочитывается с сохранённой байтовой позиции, каталог Parquet — по ещё не прочитанным файлам.
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True))
+        for file in files:
+            size = os.path.getsize(file)
+            if state.source_position(file, size):
+                continue  # Файлы Parquet неизменяемы: прочитан — значит целиком
+            df = pd.read_parquet(file)
+            # Колонки партиций хранятся в пути: category=<...>/insert_date=<...>
+            for part in os.path.relpath(file, path).split(os.sep)[:-1]:
+                if '=' in part:
+                    col, value = part.split('=', 1)
+                    df[col] = unquote(value)
+            yield file, size, size, df
+        return
+
+    size = os.path.getsize(path)
+    for position, text in iter_csv_records(path, state.source_position(path, size), chunk_rows):
+        df = pd.read_csv(io.StringIO(text), dtype=str, usecols=lambda col: col in COMMON_COLUMNS)
+        yield path, position, size, df
+
+
+def merge_files(inputs, output=MERGED_CSV, state_path=MERGE_STATE_DB, rebuild=False):
+    """
+    Дописывает в output новые уникальные организации из inputs.
+    :param rebuild: начать с нуля (удалить output и состояние)
+    :return: {'read': строк прочитано, 'added': добавлено, 'seconds': время}
+    """
+    started = time.time()
+    # Без итогового файла состояние бессмысленно: ключи указывали бы на несуществующие строки
+    if rebuild or not os.path.exists(output):
+        for path in (output, state_path, f"{state_path}-wal", f"{state_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    adopt = not os.path.exists(state_path) and os.path.exists(output)
+    state = MergeState(state_path)
+    read = 0
+    added = 0
+    try:
+        if adopt:
+            adopt_output(output, state)
+        for path in inputs:
+            for source, position, size, chunk in iter_source_chunks(path, state):
+                chunk = normalize_chunk(chunk)
+                read += len(chunk)
+
+                chunk['key'] = chunk_keys(chunk)
+                chunk = chunk.drop_duplicates(subset='key')
+                known = state.known_keys(chunk['key'])
+                new_rows = chunk[~chunk['key'].isin(known)]
+
+                if not new_rows.empty:
+                    new_rows.drop(columns='key').to_csv(
+                        output, mode='a', index=False, sep=MERGED_SEP,
+                        header=not os.path.exists(output)
+                    )
+                state.commit_chunk(new_rows['key'], source, position, size)
+                added += len(new_rows)
+                print(f"[MERGE] {source}: прочитано {len(chunk)}, новых {len(new_rows)}")
+    finally:
+        state.close()
+
+    elapsed = time.time() - started
+    print(f"[MERGE] Всего прочитано {read}, добавлено {added} в {output} за {elapsed:.1f} с")
+    return {'read': read, 'added': added, 'seconds': elapsed}
+
+
+def _tree_rss_kb(root_pid):
+    """Суммарный RSS процесса и всех его потомков (по /proc, только Linux)"""
+    parents = {}
+    rss = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            with open(f'/proc/{entry}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss[int(entry)] = int(line.split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    tree = {root_pid}
+    changed = True
+    while changed:
+        children = {pid for pid, parent in parents.items() if parent in tree} - tree
+        changed = bool(children)
+        tree |= children
+    return sum(rss.get(pid, 0) for pid in tree)
+
+
+def measure(command, interval=0.1):
+    """Запускает команду и возвращает (время в секундах, пиковая память дерева процессов в МБ)"""
+    started = time.time()
+    process = subprocess.Popen(command)
+    peak = 0
+    while process.poll() is None:
+        peak = max(peak, _tree_rss_kb(process.pid))
+        time.sleep(interval)
+    if process.returncode:
+        raise RuntimeError(f"Команда завершилась с кодом {process.returncode}: {command[:3]}")
+    return time.time() - started, peak / 1024
+
+
+def compare_with_spark(inputs):
+    """
+    Сравнивает время и пиковую память merge_data.py и пути через Spark из scraper.ipynb.
+    Без pyspark замеряется только merge_data.py.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            'merge_data': measure([
+                sys.executable, os.path.abspath(__file__), *inputs,
+                '--output', os.path.join(tmp, 'merged.csv'), '--state', os.path.join(tmp, 'state.sqlite')
+            ]),
+        }
+        if importlib.util.find_spec('pyspark') is None:
+            print("[MERGE] pyspark не установлен, путь через Spark не замерялся")
+        else:
+            results['spark'] = measure([
+                sys.executable, '-c', SPARK_MERGE_SCRIPT, *inputs, os.path.join(tmp, 'spark.csv')
+            ])
+
+    print("\n=== Сравнение с Spark ===")
+    for name, (seconds, peak_mb) in results.items():
+        print(f"{name:12} {seconds:7.1f} с  пик памяти {peak_mb:8.0f} МБ")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Инкрементальное объединение выгрузок без Spark")
+    parser.add_argument('inputs', nargs='+', help="CSV-файлы и/или каталоги Parquet")
+    parser.add_argument('--output', default=MERGED_CSV)
+    parser.add_argument('--state', default=MERGE_STATE_DB)
+    parser.add_argument('--rebuild', action='store_true', help="Собрать итоговый файл заново")
+    parser.add_argument('--compare-spark', action='store_true',
+                        help="Замерить время и пиковую память против Spark (только CSV, только Linux)")
+    args = parser.parse_args()
+
+    if args.compare_spark:
+        compare_with_spark(args.inputs)
+    else:
+        merge_files(args.inputs, args.output, args.state, args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+METRICS_DIR = 'metrics'  # Сюда пишутся *.prom (для textfile-коллектора) и events.jsonl
+EVENTS_FILE = 'events.jsonl'
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))  # Если задан — метрики отдаются ещё и по HTTP
+
+_lock = threading.Lock()
+_counters = {}
+_timers = {}
+_job = 'scraper'
+
+
+def set_job(name):
+    """Имя процесса в метриках и имя файла .prom (например, scraper_worker0)"""
+    global _job
+    _job = name
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def log_event(event, **fields):
+    """Пишет структурированное событие одной JSON-строкой в events.jsonl"""
+    record = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'job': _job, 'event': event}
+    record.update(fields)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(os.path.join(METRICS_DIR, EVENTS_FILE), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+def inc(name, value=1, **labels):
+    """Увеличивает счётчик"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Добавляет замер длительности в таймер (count / sum / max)"""
+    key = _key(name, labels)
+    with _lock:
+        count, total, longest = _timers.get(key, (0, 0.0, 0.0))
+        _timers[key] = (count + 1, total + seconds, max(longest, seconds))
+
+
+@contextmanager
+def timer(stage, **labels):
+    """Замеряет длительность этапа и пишет событие stage в лог"""
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe('stage_seconds', elapsed, stage=stage, **labels)
+        log_event('stage', stage=stage, seconds=round(elapsed, 3), status=status, **labels)
+
+
+def instrument_driver(driver):
+    """Считает все команды WebDriver (включая вызовы через WebElement)"""
+    original = driver.execute
+
+    def execute(command, params=None):
+        inc('webdriver_commands_total', command=command)
+        return original(command, params)
+
+    driver.execute = execute
+    return driver
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def render_prometheus():
+    """Текущие метрики в текстовом формате Prometheus"""
+    with _lock:
+        counters = dict(_counters)
+        timers = dict(_timers)
+
+    job = (('job', _job),)
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE scraper_{name} counter")
+        for (metric, labels), value in counters.items():
+            if metric == name:
+                lines.append(f"scraper_{name}{_format_labels(labels, job)} {value}")
+
+    for name in sorted({name for name, _ in timers}):
+        lines.append(f"# TYPE scraper_{name} summary")
+        for (metric, labels), (count, total, longest) in timers.items():
+            if metric == name:
+                lines.append(f"scraper_{name}_count{_format_labels(labels, job)} {count}")
+                lines.append(f"scraper_{name}_sum{_format_labels(labels, job)} {total:.6f}")
+                lines.append(f"scraper_{name}_max{_format_labels(labels, job)} {longest:.6f}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path=None):
+    """Атомарно записывает метрики в файл .prom (по умолчанию metrics/<job>.prom)"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = path or os.path.join(METRICS_DIR, f"{_job}.prom")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=9105, host='127.0.0.1'):
+    """Отдаёт метрики по HTTP (/metrics и любой другой путь) в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[METRICS] Метрики доступны на http://{host}:{port}/metrics")
+    return server
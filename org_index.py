@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import hashlib
+from datetime import datetime
+
+from parsing import extract_org_id
+
+ORG_INDEX_DB = 'org_index.sqlite'
+
+# Поля, изменение которых считается обновлением организации
+TRACKED_FIELDS = ('name', 'address', 'rating', 'avg_price', 'reviews_count', 'link')
+
+
+def org_index_key(record):
+    """Ключ организации: id из ссылки, а если его нет — пара (название, адрес)"""
+    org_id = extract_org_id(record.get('link'))
+    if org_id:
+        return f"id:{org_id}"
+    return f"na:{record.get('name')}|{record.get('address')}"
+
+
+def fingerprint(record):
+    """Хэш отслеживаемых полей записи"""
+    payload = json.dumps([record.get(field) for field in TRACKED_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+class OrgIndex:
+    """
+    Постоянный индекс уже собранных организаций (SQLite, ключ — id организации).
+    Проверка ключа — поиск по первичному ключу, поэтому не зависит от размера индекса.
+    """
+
+    def __init__(self, path=ORG_INDEX_DB):
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS orgs (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def lookup(self, keys, chunk_size=500):
+        """Возвращает {key: fingerprint} для уже известных ключей"""
+        keys = list(keys)
+        found = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, fingerprint FROM orgs WHERE key IN ({placeholders})", chunk
+            )
+            found.update(rows)
+        return found
+
+    def select(self, records, mode='refresh'):
+        """
+        Отбирает записи, которые нужно записать в выходной файл.
+        :param mode: 'skip' — только новые организации,
+                     'refresh' — новые и те, у которых изменились отслеживаемые поля
+        """
+        keyed = [(org_index_key(record), record) for record in records]
+        known = self.lookup(key for key, _ in keyed)
+
+        selected = []
+        for key, record in keyed:
+            if key not in known:
+                selected.append(record)
+            elif mode == 'refresh' and known[key] != fingerprint(record):
+                selected.append(record)
+
+        print(f"[INDEX] Новых или изменившихся организаций: {len(selected)} из {len(records)}")
+        return selected
+
+    def remember_records(self, records):
+        """Отмечает записи в индексе (вызывается после успешной записи)"""
+        self.remember((org_index_key(record), fingerprint(record)) for record in records)
+
+    def remember(self, items):
+        """Добавляет или обновляет ключи (key, fingerprint) в индексе"""
+        now = datetime.now().isoformat()
+        self.conn.executemany(
+            """
+            INSERT INTO orgs (key, fingerprint, first_seen, last_seen) VALUES (?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, last_seen = excluded.last_seen
+            """,
+            [(key, fp, now, now) for key, fp in items]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
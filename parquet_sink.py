@@ -0,0 +1,174 @@
+import os
+import uuid
+import atexit
+from datetime import datetime
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import metrics
+
+# --- НАСТРОЙКИ ---
+PARQUET_DIR = 'output_parquet'  # Корень датасета: <PARQUET_DIR>/category=<...>/insert_date=<...>/part-*.parquet
+PARTITION_COLUMNS = ['category', 'insert_date']
+BATCH_SIZE = 5000  # Сколько строк копить перед записью файла для пакетных выгрузок (меньше мелких файлов)
+COMPRESSION = 'zstd'
+
+# Типы известных колонок; остальные колонки пишутся строками
+COLUMN_TYPES = {
+    'name': pa.string(),
+    'address': pa.string(),
+    'rating': pa.float64(),
+    'avg_price': pa.int64(),
+    'reviews_count': pa.int64(),
+    'link': pa.string(),
+    'lat': pa.float64(),
+    'lon': pa.float64(),
+}
+
+_sinks = {}
+
+
+def normalize_frame(df):
+    """
+    Приводит колонки к типам COLUMN_TYPES: рейтинг "4,5" -> 4.5, средний чек и
+    количество оценок — целые числа (пустые значения остаются пустыми).
+    """
+    df = df.copy()
+    for col, pa_type in COLUMN_TYPES.items():
+        if col not in df.columns:
+            continue
+        if pa.types.is_floating(pa_type):
+            values = df[col].astype(object).where(df[col].notna(), None).astype(str)
+            df[col] = pd.to_numeric(values.str.replace(',', '.', regex=False).str.strip(), errors='coerce')
+        elif pa.types.is_integer(pa_type):
+            df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int64')
+        else:
+            df[col] = df[col].astype('string')
+    return df
+
+
+def _schema(df):
+    """Схема файла: типы из COLUMN_TYPES, для прочих колонок — строки"""
+    return pa.schema([
+        pa.field(col, COLUMN_TYPES.get(col, pa.string()))
+        for col in df.columns if col not in PARTITION_COLUMNS
+    ])
+
+
+def partition_path(root, values):
+    """Каталог партиции в стиле Hive: category=<...>/insert_date=<...>"""
+    parts = [f"{col}={quote(str(value), safe='')}" for col, value in zip(PARTITION_COLUMNS, values)]
+    return os.path.join(root, *parts)
+
+
+def write_partitioned(df, root=PARQUET_DIR, compression=COMPRESSION):
+    """
+    Пишет строки в партиции по category и insert_date. Каждый файл сначала
+    пишется под скрытым именем (.part-*.tmp, читатели его пропускают) и затем
+    атомарно переименовывается, поэтому недописанный файл никогда не виден.
+    :return: список записанных файлов
+    """
+    df = normalize_frame(df)
+    for col in PARTITION_COLUMNS:
+        if col not in df.columns:
+            df[col] = str(datetime.now().date()) if col == 'insert_date' else 'unknown'
+        df[col] = df[col].fillna('unknown').astype(str)
+
+    files = []
+    for values, part in df.groupby(PARTITION_COLUMNS, sort=False):
+        directory = partition_path(root, values)
+        os.makedirs(directory, exist_ok=True)
+
+        part = part.drop(columns=PARTITION_COLUMNS)
+        table = pa.Table.from_pandas(part, schema=_schema(part), preserve_index=False)
+
+        name = f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(table, tmp_path, compression=compression)
+        os.replace(tmp_path, os.path.join(directory, name))
+        files.append(os.path.join(directory, name))
+    return files
+
+
+def read_dataset(root=PARQUET_DIR, columns=None, filters=None):
+    """
+    Читает датасет с отсечением партиций и колонок, например:
+    read_dataset(columns=['name', 'rating'], filters=[('category', '=', 'moscow_pims')])
+    """
+    return pd.read_parquet(root, engine='pyarrow', columns=columns, filters=filters)
+
+
+class ParquetSink:
+    """
+    Буферизованная запись в партиционированный Parquet: файл на пачку из batch_size строк,
+    а не на каждую пачку пайплайна, поэтому мелких файлов нет. Строки в буфере ещё не
+    записаны: on_commit (индекс организаций) вызывается только после записи файла.
+    """
+
+    def __init__(self, root=PARQUET_DIR, batch_size=BATCH_SIZE):
+        self.root = root
+        self.batch_size = batch_size
+        self.frames = []
+        self.buffered = 0
+        self.callbacks = []
+        self.rows_written = 0
+        self.files_written = 0
+
+    def add(self, df, on_commit=None):
+        """
+        Добавляет строки в буфер; записывает файлы, когда буфер заполнен.
+        :param on_commit: вызывается после того, как эти строки записаны в файл
+        """
+        if df.empty:
+            if on_commit:
+                on_commit()
+            return
+        self.frames.append(df)
+        self.buffered += len(df)
+        if on_commit:
+            self.callbacks.append(on_commit)
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Записывает буфер в партиции"""
+        if not self.frames:
+            return 0
+
+        df = pd.concat(self.frames, ignore_index=True)
+        with metrics.timer('write_parquet'):
+            files = write_partitioned(df, self.root)
+        metrics.inc('rows_written_total', len(df), sink='parquet')
+
+        self.rows_written += len(df)
+        self.files_written += len(files)
+        self.frames = []
+        self.buffered = 0
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+        print(f"Записано {len(df)} строк в {len(files)} файл(ов) Parquet в {self.root}")
+        return len(df)
+
+    def report(self):
+        print(f"Parquet {self.root}: всего {self.rows_written} строк, файлов {self.files_written}")
+
+
+def get_sink(root=PARQUET_DIR, batch_size=BATCH_SIZE):
+    """Общий буферизованный sink для каталога и размера пачки"""
+    if (root, batch_size) not in _sinks:
+        _sinks[root, batch_size] = ParquetSink(root, batch_size)
+    return _sinks[root, batch_size]
+
+
+@atexit.register
+def flush_all():
+    """Записывает остатки буферов всех каталогов (вызывается и при завершении процесса)"""
+    for sink in _sinks.values():
+        try:
+            sink.flush()
+        except Exception as e:
+            print(f"Не удалось записать остаток в {sink.root}: {e}")
@@ -0,0 +1,151 @@
+import re
+import hashlib
+
+# Селекторы полей — одна таблица для живых парсеров (передаётся в EXTRACT_SNIPPETS_JS и
+# EXTRACT_REVIEWS_JS аргументом) и для офлайн-перепарсинга снимков (reparse.py).
+# Для каждого поля — список селекторов, берётся первый непустой текст (textContent без краевых пробелов).
+SNIPPET_SELECTORS = {
+    'item': '.search-business-snippet-view',
+    'link': 'a[href*="/org/"]',
+    'fields': {
+        'name': ['.search-business-snippet-view__title'],
+        'address': ['.search-business-snippet-view__address'],
+        'rating': ['.business-rating-badge-view__rating-text'],
+        'reviews_text': ['.business-rating-amount-view'],
+    },
+    # Средний чек — подзаголовок, в названии которого есть одна из price_titles
+    'subtitle': '.search-business-snippet-subtitle-view',
+    'subtitle_title': '.search-business-snippet-subtitle-view__title',
+    'subtitle_value': '.search-business-snippet-subtitle-view__description',
+    'price_titles': ['Ср. чек', 'Пиво'],
+}
+
+REVIEW_SELECTORS = {
+    'item': '.business-review-view',
+    'fields': {
+        'author': ['.business-review-view__author-name', '[itemprop="name"]'],
+        'date': ['.business-review-view__date'],
+        'text': ['.spoiler-view__text-container', '.business-review-view__body-text'],
+    },
+    'date_meta': 'meta[itemprop="datePublished"]',  # Если есть — дата берётся из атрибута content
+    'stars': '.business-rating-badge-view__stars',
+    'stars_full': '._full',
+}
+
+
+def parse_coords(coords_str):
+    """
+    Разбирает строку data-coordinates вида "lon,lat".
+    :return: dict or None — {'lat': float, 'lon': float}
+    """
+    try:
+        if coords_str and ',' in coords_str:
+            lon, lat = map(float, coords_str.split(',', 1))
+            return {
+                "lat": lat,
+                "lon": lon
+            }
+    except ValueError:
+        pass
+
+    print(f"Неверный формат координат: {coords_str}")
+    return None
+
+
+def parse_avg_price(price_text):
+    """Извлекает средний чек из текста вида "1000–2000 ₽" или "от 500 ₽" """
+    if not price_text:
+        return None
+
+    # Ищем диапазон (например, "1000–2000")
+    range_match = re.search(r'(\d+)[–\-]\s*(\d+)', price_text)
+    if range_match:
+        min_val = int(range_match.group(1))
+        max_val = int(range_match.group(2))
+        return str(round((min_val + max_val) / 2))
+
+    # Ищем любое число
+    num_match = re.search(r'\d+', price_text)
+    return num_match.group(0) if num_match else None
+
+
+def parse_reviews_count(text):
+    """Извлекает количество оценок из текста вида "123 оценки" """
+    if not text:
+        return None
+    match = re.search(r'(\d+)', text)
+    return match.group(1) if match else None
+
+
+def format_rating(value):
+    """Число из JSON-ответа -> строка, как на бейдже рейтинга в выдаче ("4,5")"""
+    if value is None:
+        return None
+    return f"{float(value):.1f}".replace('.', ',')
+
+
+def clean_text(text):
+    """Схлопывает пробелы и переносы: textContent, в отличие от innerText, их не нормализует"""
+    return ' '.join(text.split()) if text else text
+
+
+def build_organization_records(raw_items):
+    """
+    Превращает сырые поля из EXTRACT_SNIPPETS_JS (или HTML-снимка) в записи того же вида,
+    что возвращает scraper.parse_organization. Регулярки применяются уже в Python.
+    """
+    records = []
+    for raw in raw_items:
+        raw = {**raw, **{field: clean_text(raw.get(field)) for field in (*SNIPPET_SELECTORS['fields'], 'price_text')}}
+        if not raw.get('name') or not raw.get('address'):
+            continue
+
+        records.append({
+            'name': raw['name'],
+            'address': raw['address'],
+            'rating': raw.get('rating'),
+            'avg_price': parse_avg_price(raw.get('price_text')),
+            'reviews_count': parse_reviews_count(raw.get('reviews_text')),
+            'link': raw.get('link'),
+            'coordinates': parse_coords(raw.get('coordinates'))
+        })
+    return records
+
+
+def extract_org_id(link):
+    """Извлекает стабильный id организации из ссылки вида /org/<slug>/<id>/"""
+    if not link:
+        return None
+    match = re.search(r'/org/(?:[^/?#]+/)?(\d+)', str(link))
+    return match.group(1) if match else None
+
+
+def parse_review_stars(label, full_stars=None):
+    """Оценка отзыва из aria-label вида "Оценка 4 Из 5", иначе — по числу закрашенных звёзд"""
+    if label:
+        match = re.search(r'(\d+(?:[.,]\d+)?)', label)
+        if match:
+            return float(match.group(1).replace(',', '.'))
+    return float(full_stars) if full_stars else None
+
+
+def review_hash(review):
+    """Хэш отзыва (автор, дата, текст) для дедупликации"""
+    payload = f"{review.get('author')}|{review.get('date')}|{review.get('text')}"
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def build_review_record(raw):
+    """
+    Превращает сырые поля отзыва (EXTRACT_REVIEWS_JS или HTML-снимок) в запись
+    {'review_id', 'author', 'date', 'stars', 'text'}. Отзыв без текста — None.
+    """
+    if not raw.get('text'):
+        return None
+    return {
+        'review_id': review_hash(raw),
+        'author': raw.get('author'),
+        'date': raw.get('date'),
+        'stars': parse_review_stars(raw.get('stars_label'), raw.get('stars_full')),
+        'text': raw['text'],
+    }
@@ -0,0 +1,235 @@
+import io
+import os
+import time
+import atexit
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from org_index import org_index_key
+import metrics
+
+# --- DATABASE CONFIG ---
+# Значения по умолчанию можно переопределить стандартными переменными окружения PostgreSQL
+DB_CONFIG = {
+    'dbname': os.environ.get('PGDATABASE', 'scraper_db'),
+    'user': os.environ.get('PGUSER', 'admin'),
+    'password': os.environ.get('PGPASSWORD', 'admin'),
+    'host': os.environ.get('PGHOST', 'localhost'),
+    'port': int(os.environ.get('PGPORT', 5432)),
+}
+
+BATCH_SIZE = 5000  # Сколько строк копить перед выгрузкой в БД
+KEY_COLUMN = 'org_key'  # Колонка с ключом организации (id из ссылки либо название+адрес)
+SEQ_COLUMN = '_load_seq'  # Порядковый номер строки во временной таблице: при дублях ключа побеждает последняя
+
+_engine = None
+_writers = {}
+
+
+def get_engine():
+    """Один пул соединений на процесс вместо нового engine на каждый вызов"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(
+            f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}"
+            f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}",
+            pool_size=2,
+            pool_pre_ping=True
+        )
+    return _engine
+
+
+def _pg_type(dtype):
+    """Тип колонки PostgreSQL по типу pandas"""
+    if pd.api.types.is_float_dtype(dtype):
+        return 'DOUBLE PRECISION'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'BIGINT'
+    return 'TEXT'
+
+
+def merge_sql(table, columns):
+    """
+    INSERT ... ON CONFLICT из временной таблицы stage_<table> в целевую.
+    DISTINCT ON с ORDER BY по SEQ_COLUMN оставляет на ключ последнюю загруженную строку
+    (иначе ON CONFLICT падает на дублях внутри пачки); без неключевых колонок — DO NOTHING.
+    """
+    column_list = ', '.join(f'"{col}"' for col in columns)
+    updates = ', '.join(f'"{col}" = EXCLUDED."{col}"' for col in columns if col != KEY_COLUMN)
+    action = f'DO UPDATE SET {updates}' if updates else 'DO NOTHING'
+    return (
+        f'INSERT INTO "{table}" ({column_list}) '
+        f'SELECT DISTINCT ON ("{KEY_COLUMN}") {column_list} FROM "stage_{table}" '
+        f'ORDER BY "{KEY_COLUMN}", "{SEQ_COLUMN}" DESC '
+        f'ON CONFLICT ("{KEY_COLUMN}") {action}'
+    )
+
+
+class PostgresWriter:
+    """
+    Буферизованная запись в PostgreSQL: строки копятся между запросами, затем
+    загружаются через COPY во временную таблицу и сливаются в целевую
+    через INSERT ... ON CONFLICT по ключу организации.
+    """
+
+    def __init__(self, table, batch_size=BATCH_SIZE, engine=None):
+        self.table = table
+        self.batch_size = batch_size
+        self.engine = engine or get_engine()
+        self.frames = []
+        self.buffered = 0
+        self.callbacks = []
+        self.rows_written = 0
+        self.seconds_spent = 0.0
+        self.key_checked = False
+
+    def add(self, df, on_commit=None):
+        """
+        Добавляет строки в буфер; выгружает, когда буфер заполнен.
+        :param on_commit: вызывается после фиксации транзакции с этими строками
+        """
+        if df.empty:
+            if on_commit:
+                on_commit()
+            return
+        df = df.copy()
+        df[KEY_COLUMN] = [org_index_key(record) for record in df.to_dict('records')]
+        self.frames.append(df)
+        self.buffered += len(df)
+        if on_commit:
+            self.callbacks.append(on_commit)
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def _ensure_table(self, cursor, df):
+        """
+        Создаёт целевую таблицу и возвращает список её колонок. Колонки, которых
+        нет в уже существующей таблице (новое поле в выгрузке), добавляются, а не теряются.
+        """
+        columns = ', '.join(
+            f'"{col}" {_pg_type(dtype)}' for col, dtype in df.dtypes.items() if col != KEY_COLUMN
+        )
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.table}" '
+            f'("{KEY_COLUMN}" TEXT PRIMARY KEY, {columns})'
+        )
+        if not self.key_checked:
+            self._ensure_key(cursor)
+            self.key_checked = True
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s",
+            (self.table,)
+        )
+        table_columns = [row[0] for row in cursor.fetchall()]
+        for col, dtype in df.dtypes.items():
+            if col not in table_columns:
+                print(f"[PG] В таблице {self.table} нет колонки {col}, добавляем")
+                cursor.execute(f'ALTER TABLE "{self.table}" ADD COLUMN IF NOT EXISTS "{col}" {_pg_type(dtype)}')
+                table_columns.append(col)
+        return table_columns
+
+    def _ensure_key(self, cursor):
+        """
+        Таблица могла остаться от прежней записи через to_sql — без колонки ключа и без
+        уникального индекса, на который опирается ON CONFLICT. Добавляет то, чего нет.
+        """
+        cursor.execute(f'ALTER TABLE "{self.table}" ADD COLUMN IF NOT EXISTS "{KEY_COLUMN}" TEXT')
+        cursor.execute(
+            """
+            SELECT 1 FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+            WHERE i.indrelid = %s::regclass AND i.indisunique AND i.indpred IS NULL
+              AND i.indnatts = 1 AND a.attname = %s
+            """,
+            (f'"{self.table}"', KEY_COLUMN)
+        )
+        if cursor.fetchone():
+            return
+        print(f"[PG] В таблице {self.table} нет уникального ключа {KEY_COLUMN}, создаём индекс")
+        try:
+            cursor.execute(
+                f'CREATE UNIQUE INDEX "{self.table}_{KEY_COLUMN}_key" ON "{self.table}" ("{KEY_COLUMN}")'
+            )
+        except Exception as e:
+            raise RuntimeError(
+                f"Не удалось создать уникальный индекс по {KEY_COLUMN} в {self.table} "
+                f"(в таблице есть дубли ключа?): {e}"
+            ) from e
+
+    def flush(self):
+        """Выгружает буфер: COPY во временную таблицу и слияние с целевой"""
+        if not self.frames:
+            return 0
+
+        started = time.time()
+        df = pd.concat(self.frames, ignore_index=True)
+
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            table_columns = self._ensure_table(cursor, df)
+            columns = [col for col in df.columns if col in table_columns]
+            column_list = ', '.join(f'"{col}"' for col in columns)
+
+            cursor.execute(
+                f'CREATE TEMP TABLE "stage_{self.table}" (LIKE "{self.table}" INCLUDING DEFAULTS) '
+                f'ON COMMIT DROP'
+            )
+            # Номер строки проставляется по порядку COPY
+            cursor.execute(f'ALTER TABLE "stage_{self.table}" ADD COLUMN "{SEQ_COLUMN}" BIGSERIAL')
+
+            buffer = io.StringIO()
+            df[columns].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY "stage_{self.table}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer
+            )
+
+            cursor.execute(merge_sql(self.table, columns))
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            print(f"Ошибка записи в БД: {e}")
+            raise
+        finally:
+            connection.close()
+
+        elapsed = time.time() - started
+        metrics.observe('stage_seconds', elapsed, stage='write_postgres')
+        metrics.inc('rows_written_total', len(df), sink='postgres')
+        self.rows_written += len(df)
+        self.seconds_spent += elapsed
+        self.frames = []
+        self.buffered = 0
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+        rate = len(df) / elapsed if elapsed > 0 else 0
+        print(f"Успешно записано {len(df)} записей в таблицу {self.table} за {elapsed:.2f} с ({rate:.0f} строк/с)")
+        return len(df)
+
+    def report(self):
+        """Итоговая скорость записи"""
+        rate = self.rows_written / self.seconds_spent if self.seconds_spent > 0 else 0
+        print(f"Таблица {self.table}: всего {self.rows_written} строк, {rate:.0f} строк/с")
+
+
+def get_writer(table):
+    """Общий буферизованный writer для таблицы"""
+    if table not in _writers:
+        _writers[table] = PostgresWriter(table)
+    return _writers[table]
+
+
+@atexit.register
+def flush_all():
+    """Выгружает остатки буферов всех таблиц (вызывается и при завершении процесса)"""
+    for writer in _writers.values():
+        try:
+            writer.flush()
+            writer.report()
+        except Exception as e:
+            print(f"Не удалось выгрузить остаток в {writer.table}: {e}")
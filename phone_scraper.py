@@ -1,42 +1,38 @@
 import os
 import time
 import pandas as pd
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.chrome.options import Options
+from driver_factory import create_driver, record_page_stats
+from driver_pool import DriverPool, is_alive
+from rate_limiter import get_limiter
+from contact_fetcher import fetch_contacts_sync
+from checkpoint_store import CheckpointStore, org_key, write_csv_atomic
+import metrics
+from snapshot_store import SNAPSHOTS_ENABLED, capture as capture_snapshot
 
 # --- ПУТЬ К CSV ---
 CSV_FILE = 'output_raw.csv'
 
 # --- НАСТРОЙКИ БРАУЗЕРА ---
 HEADLESS = True  # Режим без интерфейса. True — для фоновой работы
+BROWSER_PROFILE = 'lean'  # 'lean' — без картинок, тайлов, шрифтов и счётчиков; 'full' — страница целиком
+DRIVER_MAX_USES = 100  # Через сколько организаций браузер пересоздаётся даже без падений
+HTTP_FIRST = True  # Сначала скачивать карточки по HTTP (contact_fetcher), браузер — только для ненайденных
 
 
 def init_driver(headless=True):
     """Инициализация Selenium WebDriver"""
     print("[INFO] Инициализируем браузер...")
-    chrome_options = Options()
-    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-    chrome_options.add_argument("--start-maximized")
-    if headless:
-        chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-
-    driver = webdriver.Chrome(options=chrome_options)
+    driver = create_driver(headless=headless, profile=BROWSER_PROFILE)
     return driver
 
 
-def parse_contacts_for_link(driver, link, timeout=10):
+def extract_contacts(driver, timeout=10):
     """
-    Переходит по ссылке и пытается найти телефон, телеграм, вконтакте.
-    :param driver: экземпляр драйвера
-    :param link: ссылка на карточку организации
-    :param timeout: время ожидания элемента
+    Ищет телефон, телеграм и вконтакте на уже открытой карточке организации.
     :return: словарь с контактами: {'phone', 'telegram', 'vk'}
     """
     contacts = {
@@ -45,57 +41,71 @@ def parse_contacts_for_link(driver, link, timeout=10):
         'vk': None,
     }
 
+    # Поиск телефона
     try:
-        print(f"[INFO] Открываем ссылку: {link}")
-        # Открытие ссылки в новой вкладке
-        driver.execute_script("window.open('');")
-        driver.switch_to.window(driver.window_handles[1])
-        driver.get(link)
-
-        # Ждём загрузки страницы
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.TAG_NAME, 'body'))
+        phone_element = WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, '.orgpage-phones-view__phone-number'))
         )
+        contacts['phone'] = phone_element.text.strip()
+        print(f"[PHONE] Найден: {contacts['phone']}")
+    except TimeoutException:
+        metrics.inc('timeouts_total', stage='phone')
+        print(f"[PHONE] Не найден на странице: {driver.current_url}")
 
-        # Поиск телефона
-        try:
-            phone_element = WebDriverWait(driver, timeout).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, '.orgpage-phones-view__phone-number'))
-            )
-            contacts['phone'] = phone_element.text.strip()
-            print(f"[PHONE] Найден: {contacts['phone']}")
-        except TimeoutException:
-            print(f"[PHONE] Не найден на странице: {link}")
-
-        # Поиск соцсетей
-        try:
-            social_buttons = driver.find_elements(By.CSS_SELECTOR, ".business-contacts-view__social-button a.button._link")
-            for btn in social_buttons:
-                href = btn.get_attribute("href")
-                aria_label = btn.get_attribute("aria-label").lower() if btn.get_attribute("aria-label") else ""
-
-                if "telegram" in aria_label:
-                    contacts['telegram'] = href
-                    print(f"[TELEGRAM] Найден: {href}")
-                elif "vkontakte" in aria_label or "vk" in aria_label:
-                    contacts['vk'] = href
-                    print(f"[VK] Найден: {href}")
-
-        except Exception as e:
-            print(f"[ERROR] Ошибка при парсинге соцсетей: {e}")
+    # Поиск соцсетей
+    try:
+        social_buttons = driver.find_elements(By.CSS_SELECTOR, ".business-contacts-view__social-button a.button._link")
+        for btn in social_buttons:
+            href = btn.get_attribute("href")
+            aria_label = btn.get_attribute("aria-label").lower() if btn.get_attribute("aria-label") else ""
+
+            if "telegram" in aria_label:
+                contacts['telegram'] = href
+                print(f"[TELEGRAM] Найден: {href}")
+            elif "vkontakte" in aria_label or "vk" in aria_label:
+                contacts['vk'] = href
+                print(f"[VK] Найден: {href}")
 
     except Exception as e:
-        print(f"[ERROR] Не удалось обработать ссылку {link}: {e}")
-    finally:
-        # Закрываем вкладку
-        driver.close()
-        driver.switch_to.window(driver.window_handles[0])
+        print(f"[ERROR] Ошибка при парсинге соцсетей: {e}")
 
     return contacts
 
 
+def parse_contacts_for_link(driver, link, timeout=10):
+    """
+    Переходит по ссылке и пытается найти телефон, телеграм, вконтакте.
+    :param driver: экземпляр драйвера
+    :param link: ссылка на карточку организации
+    :param timeout: время ожидания элемента
+    :return: словарь с контактами: {'phone', 'telegram', 'vk'} (None — контакт не найден)
+    :raises Exception: страница не открылась (таймаут, бан, упавший браузер) — после записи в лог
+    """
+    try:
+        with metrics.timer('contacts_org'):
+            print(f"[INFO] Открываем ссылку: {link}")
+            # Открываем в той же вкладке: блокировка ресурсов и скрипты из create_driver
+            # настроены через DevTools только для неё, новая вкладка грузилась бы целиком
+            driver.get(link)
+
+            # Ждём загрузки страницы
+            WebDriverWait(driver, timeout).until(
+                EC.presence_of_element_located((By.TAG_NAME, 'body'))
+            )
+            record_page_stats(driver)
+            if SNAPSHOTS_ENABLED:
+                capture_snapshot('org', link, driver.page_source, org_key(link))
+
+            return extract_contacts(driver, timeout)
+
+    except Exception as e:
+        print(f"[ERROR] Не удалось обработать ссылку {link}: {e}")
+        raise
+
+
 def update_csv_with_contacts():
     """Основная функция: загрузка данных и парсинг контактов"""
+    metrics.set_job('phone_scraper')
     if not os.path.exists(CSV_FILE):
         print(f"[ERROR] Файл {CSV_FILE} не найден.")
         return
@@ -114,39 +124,68 @@ def update_csv_with_contacts():
         if col not in df.columns:
             df[col] = None
 
-    # Инициализируем браузер
-    driver = init_driver(headless=HEADLESS)
-    updated = False
+    # Сохраняем чистые ссылки
+    df['link'] = df['link'].str.replace('reviews/', '', regex=False)
+
+    # Результаты копятся в SQLite, CSV выгружается один раз в конце
+    store = CheckpointStore()
+    done_keys = store.done_links('contacts')
+
+    links = []
+    for link in df['link']:
+        key = org_key(link)
+        # Пропускаем организации, уже обработанные в прошлых запусках
+        if key in done_keys:
+            continue
+        done_keys.add(key)
+        links.append(link)
+
+    print(f"[INFO] Начинаем парсинг контактов для {len(links)} из {len(df)} организаций...")
+
+    # Быстрый путь: параллельная загрузка HTML без браузера
+    if HTTP_FIRST and links:
+        with metrics.timer('contacts_http', links=len(links)):
+            http_results = fetch_contacts_sync(links)
+        for link, contact_data in http_results.items():
+            if any(contact_data.values()):
+                store.upsert('contacts', link, contact_data)
+                metrics.inc('orgs_parsed_total', script='contacts', source='http')
+        links = [link for link in links if not any(http_results[link].values())]
+        print(f"[INFO] Без контактов после HTTP, открываем в браузере: {len(links)}")
+
+    # Пул с одним тёплым браузером: пересоздаётся только после падения или DRIVER_MAX_USES организаций
+    pool = DriverPool(lambda: init_driver(headless=HEADLESS), max_uses=DRIVER_MAX_USES)
+    limiter = get_limiter()
 
-    print(f"[INFO] Начинаем парсинг контактов для {len(df)} организаций...")
-
-    for idx, row in df.iterrows():
-        link = row['link'].replace('reviews/', '')
-        current_phone = row['phone']
-
-        # # Пропускаем, если телефон уже есть
-        # if pd.notna(current_phone):
-        #     print(f"[SKIP] Уже есть данные для: {link}")
-        #     continue
-
-        print(f"[PROCESS] [{idx + 1}/{len(df)}] Парсим: {link}")
-        contact_data = parse_contacts_for_link(driver, link)
-
-        # Обновляем DataFrame
-        for key in contact_data:
-            df.at[idx, key] = contact_data[key]
-        df.at[idx, 'link'] = link  # Сохраняем чистую ссылку
-        updated = True
-
-        # Сохранение после каждой строки (на случай ошибок)
-        if updated:
-            df.to_csv(CSV_FILE, index=False, encoding='utf-8')
+    try:
+        for i, link in enumerate(links, start=1):
+            print(f"[PROCESS] [{i}/{len(links)}] Парсим: {link}")
+            limiter.acquire('org_page')  # Пауза между запросами
+            page_started = time.time()
+            driver = pool.acquire()
+            try:
+                contact_data = parse_contacts_for_link(driver, link)
+            except Exception as e:
+                # Ошибка отмечается как failed: организация попадёт в следующий запуск
+                store.mark_failed('contacts', link, e)
+                limiter.report_failure('org_page')
+                pool.release(driver, broken=not is_alive(driver))
+                continue
+            limiter.report_success('org_page', time.time() - page_started)
+            pool.release(driver)
+
+            # Сохранение после каждой строки (на случай ошибок)
+            store.upsert('contacts', link, contact_data)
+            metrics.inc('orgs_parsed_total', script='contacts', source='browser')
             print(f"[SAVED] Данные для {link}: {contact_data}")
-            updated = False
-
-        time.sleep(2)  # Пауза между запросами
+    finally:
+        pool.close()
+        limiter.report()
+        write_csv_atomic(store.merge_into(df, 'contacts'), CSV_FILE)
+        store.close()
+        metrics.write_prometheus()
+        print(f"[SAVED] Результаты выгружены в {CSV_FILE}")
 
-    driver.quit()
     print("[SUCCESS] Парсинг контактов завершён.")
 
 
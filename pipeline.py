@@ -0,0 +1,115 @@
+"""
+Потоковая обработка записей организаций: генераторы от прокрутки до записи.
+
+    записи -> dedupe_records -> пачки по batch_size -> (индекс) -> to_frame -> sink
+
+Sink — функция sink(df, on_written), принимающая DataFrame (CSV/Parquet, очередь писателя,
+PostgreSQL). on_written sink вызывает только после того, как строки действительно записаны
+(буферизованный sink — при выгрузке буфера); ошибки записи sink не глотает.
+Записи обрабатываются пачками по batch_size, поэтому память не растёт с длиной
+выдачи, а уже записанные пачки сохраняются, даже если прокрутка упала посередине.
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from org_index import org_index_key
+from pg_writer import get_writer
+
+BATCH_SIZE = 50  # Сколько организаций отправлять в sink за раз
+
+
+def dedupe_records(records, seen=None):
+    """Пропускает повторы по ключу организации. seen можно передать, чтобы помнить ключи между попытками"""
+    seen = set() if seen is None else seen
+    for record in records:
+        key = org_index_key(record)
+        if key not in seen:
+            seen.add(key)
+            yield record
+
+
+def flatten_record(record, category=None, insert_date=None):
+    """
+    Разворачивает coordinates в колонки lat/lon и приводит имена колонок
+    к нижнему регистру с подчёркиваниями (для БД)
+    """
+    flat = {}
+    for key, value in record.items():
+        if key == 'coordinates':
+            coords = value or {}
+            flat['lat'] = coords.get('lat')
+            flat['lon'] = coords.get('lon')
+        else:
+            flat[key.lower().replace(" ", "_").replace(".", "_")] = value
+    if category is not None:
+        flat['category'] = category
+        flat['insert_date'] = insert_date or str(datetime.now().date())
+    return flat
+
+
+def to_frame(batch, category=None, insert_date=None):
+    """Пачка записей -> DataFrame с развёрнутыми координатами"""
+    return pd.DataFrame([flatten_record(record, category, insert_date) for record in batch])
+
+
+def queue_sink(result_queue):
+    """
+    Sink, отправляющий пачки писателю в главный процесс. Функцию обратного вызова
+    в другой процесс не передать, поэтому в очередь уходит только признак: писатель
+    сам запоминает строки в индексе после записи.
+    """
+    def sink(df, on_written=None):
+        result_queue.put(('rows', df, on_written is not None))
+    return sink
+
+
+def postgres_sink(table):
+    """Sink в буферизованный writer PostgreSQL"""
+    return get_writer(table).add
+
+
+def run_pipeline(records, sink, category=None, batch_size=BATCH_SIZE, seen=None,
+                 index=None, index_mode=None, on_batch=None):
+    """
+    Прогоняет поток записей через дедупликацию и отправляет в sink пачками.
+    Если источник падает, уже собранная неполная пачка всё равно записывается,
+    а исключение пробрасывается дальше.
+    Если sink падает, ключи пачки убираются из seen (повторная попытка запишет их снова),
+    а исключение пробрасывается.
+    :param index: OrgIndex; с index_mode в sink попадают только новые (или изменившиеся) записи,
+        а в индекс пачка попадает только после подтверждённой записи
+    :param on_batch: вызывается с каждой пачкой исходных записей после записи
+    :return: количество уникальных записей, прошедших через пайплайн
+    """
+    insert_date = str(datetime.now().date())
+    seen = set() if seen is None else seen
+    total = 0
+
+    def write(batch):
+        use_index = index is not None and index_mode
+        selected = index.select(batch, index_mode) if use_index else batch
+        remember = (lambda: index.remember_records(batch)) if use_index else None
+        if selected:
+            try:
+                sink(to_frame(selected, category, insert_date), remember)
+            except Exception:
+                seen.difference_update(org_index_key(record) for record in batch)
+                raise
+        elif remember:
+            remember()
+        if on_batch:
+            on_batch(batch)
+
+    batch = []
+    try:
+        for record in dedupe_records(records, seen):
+            batch.append(record)
+            total += 1
+            if len(batch) >= batch_size:
+                full, batch = batch, []
+                write(full)
+    finally:
+        if batch:
+            write(batch)
+    return total
@@ -0,0 +1,198 @@
+import time
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Бюджеты действий: (действий в секунду, размер «пачки»)
+ACTION_BUDGETS = {
+    'query': (1 / 20, 1),       # Поисковый запрос — в среднем раз в 20 с
+    'org_page': (1 / 2.5, 1),   # Открытие карточки или вкладки отзывов
+    'keystroke': (5, 1),        # Ввод символа в строку поиска
+}
+
+SPEEDUP = 1.05  # Во сколько раз ускоряемся после успешного ответа
+SLOWDOWN = 0.5  # Во сколько раз замедляемся после ошибки или медленного ответа
+MIN_FACTOR = 0.1
+MAX_FACTOR = 3.0
+SLOW_RATIO = 2.0  # Ответ считается медленным, если он в SLOW_RATIO раз дольше среднего
+BACKOFF_BASE = 5  # Базовая пауза после ошибки, с
+BACKOFF_CAP = 300  # Максимальная пауза после серии ошибок, с
+JITTER = 0.3  # Случайный разброс пауз (±30%), чтобы темп не был механическим
+SHARED_STATE_DB = 'rate_limiter.sqlite'  # Общее состояние вёдер для всех процессов хоста; None — своё в каждом процессе
+
+# Состояние ведра, которое хранится в SHARED_STATE_DB (скорость и пачка берутся из бюджета)
+STATE_FIELDS = ('tokens', 'updated', 'factor', 'avg_latency', 'failures', 'blocked_until')
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.base_rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+        self.factor = 1.0
+        self.avg_latency = None
+        self.failures = 0
+        self.blocked_until = 0.0
+
+    @property
+    def rate(self):
+        return self.base_rate * self.factor
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def finish(self, now):
+        """
+        Конец действия: токены, накопившиеся, пока оно выполнялось, сгорают, и интервал
+        до следующего действия отсчитывается от конца этого, а не от его начала.
+        Иначе после запроса дольше интервала следующий шёл бы без паузы.
+        """
+        self.refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class SharedBuckets:
+    """
+    Вёдра в SQLite: каждое обращение читает и сохраняет состояние ведра внутри
+    BEGIN IMMEDIATE, поэтому процессы пула (и воркеры очереди на одном хосте)
+    делят один темп и одну паузу после ошибки, а не ходят каждый в полную скорость.
+    """
+
+    def __init__(self, budgets, path=SHARED_STATE_DB):
+        self.budgets = budgets
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                action TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                factor REAL NOT NULL,
+                avg_latency REAL,
+                failures INTEGER NOT NULL,
+                blocked_until REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    @contextmanager
+    def bucket(self, action):
+        """Ведро действия под блокировкой базы; изменения сохраняются при выходе"""
+        bucket = TokenBucket(*self.budgets[action])
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                f"SELECT {', '.join(STATE_FIELDS)} FROM buckets WHERE action = ?", (action,)
+            ).fetchone()
+            if row:
+                for field, value in zip(STATE_FIELDS, row):
+                    setattr(bucket, field, value)
+            yield bucket
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO buckets (action, {', '.join(STATE_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (action, *(getattr(bucket, field) for field in STATE_FIELDS))
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+
+class AdaptiveRateLimiter:
+    """
+    Общий планировщик темпа для всех скриптов: token bucket на каждое действие.
+    report_success/report_failure отмечают конец действия: пауза до следующего
+    считается от этого момента.
+    Пока ответы быстрые, темп постепенно растёт; при ошибках и замедлениях
+    он падает, а следующая попытка откладывается с экспоненциальной паузой и разбросом.
+    С path вёдра хранятся в SQLite и общие для всех процессов, открывших тот же файл.
+    """
+
+    def __init__(self, budgets=ACTION_BUDGETS, path=None):
+        self.buckets = {action: TokenBucket(rate, burst) for action, (rate, burst) in budgets.items()}
+        self.shared = SharedBuckets(budgets, path) if path else None
+        self.total_wait = 0.0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def bucket(self, action):
+        """Ведро действия: общее из базы или своё в памяти процесса"""
+        with self.lock:
+            if self.shared is not None:
+                with self.shared.bucket(action) as bucket:
+                    yield bucket
+            else:
+                yield self.buckets[action]
+
+    def acquire(self, action):
+        """Ждёт, пока действие разрешено. Возвращает время ожидания в секундах"""
+        with self.bucket(action) as bucket:
+            now = time.time()
+            bucket.refill(now)
+
+            delay = max(0.0, bucket.blocked_until - now)
+            if bucket.tokens < 1:
+                delay = max(delay, (1 - bucket.tokens) / bucket.rate)
+            if delay > 0:
+                delay *= random.uniform(1 - JITTER, 1 + JITTER)
+
+            # Токен списывается сразу, чтобы параллельные вызовы вставали в очередь
+            bucket.tokens -= 1
+            self.total_wait += delay
+
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def report_success(self, action, latency=None):
+        """Успешный ответ. latency — длительность действия; медленный ответ считается замедлением"""
+        with self.bucket(action) as bucket:
+            bucket.finish(time.time())
+            if latency is not None:
+                slow = bucket.avg_latency is not None and latency > SLOW_RATIO * bucket.avg_latency
+                bucket.avg_latency = latency if bucket.avg_latency is None else 0.8 * bucket.avg_latency + 0.2 * latency
+                if slow:
+                    bucket.factor = max(MIN_FACTOR, bucket.factor * SLOWDOWN)
+                    print(f"[RATE] '{action}': медленный ответ {latency:.1f} с, темп снижен до {bucket.rate:.3f}/с")
+                    return
+
+            bucket.failures = 0
+            bucket.factor = min(MAX_FACTOR, bucket.factor * SPEEDUP)
+
+    def report_failure(self, action):
+        """Ошибка: темп снижается, следующая попытка откладывается на паузу с разбросом"""
+        with self.bucket(action) as bucket:
+            bucket.finish(time.time())
+            bucket.failures += 1
+            bucket.factor = max(MIN_FACTOR, bucket.factor * SLOWDOWN)
+            backoff = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (bucket.failures - 1))
+            backoff = random.uniform(backoff / 2, backoff)
+            bucket.blocked_until = time.time() + backoff
+            print(f"[RATE] '{action}': ошибка #{bucket.failures}, пауза {backoff:.0f} с, "
+                  f"темп {bucket.rate:.3f}/с")
+
+    def stats(self):
+        """Текущий темп по действиям и суммарное время ожидания"""
+        rates = {}
+        for action in self.buckets:
+            with self.bucket(action) as bucket:
+                rates[action] = bucket.rate
+        return {'rates': rates, 'total_wait': self.total_wait}
+
+    def report(self):
+        stats = self.stats()
+        rates = ', '.join(f"{action}: {rate:.3f}/с" for action, rate in stats['rates'].items())
+        print(f"[RATE] Текущий темп — {rates}; всего ожидания {stats['total_wait']:.0f} с")
+
+
+_limiter = None
+
+
+def get_limiter():
+    """Планировщик процесса; с SHARED_STATE_DB его вёдра общие для всех процессов хоста"""
+    global _limiter
+    if _limiter is None:
+        _limiter = AdaptiveRateLimiter(path=SHARED_STATE_DB)
+    return _limiter
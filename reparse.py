@@ -0,0 +1,161 @@
+"""
+Перепарсинг сохранённых снимков страниц без браузера (см. snapshot_store.py).
+
+Таблицы селекторов parsing.SNIPPET_SELECTORS и REVIEW_SELECTORS — те же, что получают
+живые скрипты, — применяются к HTML через BeautifulSoup (get_text = textContent),
+снимки разбираются параллельно на всех ядрах.
+
+    python3 reparse.py search --output reparsed_search.csv
+    python3 reparse.py org --output reparsed_contacts.csv
+    python3 reparse.py reviews --output reparsed_reviews.csv --since 2025-07-01
+"""
+import os
+import time
+import argparse
+import multiprocessing
+from urllib.parse import urljoin
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from contact_fetcher import parse_contacts_from_html
+from org_index import org_index_key
+from parsing import (
+    build_organization_records, build_review_record, extract_org_id, SNIPPET_SELECTORS, REVIEW_SELECTORS
+)
+from snapshot_store import SnapshotStore, read_blob
+
+
+def _text(root, selector):
+    el = root.select_one(selector)
+    return el.get_text().strip() if el else None
+
+
+def _first(root, selectors):
+    """Первый непустой текст по списку селекторов (как first() в живых скриптах)"""
+    for selector in selectors:
+        value = _text(root, selector)
+        if value:
+            return value
+    return None
+
+
+def parse_search_html(html, base_url=None):
+    """Разбирает выдачу поиска так же, как EXTRACT_SNIPPETS_JS + build_organization_records"""
+    s = SNIPPET_SELECTORS
+    soup = BeautifulSoup(html, 'html.parser')
+    raw_items = []
+    for org in soup.select(s['item']):
+        price_text = None
+        for subtitle in org.select(s['subtitle']):
+            title = _text(subtitle, s['subtitle_title'])
+            if title and any(word in title for word in s['price_titles']):
+                price_text = _text(subtitle, s['subtitle_value'])
+                break
+
+        coords_el = org
+        while coords_el is not None and not coords_el.has_attr('data-coordinates'):
+            coords_el = coords_el.parent
+
+        link = org.select_one(s['link'])
+        raw = {field: _first(org, selectors) for field, selectors in s['fields'].items()}
+        raw.update({
+            'link': urljoin(base_url or '', link['href']) if link and link.get('href') else None,
+            'price_text': price_text,
+            'coordinates': coords_el.get('data-coordinates') or None if coords_el is not None else None,
+        })
+        raw_items.append(raw)
+    return build_organization_records(raw_items)
+
+
+def parse_reviews_html(html):
+    """Разбирает отзывы так же, как EXTRACT_REVIEWS_JS + build_review_record"""
+    s = REVIEW_SELECTORS
+    soup = BeautifulSoup(html, 'html.parser')
+    reviews = []
+    for review in soup.select(s['item']):
+        raw = {field: _first(review, selectors) for field, selectors in s['fields'].items()}
+        date = review.select_one(s['date_meta'])
+        if date:
+            raw['date'] = date.get('content')
+        stars = review.select_one(s['stars'])
+        raw['stars_label'] = stars.get('aria-label') if stars else None
+        raw['stars_full'] = len(stars.select(s['stars_full'])) if stars else None
+        record = build_review_record(raw)
+        if record:
+            reviews.append(record)
+    return reviews
+
+
+def parse_org_html(html, url=None):
+    """Контакты с карточки организации (id из ссылки ограничивает разбор JSON её узлом)"""
+    return [parse_contacts_from_html(html, extract_org_id(url))]
+
+
+# Вид снимка -> функция разбора HTML (url передаётся туда, где нужны абсолютные ссылки или id организации)
+PARSERS = {
+    'search': lambda html, url: parse_search_html(html, url),
+    'org': lambda html, url: parse_org_html(html, url),
+    'reviews': lambda html, url: parse_reviews_html(html),
+}
+
+
+def parse_snapshot(task):
+    """Разбирает один снимок (выполняется в процессе пула)"""
+    kind, url, key, path, captured_at = task
+    try:
+        rows = PARSERS[kind](read_blob(path), url)
+    except Exception as e:
+        print(f"[REPARSE] Ошибка разбора {path}: {e}")
+        return []
+    for row in rows:
+        row.update({'snapshot_url': url, 'org_key': key, 'captured_at': captured_at})
+    return rows
+
+
+def reparse(kind, output, workers=None, since=None):
+    """
+    Разбирает все снимки вида kind на workers процессах и сохраняет результат в CSV.
+    Для выдачи поиска дубликаты организаций отбрасываются (остаётся самый свежий снимок).
+    """
+    store = SnapshotStore()
+    tasks = [(kind, url, key, path, captured_at) for url, key, path, captured_at in store.entries(kind, since)]
+    store.close()
+    if not tasks:
+        print(f"[REPARSE] Снимков вида '{kind}' нет")
+        return None
+
+    workers = workers or os.cpu_count() or 1
+    started = time.time()
+    rows = []
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        for result in pool.imap_unordered(parse_snapshot, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+            rows.extend(result)
+
+    df = pd.DataFrame(rows)
+    if kind == 'search' and not df.empty:
+        df['org_key'] = [org_index_key(record) for record in df[['link', 'name', 'address']].to_dict('records')]
+        df = df.sort_values('captured_at').drop_duplicates(subset='org_key', keep='last')
+    elif kind == 'reviews' and not df.empty:
+        df = df.drop_duplicates(subset='review_id')
+
+    df.to_csv(output, index=False, encoding='utf-8')
+    elapsed = time.time() - started
+    print(f"[REPARSE] {kind}: снимков {len(tasks)}, строк {len(df)}, {elapsed:.1f} с "
+          f"({len(tasks) / max(elapsed, 1e-6):.0f} снимков/с на {workers} процессах) -> {output}")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перепарсинг снимков страниц без браузера")
+    parser.add_argument('kind', choices=list(PARSERS))
+    parser.add_argument('--output', help="CSV с результатом (по умолчанию reparsed_<kind>.csv)")
+    parser.add_argument('--workers', type=int, help="Сколько процессов (по умолчанию — все ядра)")
+    parser.add_argument('--since', help="Только снимки не старше даты (ISO, например 2025-07-01)")
+    args = parser.parse_args()
+
+    reparse(args.kind, args.output or f"reparsed_{args.kind}.csv", args.workers, args.since)
+
+
+if __name__ == "__main__":
+    main()
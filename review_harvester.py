@@ -0,0 +1,248 @@
+import os
+import time
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+from checkpoint_store import org_key
+from driver_factory import create_driver, record_page_stats
+from driver_pool import DriverPool, is_alive
+from rate_limiter import get_limiter
+from review_parser import click_filter_button, iter_reviews, reviews_url, wait_for_reviews
+import metrics
+
+# --- ПУТИ ---
+CSV_FILE = 'output_raw.csv'
+REVIEWS_DB = 'reviews.sqlite'
+
+# --- НАСТРОЙКИ ---
+HEADLESS = True
+BROWSER_PROFILE = 'lean'
+DRIVER_MAX_USES = 100  # Через сколько организаций браузер пересоздаётся даже без падений
+MAX_REVIEWS_PER_ORG = 300  # Сколько отзывов собирать для каждой сортировки
+SCROLL_IDLE_TIMEOUT = 3  # Сколько секунд ждать новых отзывов, прежде чем считать ленту законченной
+HARVEST_ORDERS = ('negative', 'positive')  # Какие сортировки обходить
+REFRESH_DONE = False  # Заново открывать уже собранные организации (дособрать новые отзывы)
+KNOWN_STREAK_STOP = 20  # При REFRESH_DONE: остановиться после стольких подряд уже известных отзывов
+
+# Сортировки: (значение параметра в URL, подпись в выпадающем списке).
+# Если сайт проигнорировал параметр (подпись не совпала), сортировка выбирается кликом.
+SORT_URL_PARAM = 'ranking'
+SORT_ORDERS = {
+    'default': ('by_relevance_org', 'По умолчанию'),
+    'new': ('by_time', 'По новизне'),
+    'negative': ('by_rating_asc', 'Сначала отрицательные'),
+    'positive': ('by_rating_desc', 'Сначала положительные'),
+}
+
+
+class ReviewStore:
+    """
+    Нормализованная таблица отзывов (SQLite, WAL): одна строка на отзыв,
+    ключ — организация и хэш автора, даты и текста (один и тот же отзыв,
+    оставленный двум филиалам, хранится у каждого). Отдельно хранится, какие организации
+    и сортировки уже обойдены, чтобы запуск продолжался с необработанных.
+    """
+
+    def __init__(self, path=REVIEWS_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS reviews (
+                org_key TEXT NOT NULL,
+                review_id TEXT NOT NULL,
+                author TEXT,
+                date TEXT,
+                stars REAL,
+                text TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                PRIMARY KEY (org_key, review_id)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS harvests (
+                org_key TEXT NOT NULL,
+                sort_order TEXT NOT NULL,
+                reviews INTEGER NOT NULL,
+                harvested_at TEXT NOT NULL,
+                PRIMARY KEY (org_key, sort_order)
+            )
+        """)
+        self.conn.commit()
+
+    def known_ids(self, key):
+        """Хэши уже сохранённых отзывов организации"""
+        rows = self.conn.execute("SELECT review_id FROM reviews WHERE org_key = ?", (key,))
+        return {review_id for (review_id,) in rows}
+
+    def done(self):
+        """Множество уже обойдённых пар (организация, сортировка)"""
+        return set(self.conn.execute("SELECT org_key, sort_order FROM harvests"))
+
+    def save(self, key, sort_order, reviews):
+        """Одной транзакцией добавляет новые отзывы и отмечает обход сортировки"""
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT OR IGNORE INTO reviews (review_id, org_key, author, date, stars, text, first_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(r['review_id'], key, r['author'], r['date'], r['stars'], r['text'], now) for r in reviews]
+            )
+            self.conn.execute(
+                """
+                INSERT INTO harvests (org_key, sort_order, reviews, harvested_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (org_key, sort_order) DO UPDATE SET
+                    reviews = excluded.reviews, harvested_at = excluded.harvested_at
+                """,
+                (key, sort_order, len(reviews), now)
+            )
+
+    def to_frame(self):
+        """Все отзывы одной таблицей"""
+        return pd.read_sql_query("SELECT * FROM reviews ORDER BY org_key, date", self.conn)
+
+    def close(self):
+        self.conn.close()
+
+
+def sorted_reviews_url(link, order):
+    """Ссылка на вкладку отзывов сразу с нужной сортировкой"""
+    param, _ = SORT_ORDERS[order]
+    return f"{reviews_url(link)}?{SORT_URL_PARAM}={param}"
+
+
+def open_sorted_reviews(driver, link, order, timeout=10):
+    """
+    Открывает отзывы с сортировкой из URL. Если переключатель показывает другую
+    сортировку (параметр не поддержан), выбирает её через выпадающий список.
+    :return: True, если нужная сортировка включена; None, если у организации нет отзывов
+    :raises RuntimeError: страница не загрузилась (капча, бан)
+    """
+    _, label = SORT_ORDERS[order]
+    driver.get(sorted_reviews_url(link, order))
+    record_page_stats(driver)
+
+    # Без отзывов нет и переключателя сортировки — это не ошибка
+    if not wait_for_reviews(driver, timeout):
+        return None
+
+    try:
+        switch = WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".rating-ranking-view"))
+        )
+    except TimeoutException:
+        print(f"[SORT] Нет переключателя сортировки: {driver.current_url}")
+        return order == 'default'
+
+    if switch.text.strip() == label:
+        return True
+
+    print(f"[SORT] Сортировка из URL не применилась ('{switch.text.strip()}'), выбираем '{label}' кликом")
+    metrics.inc('review_sort_fallbacks_total', order=order)
+    return click_filter_button(driver, label, timeout)
+
+
+def harvest_org(driver, link, order, known=None, max_reviews=MAX_REVIEWS_PER_ORG):
+    """
+    Собирает до max_reviews отзывов организации в одной сортировке.
+    :param known: хэши уже сохранённых отзывов; если задан, обход останавливается
+                  после KNOWN_STREAK_STOP известных отзывов подряд
+    :return: список новых отзывов (пустой, если у организации нет отзывов)
+    """
+    opened = open_sorted_reviews(driver, link, order)
+    if opened is None:
+        print(f"[HARVEST] У организации нет отзывов: {link}")
+        return []
+    if not opened:
+        raise RuntimeError(f"Не удалось включить сортировку '{order}'")
+
+    reviews = []
+    streak = 0
+    with metrics.timer('reviews_harvest', order=order):
+        for review in iter_reviews(driver, max_reviews, SCROLL_IDLE_TIMEOUT):
+            if known is not None and review['review_id'] in known:
+                streak += 1
+                if streak >= KNOWN_STREAK_STOP:
+                    print(f"[HARVEST] {KNOWN_STREAK_STOP} известных отзывов подряд, дальше уже собрано")
+                    break
+                continue
+            streak = 0
+            reviews.append(review)
+
+    metrics.inc('reviews_harvested_total', len(reviews), order=order)
+    return reviews
+
+
+def harvest_csv(csv_file=CSV_FILE, orders=HARVEST_ORDERS):
+    """Обходит организации из CSV и складывает отзывы в таблицу reviews"""
+    metrics.set_job('review_harvester')
+    if not os.path.exists(csv_file):
+        print(f"[ERROR] Файл {csv_file} не найден.")
+        return
+
+    df = pd.read_csv(csv_file)
+    if 'link' not in df.columns:
+        print("[ERROR] В CSV отсутствует столбец 'link'.")
+        return
+
+    store = ReviewStore()
+    done = store.done()
+    tasks = []
+    seen = set()
+    for link in df['link'].dropna():
+        key = org_key(link)
+        for order in orders:
+            if (key, order) in seen or ((key, order) in done and not REFRESH_DONE):
+                continue
+            seen.add((key, order))
+            tasks.append((key, link, order))
+
+    print(f"[INFO] Обходов (организация × сортировка): {len(tasks)}, до {MAX_REVIEWS_PER_ORG} отзывов в каждом")
+
+    pool = DriverPool(
+        lambda: create_driver(headless=HEADLESS, profile=BROWSER_PROFILE), max_uses=DRIVER_MAX_USES
+    )
+    limiter = get_limiter()
+    started = time.time()
+    total = 0
+
+    try:
+        for i, (key, link, order) in enumerate(tasks, start=1):
+            print(f"\n[PROCESS] [{i}/{len(tasks)}] {order}: {link}")
+            limiter.acquire('org_page')  # Анти-бан
+            page_started = time.time()
+            known = store.known_ids(key) if (key, order) in done else None
+            driver = pool.acquire()
+            try:
+                reviews = harvest_org(driver, link, order, known)
+                limiter.report_success('org_page', time.time() - page_started)
+            except Exception as e:
+                print(f"[ERROR] Не удалось собрать отзывы '{link}' ({order}): {e}")
+                limiter.report_failure('org_page')
+                pool.release(driver, broken=not is_alive(driver))
+                continue
+            pool.release(driver)
+
+            store.save(key, order, reviews)
+            total += len(reviews)
+            elapsed = time.time() - started
+            print(f"[SAVED] {len(reviews)} отзывов, всего {total}, {total / elapsed * 60:.0f} отзывов/мин")
+    finally:
+        pool.close()
+        limiter.report()
+        store.close()
+        metrics.write_prometheus()
+
+    print(f"[SUCCESS] Сбор отзывов завершён, новых отзывов: {total}")
+
+
+if __name__ == "__main__":
+    harvest_csv()
@@ -1,13 +1,20 @@
 import os
 import time
+import queue
+import multiprocessing
 import pandas as pd
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
-from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, ElementClickInterceptedException
+from driver_factory import create_driver, record_page_stats
+from driver_pool import DriverPool, is_alive
+from rate_limiter import get_limiter
+from checkpoint_store import CheckpointStore, org_key, write_csv_atomic
+from parsing import build_review_record, REVIEW_SELECTORS
+from snapshot_store import SNAPSHOTS_ENABLED, capture as capture_snapshot
+import metrics
 
 
 # --- ПУТЬ К CSV ---
@@ -15,23 +22,20 @@ CSV_FILE = 'output_raw.csv'
 
 # --- НАСТРОЙКИ БРАУЗЕРА ---
 HEADLESS = True  # Режим без интерфейса. True — для фоновой работы
+BROWSER_PROFILE = 'lean'  # 'lean' — без картинок, тайлов, шрифтов и счётчиков; 'full' — страница целиком
+DRIVER_MAX_USES = 100  # Через сколько организаций браузер пересоздаётся даже без падений
 REVIEWS_PER_CATEGORY = 5  # Сколько отзывов собирать в каждой категории
 SCROLL_PAUSE = 3  # Пауза после прокрутки страницы
 
+# --- ПАРАЛЛЕЛЬНЫЙ РЕЖИМ ---
+CONCURRENCY = 1  # Сколько браузеров (процессов) парсят отзывы одновременно. 1 — последовательно.
+                 # Темп открытия карточек общий на все процессы: rate_limiter.ACTION_BUDGETS['org_page']
+
 
 def init_driver(headless=True):
     """Инициализация Selenium WebDriver"""
     print("[INFO] Инициализируем браузер...")
-    chrome_options = Options()
-    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-    chrome_options.add_argument("--start-maximized")
-    if headless:
-        chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-
-    driver = webdriver.Chrome(options=chrome_options)
+    driver = create_driver(headless=headless, profile=BROWSER_PROFILE)
     return driver
 
 def click_filter_button(driver, label, timeout=15, max_retries=5):
@@ -94,6 +98,7 @@ def click_filter_button(driver, label, timeout=15, max_retries=5):
             print(f"[RETRY] Элемент устарел, пробуем снова...")
             time.sleep(3)
         except TimeoutException:
+            metrics.inc('timeouts_total', stage='review_filter')
             print(f"[RETRY] Таймаут при ожидании элементов, пробуем снова...")
             time.sleep(3)
         except Exception as e:
@@ -103,86 +108,299 @@ def click_filter_button(driver, label, timeout=15, max_retries=5):
     print(f"[ERROR] Не удалось выбрать фильтр '{label}' после {max_retries} попыток.")
     return False
 
+# Скрипт, который за один вызов собирает автора, дату, оценку и текст всех ещё не
+# обработанных отзывов и помечает их атрибутом data-harvested.
+# arguments[0] — вернуть и HTML отзыва (для снимков).
+# arguments[1] — таблица селекторов parsing.REVIEW_SELECTORS (её же применяет reparse.py к снимкам).
+EXTRACT_REVIEWS_JS = """
+    const [withHtml, s] = arguments;
+    const text = (root, selector) => {
+        const el = root.querySelector(selector);
+        return el ? el.textContent.trim() : null;
+    };
+    const first = (root, selectors) => {
+        for (const selector of selectors) {
+            const value = text(root, selector);
+            if (value) return value;
+        }
+        return null;
+    };
+
+    return Array.from(document.querySelectorAll(`${s.item}:not([data-harvested])`), (review) => {
+        review.setAttribute('data-harvested', '1');
+        const raw = {};
+        for (const [field, selectors] of Object.entries(s.fields)) {
+            raw[field] = first(review, selectors);
+        }
+        const date = review.querySelector(s.date_meta);
+        if (date) {
+            raw.date = date.getAttribute('content');
+        }
+        const stars = review.querySelector(s.stars);
+        raw.stars_label = stars ? stars.getAttribute('aria-label') : null;
+        raw.stars_full = stars ? stars.querySelectorAll(s.stars_full).length : null;
+        raw.html = withHtml ? review.outerHTML : null;
+        return raw;
+    });
+"""
+
+# Прокручивает ленту отзывов до конца и ждёт (через MutationObserver) появления
+# необработанных отзывов либо истечения таймаута. Возвращает число новых отзывов.
+SCROLL_REVIEWS_JS = """
+    const [timeoutMs, done] = arguments;
+    const selector = '.business-review-view:not([data-harvested])';
+    const pending = () => document.querySelectorAll(selector).length;
+    const container = document.querySelector('.scroll__container') || document.scrollingElement;
+
+    container.scrollTop = container.scrollHeight;
+    window.scrollTo(0, document.body.scrollHeight);
+    if (pending() > 0) {
+        done(pending());
+        return;
+    }
+
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        if (pending() > 0) {
+            observer.disconnect();
+            clearTimeout(timer);
+            done(pending());
+        }
+    });
+    timer = setTimeout(() => {
+        observer.disconnect();
+        done(0);
+    }, timeoutMs);
+    observer.observe(document.body, {childList: true, subtree: true});
+"""
+
+
+def iter_reviews(driver, max_reviews=REVIEWS_PER_CATEGORY, idle_timeout=SCROLL_PAUSE, seen=None):
+    """
+    Отдаёт отзывы открытой вкладки по мере прокрутки: каждый шаг — один скрипт,
+    который возвращает только ещё не обработанные элементы, повторы отсекаются по хэшу.
+    :return: генератор {'review_id', 'author', 'date', 'stars', 'text'}
+    """
+    seen = set() if seen is None else seen
+    driver.set_script_timeout(idle_timeout + 10)
+    # Пометки прошлого прохода (до смены сортировки) не должны скрывать отзывы — повторы отсечёт seen
+    driver.execute_script(
+        "document.querySelectorAll('[data-harvested]').forEach((el) => el.removeAttribute('data-harvested'));"
+    )
+    found = 0
+    page_url = driver.current_url
+    fragments = []  # HTML отзывов для снимка страницы
+
+    try:
+        while found < max_reviews:
+            for raw in driver.execute_script(EXTRACT_REVIEWS_JS, SNAPSHOTS_ENABLED, REVIEW_SELECTORS) or []:
+                if raw.get('html'):
+                    fragments.append(raw['html'])
+                review = build_review_record(raw)
+                if review is None or review['review_id'] in seen:
+                    continue
+                seen.add(review['review_id'])
+                found += 1
+                yield review
+                if found >= max_reviews:
+                    return
+
+            if not driver.execute_async_script(SCROLL_REVIEWS_JS, int(idle_timeout * 1000)):
+                print(f"[SCROLL] Новых отзывов нет {idle_timeout} с, найдено: {found}")
+                return
+    finally:
+        if fragments:
+            capture_snapshot('reviews', page_url, f"<div>{''.join(fragments)}</div>", org_key(page_url.split('?')[0]))
+
+
 def collect_reviews(driver, max_reviews=5, timeout=10):
-    """Собирает отзывы со страницы"""
-    reviews = []
-    scroll_attempts = 0
-    max_scroll_attempts = 5
-
-    while len(reviews) < max_reviews and scroll_attempts < max_scroll_attempts:
-        review_elements = WebDriverWait(driver, timeout).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "span.spoiler-view__text-container"))
+    """Собирает тексты отзывов со страницы"""
+    WebDriverWait(driver, timeout).until(
+        EC.presence_of_all_elements_located((By.CSS_SELECTOR, "span.spoiler-view__text-container"))
+    )
+    return [review['text'] for review in iter_reviews(driver, max_reviews)]
+
+
+# Карточка организации загрузилась (есть шапка или блок отзывов), даже если отзывов у неё нет
+ORG_PAGE_SELECTOR = '.orgpage-header-view, .business-reviews-card-view'
+
+
+def wait_for_reviews(driver, timeout=10):
+    """
+    Ждёт отзывы на открытой вкладке отзывов.
+    :return: True — отзывы есть, False — карточка загрузилась, но отзывов у организации нет
+    :raises RuntimeError: страница не загрузилась (капча, бан, пустая страница)
+    """
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, '.rating-ranking-view, .business-review-view'))
         )
+        return True
+    except TimeoutException:
+        metrics.inc('timeouts_total', stage='reviews_page')
+        if 'showcaptcha' in driver.current_url or not driver.find_elements(By.CSS_SELECTOR, ORG_PAGE_SELECTOR):
+            raise RuntimeError(f"Страница отзывов не загрузилась: {driver.current_url}")
+        return False
 
-        for el in review_elements:
-            text = el.text.strip()
-            if text and text not in reviews:
-                reviews.append(text)
-                if len(reviews) >= max_reviews:
-                    break
-
-        if len(reviews) < max_reviews:
-            # Прокручиваем вниз
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(SCROLL_PAUSE)
-            scroll_attempts += 1
-            print(f"[SCROLL] Прокрутили вниз ({scroll_attempts}/{max_scroll_attempts}), найдено отзывов: {len(reviews)}")
-        else:
-            break
 
-    return reviews[:max_reviews]
+def reviews_url(link):
+    """Ссылка на вкладку отзывов: добавляем '/reviews/', если её нет в ссылке"""
+    if not link.endswith('/reviews/'):
+        return link.rstrip('/') + '/reviews/'
+    return link
 
 
-def parse_reviews_for_link(driver, link, timeout=10):
+def extract_reviews(driver):
     """
-    Переходит по ссылке /reviews и собирает по 5 отзывов: сначала отрицательные, потом положительные
-    :param driver: экземпляр драйвера
-    :param link: ссылка на карточку организации
+    Собирает отзывы на уже открытой вкладке отзывов: сначала отрицательные, потом положительные.
+    Пустые строки — только если у организации действительно нет отзывов.
     :return: {'negative': str, 'positive': str}
+    :raises RuntimeError: страница не загрузилась или фильтр не удалось выбрать
     """
-
     result = {
         'negative': '',
         'positive': ''
     }
 
-    # Добавляем '/reviews/', если её нет в ссылке
-    if not link.endswith('/reviews/'):
-        full_link = link.rstrip('/') + '/reviews/'
-    else:
-        full_link = link
+    if not wait_for_reviews(driver):
+        print(f"[INFO] У организации нет отзывов: {driver.current_url}")
+        return result
+
+    # --- ОТРИЦАТЕЛЬНЫЕ ОТЗЫВЫ ---
+    print("[NEGATIVE] Загружаем отрицательные отзывы...")
+    if not click_filter_button(driver, "Сначала отрицательные"):
+        raise RuntimeError("Не удалось выбрать фильтр 'Сначала отрицательные'")
+    negative_reviews = collect_reviews(driver, REVIEWS_PER_CATEGORY)
+    result['negative'] = " -_- ".join(negative_reviews)
+    print(f"[NEGATIVE] Получено: {len(negative_reviews)}")
+
+    # --- ПОЛОЖИТЕЛЬНЫЕ ОТЗЫВЫ ---
+    print("[POSITIVE] Загружаем положительные отзывы...")
+    if not click_filter_button(driver, "Сначала положительные"):
+        raise RuntimeError("Не удалось выбрать фильтр 'Сначала положительные'")
+    positive_reviews = collect_reviews(driver, REVIEWS_PER_CATEGORY)
+    result['positive'] = " -_- ".join(positive_reviews)
+    print(f"[POSITIVE] Получено: {len(positive_reviews)}")
 
-    try:
-        print(f"[INFO] Открываем ссылку: {full_link}")
-        driver.get(full_link)
+    return result
 
-        # Ждём загрузки страницы
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.TAG_NAME, 'body'))
-        )
 
-        # --- ОТРИЦАТЕЛЬНЫЕ ОТЗЫВЫ ---
-        print("[NEGATIVE] Загружаем отрицательные отзывы...")
-        if click_filter_button(driver, "Сначала отрицательные"):
-            negative_reviews = collect_reviews(driver, REVIEWS_PER_CATEGORY)
-            result['negative'] = " -_- ".join(negative_reviews)
-            print(f"[NEGATIVE] Получено: {len(negative_reviews)}")
+def parse_reviews_for_link(driver, link, timeout=10):
+    """
+    Переходит по ссылке /reviews и собирает по 5 отзывов: сначала отрицательные, потом положительные
+    :param driver: экземпляр драйвера
+    :param link: ссылка на карточку организации
+    :return: {'negative': str, 'positive': str}
+    :raises Exception: при таймауте, бане или упавшем браузере — после записи в лог,
+                       чтобы вызывающий код учёл ошибку (паузы планировщика, повтор)
+    """
+    full_link = reviews_url(link)
+
+    try:
+        with metrics.timer('reviews_org'):
+            print(f"[INFO] Открываем ссылку: {full_link}")
+            driver.get(full_link)
+
+            # Ждём загрузки страницы
+            WebDriverWait(driver, timeout).until(
+                EC.presence_of_element_located((By.TAG_NAME, 'body'))
+            )
+            record_page_stats(driver)
 
-        # --- ПОЛОЖИТЕЛЬНЫЕ ОТЗЫВЫ ---
-        print("[POSITIVE] Загружаем положительные отзывы...")
-        if click_filter_button(driver, "Сначала положительные"):
-            positive_reviews = collect_reviews(driver, REVIEWS_PER_CATEGORY)
-            result['positive'] = " -_- ".join(positive_reviews)
-            print(f"[POSITIVE] Получено: {len(positive_reviews)}")
+            return extract_reviews(driver)
 
     except Exception as e:
         print(f"[ERROR] Не удалось обработать ссылку {full_link}: {e}")
+        raise
 
-    return result
+
+def print_progress(done, total, started):
+    """Печатает прогресс и оценку оставшегося времени"""
+    elapsed = time.time() - started
+    rate = done / elapsed if elapsed > 0 else 0
+    eta = (total - done) / rate if rate > 0 else 0
+    print(f"[PROGRESS] {done}/{total} ({done / total:.0%}), "
+          f"{rate * 60:.1f} орг/мин, осталось ~{eta / 60:.0f} мин")
+
+
+def review_worker(task_queue, result_queue):
+    """
+    Процесс-воркер: свой драйвер, берёт ссылки из общей очереди и отдаёт результаты главному процессу.
+    Темп и паузы после ошибок общие для всех воркеров (get_limiter хранит вёдра в SQLite).
+    """
+    metrics.set_job(f"review_parser_{os.getpid()}")
+    pool = DriverPool(lambda: init_driver(headless=HEADLESS), max_uses=DRIVER_MAX_USES)
+    limiter = get_limiter()
+    try:
+        while True:
+            try:
+                key, link = task_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            limiter.acquire('org_page')  # Анти-бан
+            page_started = time.time()
+            driver = pool.acquire()
+            try:
+                review_data = parse_reviews_for_link(driver, link)
+            except Exception as e:
+                print(f"[ERROR] Критическая ошибка при обработке ссылки '{link}': {e}")
+                limiter.report_failure('org_page')
+                pool.release(driver, broken=not is_alive(driver))
+                result_queue.put((key, None))  # Ошибка: организация останется необработанной
+                continue
+            limiter.report_success('org_page', time.time() - page_started)
+            pool.release(driver)
+            result_queue.put((key, review_data))
+    finally:
+        pool.close()
+        metrics.write_prometheus()
+        result_queue.put(None)  # Воркер закончил
+
+
+def collect_reviews_concurrently(tasks, concurrency=CONCURRENCY):
+    """
+    Распределяет ссылки между concurrency браузерами и отдаёт результаты по мере готовности.
+    :param tasks: список (ключ, link)
+    :return: генератор (ключ, {'negative': str, 'positive': str} или None при ошибке)
+    """
+    ctx = multiprocessing.get_context('spawn')
+    task_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    for task in tasks:
+        task_queue.put(task)
+
+    workers = max(1, min(concurrency, len(tasks)))
+    processes = [
+        ctx.Process(target=review_worker, args=(task_queue, result_queue))
+        for _ in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    print(f"[INFO] Запущено браузеров: {workers}, темп открытия карточек общий для всех")
+
+    finished = 0
+    while finished < workers:
+        try:
+            message = result_queue.get(timeout=5)
+        except queue.Empty:
+            if not any(p.is_alive() for p in processes):
+                print("[ERROR] Все воркеры завершились, не дождавшись очереди")
+                break
+            continue
+
+        if message is None:
+            finished += 1
+        else:
+            yield message
+
+    for p in processes:
+        p.join()
 
 
 def update_csv_with_reviews():
     """Основная функция: загрузка данных и парсинг отзывов"""
+    metrics.set_job('review_parser')
     if not os.path.exists(CSV_FILE):
         print(f"[ERROR] Файл {CSV_FILE} не найден.")
         return
@@ -197,42 +415,75 @@ def update_csv_with_reviews():
     # Добавляем новые столбцы
     for col in ['negative', 'positive']:
         if col not in df.columns:
-            df[col] = ''
-
-    driver = init_driver(headless=HEADLESS)
-    updated = False
+            df[col] = None
 
-    print(f"[INFO] Начинаем парсинг отзывов для {len(df)} организаций...")
-
-    for idx, row in df.iterrows():
-        link = row['link'].rstrip('/')
-        print(f"\n[PROCESS] [{idx + 1}/{len(df)}] Парсим: {link}")
+    # Результаты копятся в SQLite, CSV выгружается один раз в конце
+    store = CheckpointStore()
+    done_keys = store.done_links('reviews')
+    has_data = df['negative'].notna() & df['positive'].notna()
 
+    # Собираем ссылки без данных
+    tasks = []
+    for link, filled in zip(df['link'], has_data):
+        key = org_key(link)
         # Если уже есть данные, пропускаем
-        if pd.notna(row['negative']) and pd.notna(row['positive']):
-            print(f"[SKIP] Уже есть данные для: {link}")
+        if filled or key in done_keys:
             continue
+        done_keys.add(key)
+        tasks.append((key, link.rstrip('/')))
 
-        try:
-            review_data = parse_reviews_for_link(driver, link)
-            df.at[idx, 'negative'] = review_data['negative']
-            df.at[idx, 'positive'] = review_data['positive']
-            updated = True
-        except Exception as e:
-            print(f"[ERROR] Критическая ошибка при обработке ссылки '{link}': {e}")
-            df.at[idx, 'negative'] = '[ERROR]'
-            df.at[idx, 'positive'] = '[ERROR]'
-            updated = True
+    print(f"[INFO] Начинаем парсинг отзывов для {len(tasks)} из {len(df)} организаций...")
+
+    started = time.time()
 
-        # Сохраняем после каждой строки
-        if updated:
-            df.to_csv(CSV_FILE, index=False, encoding='utf-8')
-            print(f"[SAVED] Данные для {link}")
-            updated = False
+    def save_result(done, key, review_data, error=None):
+        if review_data is None:
+            store.mark_failed('reviews', key, error)
+            print(f"[SKIP] {key}: ошибка, организация будет обработана при следующем запуске")
+            return
+        store.upsert('reviews', key, review_data)
+        metrics.inc('orgs_parsed_total', script='reviews')
+        print(f"[SAVED] Данные для {key}")
+        print_progress(done, len(tasks), started)
 
-        time.sleep(3)  # Анти-бан
+    try:
+        if not tasks:
+            pass
+        elif CONCURRENCY > 1:
+            for done, (key, review_data) in enumerate(collect_reviews_concurrently(tasks), start=1):
+                save_result(done, key, review_data)
+        else:
+            pool = DriverPool(lambda: init_driver(headless=HEADLESS), max_uses=DRIVER_MAX_USES)
+            limiter = get_limiter()
+
+            for done, (key, link) in enumerate(tasks, start=1):
+                print(f"\n[PROCESS] [{done}/{len(tasks)}] Парсим: {link}")
+
+                limiter.acquire('org_page')  # Анти-бан
+                page_started = time.time()
+                driver = pool.acquire()
+                try:
+                    review_data = parse_reviews_for_link(driver, link)
+                except Exception as e:
+                    print(f"[ERROR] Критическая ошибка при обработке ссылки '{link}': {e}")
+                    limiter.report_failure('org_page')
+                    pool.release(driver, broken=not is_alive(driver))
+                    save_result(done, key, None, e)
+                    continue
+                limiter.report_success('org_page', time.time() - page_started)
+                pool.release(driver)
+
+                save_result(done, key, review_data)
+
+            pool.close()
+            limiter.report()
+    finally:
+        # Выгружаем всё, что успели собрать, даже при падении
+        write_csv_atomic(store.merge_into(df, 'reviews'), CSV_FILE)
+        store.close()
+        metrics.write_prometheus()
+        print(f"[SAVED] Результаты выгружены в {CSV_FILE}")
 
-    driver.quit()
     print("[SUCCESS] Парсинг отзывов завершён.")
 
 
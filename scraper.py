@@ -1,128 +1,147 @@
 import os
-import re
-import random
 import json
 import time
-from datetime import datetime
-from selenium import webdriver
+import queue
+import multiprocessing
+from functools import partial
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import WebDriverException, TimeoutException
-from sqlalchemy import create_engine
 import pandas as pd
-
-# --- DATABASE CONFIG ---
-DB_CONFIG = {
-    'dbname': 'scraper_db',
-    'user': 'admin',
-    'password': 'admin',
-    'host': 'localhost',
-    'port': 5432,
-}
-
-# Глобальные переменные
+from parsing import (
+    parse_coords, parse_avg_price, parse_reviews_count, build_organization_records, SNIPPET_SELECTORS
+)
+from snapshot_store import SNAPSHOTS_ENABLED, capture as capture_snapshot
+import parquet_sink
+from org_index import OrgIndex
+from rate_limiter import get_limiter
+import metrics
+from artifacts import ARTIFACT_DIR, get_recorder
+from pipeline import run_pipeline, queue_sink, postgres_sink
+from tiling import (REGIONS, plan_tiles, run_tiles, tile_url, region_base_url, region_map_url,
+                    with_search_text, plan_search_urls)
+from driver_factory import create_driver, record_page_stats
+from driver_pool import DriverPool, is_alive
+from search_capture import drain_performance_log, stream_captured
+
+# --- НАСТРОЙКИ ЗАПУСКА ---
+POOL_WORKERS = 1  # Количество параллельных браузеров (процессов). 1 — последовательный режим
+OUTPUT_FORMATS = ('parquet',)  # Куда писать результаты: 'parquet' (партиции по category/insert_date) и/или 'csv'
+OUTPUT_PARQUET_DIR = parquet_sink.PARQUET_DIR  # Каталог датасета Parquet
+OUTPUT_CSV = 'output.csv'  # Файл, в который дописываются результаты в формате 'csv'
+CAPTURE_MODE = False  # Брать организации из JSON-ответов поиска (DevTools), а не из DOM
+CAPTURE_SAVE_DIR = None  # Каталог для перехваченных ответов (новые фикстуры для search_capture); None — не сохранять
+BROWSER_PROFILE = 'lean'  # 'lean' — без картинок, тайлов, шрифтов и счётчиков; 'full' — страница целиком
+DRIVER_MAX_USES = 20  # Через сколько запросов браузер пересоздаётся даже без падений
+MAX_ORGANIZATIONS = 300  # Сколько организаций собирать за один запрос
+STREAM_BATCH_SIZE = 50  # Сколько организаций записывать за раз, не дожидаясь конца прокрутки
+SCROLL_IDLE_TIMEOUT = 3  # Сколько секунд ждать новых сниппетов, прежде чем считать список законченным
+SCROLL_STEP = 0.8  # Шаг прокрутки — доля высоты окна списка (виртуальный список рисует только видимое)
+SCROLL_SETTLE_MS = 300  # Сколько ждать отрисовки после шага, который не добавил новых сниппетов
+SEARCH_MODE = 'url'  # 'url' — сразу открывать ссылку с результатами поиска, 'typing' — вводить запрос в строку поиска
+REGION = 'moscow'  # Регион карты (tiling.REGIONS)
+MAP_CENTER = None  # Центр карты (lon, lat) для REGION, в том числе в плане SEARCH_REGIONS; None — центр региона
+MAP_ZOOM = 9  # Масштаб карты, на которой выполняется поиск
+SEARCH_REGIONS = (REGION,)  # План для SEARCH_MODE = 'url': каждый запрос выполняется в каждом регионе...
+SEARCH_ZOOMS = (MAP_ZOOM,)  # ...и на каждом масштабе
+TILED_MODE = False  # Делить Москву на участки карты и искать в каждом (обход потолка ~300 результатов)
+TILE_GRID = 2  # Начальная сетка участков TILE_GRID x TILE_GRID
+TILE_MAX_DEPTH = 3  # Сколько раз можно делить участок, упёршийся в потолок
+INDEX_MODE = 'refresh'  # Индекс уже собранных организаций: 'skip' — писать только новые,
+                        # 'refresh' — новые и изменившиеся, None — писать всё
+
+# Глобальные переменные (в режиме пула у каждого процесса свои)
 driver = None
 wait = None
 max_retries = 3
+org_index = None
+driver_pool = None
 
-def save_to_postgres(data, output_table):
-    # Создаем SQLAlchemy engine
-    engine = create_engine(
-        f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}"
-        f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}"
-    )
-
-    # Преобразуем список словарей в DataFrame
-    df = pd.DataFrame(data)
-
-    # Разбираем координаты на отдельные колонки
-    if 'coordinates' in df.columns:
-        coords_df = pd.json_normalize(df['coordinates'], errors='ignore')
-        coords_df.columns = ['lat', 'lon']
-        df = pd.concat([df.drop('coordinates', axis=1), coords_df], axis=1)
-
-    # Приводим названия колонок к нижнему регистру и заменяем точки на подчеркивания (для БД)
-    df.columns = [col.lower().replace(" ", "_").replace(".", "_") for col in df.columns]
-    print(df)
-
-    # Записываем данные в PostgreSQL
+def save_to_postgres(data, output_table, category=None):
+    """
+    Добавляет данные в буфер записи в PostgreSQL. Буфер общий для всех запросов
+    и выгружается пачками (COPY + upsert по ключу организации), остаток — при
+    вызове flush_all() или завершении процесса.
+    :param data: список или генератор записей (например, iter_organizations())
+    """
     try:
-        print('Попытка записать данные в файл')
-        df.to_csv(f'{output_table}.csv', index=False, encoding='utf-8')
-        df.to_sql(
-            name=output_table,
-            con=engine,
-            if_exists='append',
-            index=False
-        )
-        print(f"Успешно записано {len(df)} записей в таблицу {output_table}")
+        run_pipeline(data, postgres_sink(output_table), category, STREAM_BATCH_SIZE)
     except Exception as e:
-        print("Ошибка записи в БД через pandas:", e)
+        print("Ошибка записи в БД:", e)
 
 def setup_dirs():
     """Создает необходимые директории"""
-    os.makedirs("screenshots", exist_ok=True)
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
 
 def init_driver():
-    """Инициализация драйвера с настройками"""
-    global driver, wait
-    
-    if driver:
-        try:
-            driver.quit()
-        except:
-            pass
-            
-    chrome_options = Options()
-    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-    chrome_options.add_argument("--start-maximized")
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-    chrome_options.add_argument("--headless=new")  # Headless режим
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    
-    driver = webdriver.Chrome(options=chrome_options)
+    """
+    Берёт тёплый драйвер из пула. Текущий драйвер возвращается в пул, поэтому
+    повторный вызов между запросами не перезапускает браузер, а засчитывает использование.
+    """
+    global driver, wait, driver_pool
+
+    if driver_pool is None:
+        driver_pool = DriverPool(
+            lambda: create_driver(headless=True, profile=BROWSER_PROFILE),
+            max_uses=DRIVER_MAX_USES
+        )
+
+    if driver is not None:
+        driver_pool.release(driver)
+    driver = driver_pool.acquire()
     wait = WebDriverWait(driver, 25)
+    return driver
 
 def restart_driver():
-    """Перезапускает драйвер и открывает главную страницу карт Яндекса"""
-    global driver
-    
+    """Пересоздаёт упавший драйвер"""
+    global driver, wait
+
     print("Перезапускаем драйвер...")
-    try:
-        if driver:
-            driver.quit()
-    finally:
-        init_driver()
-        
-    try:
-        driver.get("https://yandex.ru/maps")  
-        print("Драйвер перезапущен, страница открыта.")
-        time.sleep(5)
-    except Exception as e:
-        print(f"Ошибка при открытии страницы после перезапуска: {e}")
+    driver_pool.release(driver, broken=True)
+    driver = driver_pool.acquire()
+    wait = WebDriverWait(driver, 25)
+    print("Драйвер перезапущен.")
+
+def recover_driver():
+    """Перезапускает драйвер, только если браузер действительно не отвечает"""
+    if driver is None or not is_alive(driver):
+        restart_driver()
+
+def close_driver():
+    """Возвращает драйвер в пул, закрывает браузеры и печатает статистику перезапусков"""
+    global driver
+
+    if driver_pool is not None:
+        if driver is not None:
+            driver_pool.release(driver)
+        driver = None
+        driver_pool.close()
 
 def safe_find(by, selector, timeout=15, optional=False):
-    """Безопасный поиск элемента с повторами"""
-    global driver, wait, max_retries
-    
-    for attempt in range(max_retries):
+    """
+    Безопасный поиск элемента с повторами. Необязательный элемент ищется один раз,
+    а браузер перезапускается только если он перестал отвечать.
+    """
+    attempts = 1 if optional else max_retries
+
+    for attempt in range(attempts):
         try:
-            element = wait.until(
+            element = WebDriverWait(driver, timeout).until(
                 EC.presence_of_element_located((by, selector))
             )
             return element
         except (TimeoutException, WebDriverException) as e:
+            metrics.inc('timeouts_total' if isinstance(e, TimeoutException) else 'webdriver_errors_total',
+                        script='scraper', selector=selector)
             print(f"Ошибка поиска элемента '{selector}' (попытка {attempt + 1}): {str(e)}")
-            if attempt < max_retries - 1:
-                restart_driver()
-            else:
-                if not optional:
-                    print(f"Не удалось найти обязательный элемент: {selector}")
-                return None
+            if attempt < attempts - 1:
+                recover_driver()
+
+    if not optional:
+        print(f"Не удалось найти обязательный элемент: {selector}")
+    return None
 
 def get_text_safe(parent, selector):
     """Безопасное получение текста"""
@@ -155,15 +174,7 @@ def get_coords_from_element(org_element):
             return el ? el.getAttribute('data-coordinates') : null;
         """, org_element)
         
-        if coords_str and ',' in coords_str:
-            lon, lat = map(float, coords_str.split(',', 1))
-            return {
-                "lat": lat,
-                "lon": lon
-            }
-        else:
-            print(f"Неверный формат координат: {coords_str}")
-            return None
+        return parse_coords(coords_str)
     except Exception as e:
         print(f"Ошибка при извлечении координат: {e}")
         return None
@@ -208,18 +219,7 @@ def parse_organization(org_element):
                     ) if True else None
                     
                     if desc_elem:
-                        price_text = desc_elem.text.strip()
-                        
-                        # Ищем диапазон (например, "1000–2000")
-                        range_match = re.search(r'(\d+)[–\-]\s*(\d+)', price_text)
-                        if range_match:
-                            min_val = int(range_match.group(1))
-                            max_val = int(range_match.group(2))
-                            avg_price = str(round((min_val + max_val) / 2))
-                        else:
-                            # Ищем любое число
-                            num_match = re.search(r'\d+', price_text)
-                            avg_price = num_match.group(0) if num_match else None
+                        avg_price = parse_avg_price(desc_elem.text.strip())
                         break
         except Exception as e:
             print(f"Ошибка при парсинге среднего чека: {e}")
@@ -233,9 +233,7 @@ def parse_organization(org_element):
             ) if True else None
             
             if reviews_elem:
-                text = reviews_elem.text.strip()
-                match = re.search(r'(\d+)', text)
-                reviews_count = match.group(1) if match else None
+                reviews_count = parse_reviews_count(reviews_elem.text.strip())
         except Exception as e:
             pass
             
@@ -254,189 +252,536 @@ def parse_organization(org_element):
     except Exception as e:
         pass
 
-def scroll_to_load_organizations():
-    """Прокручивает список организаций, чтобы загрузить все элементы"""
-    previous_count = 0
-    no_change_count = 0
-    max_no_change = 5  # Максимальное количество повторов без изменений
+# Скрипт, который за один вызов execute_script собирает сырые поля всех сниппетов.
+# arguments[0] — список элементов; если не передан, берутся все сниппеты на странице.
+# arguments[1] — только ещё не собранные сниппеты: они помечаются атрибутом data-scraped.
+# arguments[2] — вернуть и HTML сниппета (для снимков), обёрнутый в элемент с data-coordinates.
+# arguments[3] — таблица селекторов parsing.SNIPPET_SELECTORS (её же применяет reparse.py к снимкам).
+EXTRACT_SNIPPETS_JS = """
+    const [elements, onlyNew, withHtml, s] = arguments;
+    const nodes = elements || document.querySelectorAll(
+        onlyNew ? `${s.item}:not([data-scraped])` : s.item
+    );
+    const text = (root, selector) => {
+        const el = root.querySelector(selector);
+        return el ? el.textContent.trim() : null;
+    };
+    const first = (root, selectors) => {
+        for (const selector of selectors) {
+            const value = text(root, selector);
+            if (value) return value;
+        }
+        return null;
+    };
+
+    return Array.from(nodes, (org) => {
+        let priceText = null;
+        for (const subtitle of org.querySelectorAll(s.subtitle)) {
+            const title = text(subtitle, s.subtitle_title);
+            if (title && s.price_titles.some((word) => title.includes(word))) {
+                priceText = text(subtitle, s.subtitle_value);
+                break;
+            }
+        }
+
+        let coordsEl = org;
+        while (coordsEl && !coordsEl.hasAttribute('data-coordinates')) {
+            coordsEl = coordsEl.parentElement;
+        }
+
+        if (onlyNew) {
+            org.setAttribute('data-scraped', '1');
+        }
+
+        const link = org.querySelector(s.link);
+        const coordinates = coordsEl ? coordsEl.getAttribute('data-coordinates') : null;
+        const raw = {
+            link: link ? link.href : null,
+            price_text: priceText,
+            coordinates: coordinates,
+            html: withHtml ? `<div data-coordinates="${coordinates || ''}">${org.outerHTML}</div>` : null
+        };
+        for (const [field, selectors] of Object.entries(s.fields)) {
+            raw[field] = first(org, selectors);
+        }
+        return raw;
+    });
+"""
+
+def parse_organizations_batch(org_elements=None):
+    """
+    Парсит все сниппеты одним обращением к chromedriver вместо 8–12 вызовов на организацию.
+    :param org_elements: список WebElement; по умолчанию — все сниппеты на странице
+    :return: list[dict] — записи в формате parse_organization
+    """
+    try:
+        raw_items = driver.execute_script(EXTRACT_SNIPPETS_JS, org_elements, False, False, SNIPPET_SELECTORS)
+    except WebDriverException as e:
+        print(f"Ошибка пакетного извлечения сниппетов: {e}")
+        return []
+    return build_organization_records(raw_items or [])
+
+# Прокручивает контейнер на шаг (долю высоты окна списка) и ждёт ближайшую пачку изменений DOM
+# (MutationObserver), в которой появились несобранные сниппеты. Виртуальный список отрисовывает
+# только видимую часть, поэтому прыжок сразу в конец пропускал бы середину выдачи.
+# Если шаг сдвинул список, но новых сниппетов нет, через settleMs возвращается moved = true;
+# в конце списка ждёт догрузки до timeoutMs. Возвращает {pending: число новых, moved: есть ли куда листать}.
+SCROLL_AND_WAIT_JS = """
+    const [container, timeoutMs, stepRatio, settleMs, itemSelector, done] = arguments;
+    const selector = `${itemSelector}:not([data-scraped])`;
+    const pending = () => document.querySelectorAll(selector).length;
+    const atBottom = () => container.scrollTop + container.clientHeight >= container.scrollHeight - 2;
+
+    const before = container.scrollTop;
+    container.scrollTop = before + Math.max(1, Math.floor(container.clientHeight * stepRatio));
+    const moved = container.scrollTop > before;
+
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        if (pending() > 0) {
+            finish(true);
+        }
+    });
+    const finish = (more) => {
+        observer.disconnect();
+        clearTimeout(timer);
+        done({pending: pending(), moved: more});
+    };
+
+    if (pending() > 0) {
+        finish(true);
+        return;
+    }
+    observer.observe(container, {childList: true, subtree: true});
+    timer = setTimeout(() => finish(moved && !atBottom()), moved && !atBottom() ? settleMs : timeoutMs);
+"""
+
+def iter_organizations(max_orgs=MAX_ORGANIZATIONS, idle_timeout=SCROLL_IDLE_TIMEOUT):
+    """
+    Прокручивает список организаций шагами по SCROLL_STEP высоты окна и отдаёт записи
+    после каждой пачки изменений DOM, поэтому виртуализированный список не теряет ни ранние,
+    ни промежуточные элементы, а записи можно обрабатывать, не дожидаясь конца прокрутки.
+    Список считается законченным, если в конце списка за idle_timeout секунд не появилось новых сниппетов.
+    :return: генератор dict — записи в формате parse_organization
+    """
     # Находим основной контейнер для прокрутки
     scroll_container = driver.find_element(By.CSS_SELECTOR, '.scroll__container')
+    driver.set_script_timeout(idle_timeout + 10)
+    search_url = driver.current_url
+    fragments = []  # HTML собранных сниппетов для снимка выдачи
 
-    while True:
-        # Получаем текущее количество организаций
-        org_elements = driver.find_elements(By.CSS_SELECTOR, '.search-business-snippet-view')
-        current_count = len(org_elements)
-        print(f'Текущее количество организаций на странице: {current_count}')
-
-        if current_count == previous_count or current_count >= 300:
-            no_change_count += 1
-            print(f"Количество организаций не изменилось либо превысило 300 штук (повтор {no_change_count}/{max_no_change})")
-            
-            if no_change_count >= max_no_change:
-                print("Достигнуто максимальное количество повторов без изменений. Поиск остановлен.")
-                break
-        else:
-            no_change_count = 0  # Сбрасываем счетчик, если количество изменилось
+    def extract():
+        raw_items = driver.execute_script(EXTRACT_SNIPPETS_JS, None, True, SNAPSHOTS_ENABLED, SNIPPET_SELECTORS) or []
+        fragments.extend(item['html'] for item in raw_items if item.get('html'))
+        return build_organization_records(raw_items)
 
-        # Прокручиваем вниз
-        for _ in range(10):
+    try:
+        # Первая порция уже отрисована после поиска
+        records = extract()
+        total = len(records[:max_orgs])
+        yield from records[:max_orgs]
+        step_times = []
+
+        while total < max_orgs:
+            step_started = time.time()
             try:
-                driver.execute_script("arguments[0].scrollTop += 500;", scroll_container)
-                time.sleep(0.1)
-            except Exception as e:
+                step = driver.execute_async_script(
+                    SCROLL_AND_WAIT_JS, scroll_container, int(idle_timeout * 1000),
+                    SCROLL_STEP, SCROLL_SETTLE_MS, SNIPPET_SELECTORS['item']
+                )
+            except WebDriverException as e:
                 print(f"Ошибка прокрутки: {e}")
                 break
 
-        previous_count = current_count
-        time.sleep(1)
+            if not step['pending']:
+                if not step['moved']:
+                    print(f"Новых организаций нет {idle_timeout} с. Прокрутка остановлена.")
+                    break
+                continue  # Шаг пришёлся на уже собранные сниппеты
+
+            new_records = extract()[:max_orgs - total]
+            total += len(new_records)
+            step_times.append(time.time() - step_started)
+            print(f"Шаг {len(step_times)}: +{len(new_records)} организаций, всего {total}, "
+                  f"{step_times[-1]:.2f} с")
+            yield from new_records
+
+        if step_times:
+            print(f"Шагов прокрутки: {len(step_times)}, среднее время шага {sum(step_times) / len(step_times):.2f} с, "
+                  f"максимальное {max(step_times):.2f} с")
+    finally:
+        # Снимок всех сниппетов выдачи, включая те, что виртуальный список уже убрал из DOM
+        if fragments:
+            capture_snapshot('search', search_url, f"<div>{''.join(fragments)}</div>")
 
-    return previous_count
+def scroll_to_load_organizations(max_orgs=MAX_ORGANIZATIONS, idle_timeout=SCROLL_IDLE_TIMEOUT):
+    """
+    Собирает все организации выдачи списком (см. iter_organizations)
+    :return: list[dict] — записи в формате parse_organization
+    """
+    return list(iter_organizations(max_orgs, idle_timeout))
 
-def search_organizations(query):
-    """Выполняет поиск организаций в пределах Москвы и делает скриншот"""
-    global max_retries
+def open_search_results(query, map_url=None):
+    """
+    Прямой режим: открывает ссылку, в которой уже есть текст запроса, регион и участок карты,
+    и ждёт появления выдачи — без ввода по буквам, кликов и фиксированных пауз.
+    :return: True, если выдача появилась
+    """
+    url = with_search_text(map_url or region_map_url(REGION, MAP_CENTER, MAP_ZOOM), query)
+    driver.get(url)
+    print(f"Открыта выдача: {url}")
+    return safe_find(By.CSS_SELECTOR, '.search-business-snippet-view', optional=True) is not None
 
-    # Убедитесь, что папка screenshots существует
-    if not os.path.exists("screenshots"):
-        os.makedirs("screenshots")
+def type_search_query(query, map_url=None):
+    """
+    Запасной режим: ввод запроса в строку поиска, как это делает пользователь.
+    :return: True, если выдача появилась
+    """
+    # Открываем на шаг крупнее: после поиска кнопка «Отдалить» уменьшает масштаб до MAP_ZOOM
+    start_url = map_url or region_map_url(REGION, MAP_CENTER, MAP_ZOOM + 1)
+    driver.get(start_url)
+    print(f"Открыта карта: {start_url}")
+    time.sleep(3)
+
+    # Найти поле поиска 
+    search_input = safe_find(By.CSS_SELECTOR, 'input[placeholder*="Поиск"]')
+    if not search_input:
+        return False
+
+    search_input.clear()
+
+    # Постепенный ввод текста
+    with metrics.timer('search_typing'):
+        for char in query:
+            search_input.send_keys(char)
+            get_limiter().acquire('keystroke')
+
+    search_input.send_keys(Keys.RETURN)
+    time.sleep(5)  # Ждём загрузку результатов
+
+    # Нажимаем на кнопку "–", чтобы уменьшить масштаб
+    zoom_out_button = None if map_url else safe_find(
+        By.XPATH, '//button[@aria-label="Отдалить"]', timeout=5, optional=True
+    )
+    if zoom_out_button:
+        zoom_out_button.click()
+        print("Нажата кнопка '–', масштаб уменьшен")
+        time.sleep(2)  # Ждём обновления карты
 
-    moscow_center_url = "https://yandex.ru/maps/213/moscow/?ll=37.622504%2C55.752334&z=10"
+    # Проверяем, загрузились ли результаты
+    return safe_find(By.CSS_SELECTOR, '.search-business-snippet-view') is not None
+
+def search_organizations(query, map_url=None):
+    """
+    Выполняет поиск организаций в регионе REGION. Состояние страницы запоминается
+    в буфере артефактов; на диск оно попадает только при ошибке или по выборке.
+    В режиме SEARCH_MODE = 'url' выдача открывается прямой ссылкой, ввод запроса — запасной путь.
+    :param map_url: ссылка на участок карты; если задана, масштаб не меняется
+    """
+    global max_retries
 
     for attempt in range(max_retries):
         try:
-            driver.get(moscow_center_url)
-            print(f"Открыта карта Москвы: {moscow_center_url}")
-            time.sleep(3)
-
-            # Найти поле поиска 
-            search_input = safe_find(By.CSS_SELECTOR, 'input[placeholder*="Поиск"]')
-            if not search_input:
-                continue
-
-            search_input.clear()
-
-            # Постепенный ввод текста
-            for char in query:
-                search_input.send_keys(char)
-                time.sleep(random.uniform(0.1, 0.3))
-
-            search_input.send_keys(Keys.RETURN)
-            time.sleep(5)  # Ждём загрузку результатов
-
-            # Нажимаем на кнопку "–", чтобы уменьшить масштаб
-            zoom_out_button = safe_find(By.XPATH, '//button[@aria-label="Отдалить"]')
-            if zoom_out_button:
-                zoom_out_button.click()
-                print("Нажата кнопка '–', масштаб уменьшен")
-                time.sleep(2)  # Ждём обновления карты
-
-            # Проверяем, загрузились ли результаты
-            if safe_find(By.CSS_SELECTOR, '.search-business-snippet-view'):
-
-                # Делаем скриншот после успешного поиска
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                screenshot_path = f"screenshots/result_{timestamp}_{query}.png"
-                driver.save_screenshot(screenshot_path)
-                print(f"Скриншот сохранён: {screenshot_path}")
-
+            found = False
+            if SEARCH_MODE == 'url':
+                found = open_search_results(query, map_url)
+                if not found:
+                    metrics.inc('search_fallbacks_total', script='scraper')
+                    print("Выдача по прямой ссылке не появилась, вводим запрос в строку поиска")
+            if not found:
+                found = type_search_query(query, map_url)
+
+            if found:
+                record_page_stats(driver)
+                get_recorder().record(driver, 'search', '.scroll__container', query=query)
+                get_recorder().maybe_sample(driver, 'search')
                 return True
 
         except Exception as e:
             print(f"Ошибка поиска (попытка {attempt + 1}): {str(e)}")
+            get_recorder().capture(driver, 'search_error', e, query=query, attempt=attempt + 1)
             if attempt < max_retries - 1:
-                restart_driver()
+                recover_driver()
             else:
                 return False
 
     return False
 
-def scrape(query, category, max_retries=3):
-    """Основной метод сбора данных с возможностью повторного запуска при малом количестве организаций"""
-    global driver
+def get_org_index():
+    """Открывает индекс организаций при первом обращении"""
+    global org_index
+    if org_index is None:
+        org_index = OrgIndex()
+    return org_index
+
+def append_to_csv(df, path=OUTPUT_CSV):
+    """Дописывает результаты запроса в CSV (заголовок — только в новый файл)"""
+    try:
+        print('Попытка записать данные в файл')
+        with metrics.timer('write_csv'):
+            df.to_csv(path, index=False, encoding='utf-8', mode='a', header=not os.path.exists(path))
+        metrics.inc('rows_written_total', len(df), sink='csv')
+    except Exception as e:
+        print("Ошибка записи в файл через pandas:", e)
+        raise
+
+def write_results(df, on_written=None):
+    """
+    Отправляет результаты запроса во все выходы из OUTPUT_FORMATS. Ошибки записи
+    пробрасываются, чтобы непопавшие в файл организации не считались записанными.
+    :param on_written: вызывается, когда строки записаны во все выходы
+    """
+    if 'csv' in OUTPUT_FORMATS:
+        append_to_csv(df)
+    if 'parquet' in OUTPUT_FORMATS:
+        # Пачки копятся до parquet_sink.BATCH_SIZE строк; в индекс они попадут после записи файла
+        parquet_sink.get_sink(OUTPUT_PARQUET_DIR).add(df, on_written)
+    elif on_written:
+        on_written()
+
+def remember_written(df):
+    """Обратный вызов для строк из очереди воркера: запоминает их в индексе после записи"""
+    records = df.astype(object).where(df.notna(), None).to_dict('records')
+    return lambda: get_org_index().remember_records(records)
+
+def flush_results():
+    """Дописывает остаток буфера Parquet (вызывается в конце работы)"""
+    if 'parquet' in OUTPUT_FORMATS:
+        parquet_sink.get_sink(OUTPUT_PARQUET_DIR).flush()
+
+def scrape(query, category, max_retries=3, result_queue=None, map_url=None, min_orgs=10, use_index=True):
+    """
+    Основной метод сбора данных с возможностью повторного запуска при малом количестве организаций.
+    Организации идут потоком: прокрутка -> дедупликация -> запись пачками по STREAM_BATCH_SIZE,
+    поэтому при падении посреди выдачи уже записанные пачки сохраняются, а повторная
+    попытка дописывает только организации, которых ещё не было.
+    :param max_retries: сколько повторов после первой попытки (0 — одна загрузка выдачи)
+    :param result_queue: очередь писателя; если задана, результаты отправляются в неё, а не пишутся в файл
+    :param map_url: участок карты или готовая ссылка на выдачу (по умолчанию — центр REGION)
+    :param min_orgs: меньше этого количества организаций считается неудачной загрузкой
+    :param use_index: пропускать уже известные организации согласно INDEX_MODE
+    """
+    sink = queue_sink(result_queue) if result_queue is not None else write_results
+    index = get_org_index() if use_index and INDEX_MODE else None
+    seen = set()  # Ключи организаций, уже отправленных в sink во всех попытках
+
+    def count_batch(batch):
+        metrics.inc('orgs_parsed_total', len(batch), script='scraper', category=category)
 
     attempt = 0
     
     while attempt <= max_retries:
         try:
-            if not search_organizations(query):
+            # id ответов прошлых запросов не нужны (и без CAPTURE_MODE не копятся за сессию)
+            drain_performance_log(driver)
+
+            with metrics.timer('search', category=category):
+                found = search_organizations(query, map_url=map_url)
+
+            if not found:
                 print(f"Не удалось выполнить поиск для: {query}")
+                get_recorder().capture(driver, 'search_not_found', query=query, map_url=map_url)
                 attempt += 1
-                print(f"Попытка {attempt} из {max_retries}. Перезапуск...")
-                driver.quit()
-                driver = init_driver()  # Пересоздаем драйвер
+                metrics.inc('retries_total', script='scraper', level='attempt')
+                print(f"Попытка {attempt} из {max_retries}. Повтор...")
+                recover_driver()
                 continue
 
-            total_orgs = scroll_to_load_organizations()
-            print(f"Всего загружено организаций: {total_orgs}")
+            with metrics.timer('scroll', category=category):
+                organizations = iter_organizations()
+                if CAPTURE_MODE:
+                    # Ответы поиска забираются по ходу прокрутки, DOM-записи дополняют то, чего в них нет
+                    organizations = stream_captured(driver, organizations, STREAM_BATCH_SIZE, CAPTURE_SAVE_DIR)
 
-            if total_orgs < 10:
+                run_pipeline(organizations, sink, category, STREAM_BATCH_SIZE, seen,
+                             index, INDEX_MODE, on_batch=count_batch)
+
+            total_orgs = len(seen)
+            print(f"Уникальных организаций: {total_orgs}")
+            get_recorder().record(driver, 'scroll', '.scroll__container', query=query, orgs=total_orgs)
+
+            if total_orgs < min_orgs:
                 attempt += 1
-                print(f"Организаций меньше 10. Попытка {attempt} из {max_retries}. Перезапуск...")
-                driver.quit()
-                driver = init_driver()  # Пересоздаем драйвер
+                metrics.inc('retries_total', script='scraper', level='attempt')
+                print(f"Организаций меньше {min_orgs}. Попытка {attempt} из {max_retries}. Повтор...")
+                recover_driver()
                 continue
 
-            org_elements = driver.find_elements(By.CSS_SELECTOR, '.search-business-snippet-view')
-            results = []
+            drain_performance_log(driver)
+            return True
 
-            for org in org_elements:
-                org_data = parse_organization(org)
-                if org_data:
-                    results.append(org_data)
+        except Exception as e:
+            print(f"Критическая ошибка: {str(e)}")
+            print(f"Организаций, записанных до ошибки: {len(seen)}")
+            get_recorder().capture(driver, 'scrape_error', e, query=query, category=category, orgs=len(seen))
+            attempt += 1
+            metrics.inc('retries_total', script='scraper', level='attempt')
+            print(f"Произошла ошибка. Попытка {attempt} из {max_retries}. Повтор...")
+            recover_driver()
 
-            # Удаление дубликатов
-            seen = set()
-            unique_results = []
+    drain_performance_log(driver)
+    print("Достигнуто максимальное количество попыток. Завершение работы.")
+    return False
 
-            for item in results:
-                key = (item['name'], item['address'])
-                if key not in seen:
-                    seen.add(key)
-                    unique_results.append(item)
+def scrape_tiled(query, category, result_queue=None, bbox=None,
+                 grid=TILE_GRID, max_depth=TILE_MAX_DEPTH):
+    """
+    Выполняет запрос по участкам карты: участок, упёршийся в MAX_ORGANIZATIONS,
+    делится на четыре. Результаты всех участков объединяются и записываются один раз.
+    """
+    def fetch(tile):
+        tile_queue = queue.Queue()
+        # Одна загрузка на участок: max_retries — число повторов после первой попытки
+        scrape(query, category, max_retries=0, result_queue=tile_queue,
+               map_url=tile_url(tile, region_base_url(REGION)), min_orgs=0, use_index=False)
+
+        records = []
+        while not tile_queue.empty():
+            df = tile_queue.get()[1]
+            records.extend(df.to_dict('records'))
+        return records
+
+    bbox = bbox or REGIONS[REGION].bbox
+    records, page_loads = run_tiles(plan_tiles(bbox, grid), fetch, MAX_ORGANIZATIONS, max_depth)
+    if not records:
+        return False
+
+    df = pd.DataFrame(records).drop_duplicates(subset=['name', 'address'])
+    print(f"Уникальных организаций по всем участкам: {len(df)}, загрузок страниц: {page_loads}")
+
+    collected = df.to_dict('records')
+    remember = None
+    if INDEX_MODE:
+        df = pd.DataFrame(get_org_index().select(collected, INDEX_MODE))
+        remember = lambda: get_org_index().remember_records(collected)
+        if df.empty:
+            remember()
+            return True
+
+    # В индекс организации попадают только после подтверждённой записи
+    sink = queue_sink(result_queue) if result_queue is not None else write_results
+    sink(df, remember)
+    return True
 
-            print(f"Уникальных организаций: {len(unique_results)}")
+def process_query(query, category, result_queue=None, map_url=None):
+    """
+    Обрабатывает один запрос с тремя попытками. Возвращает True при успехе
+    :param map_url: ссылка из плана plan_search_urls (регион и масштаб)
+    """
+    print(f"\n=== Обрабатываем запрос: {query} ===")
+    run = scrape_tiled if TILED_MODE else partial(scrape, map_url=map_url)
 
-            df = pd.DataFrame(unique_results)
+    limiter = get_limiter()
 
-            # Разбираем координаты на отдельные колонки
-            if 'coordinates' in df.columns:
-                coords_df = pd.json_normalize(df['coordinates'], errors='ignore')
-                coords_df.columns = ['lat', 'lon']
-                df = pd.concat([df.drop('coordinates', axis=1), coords_df], axis=1)
+    for attempt in range(3):
+        # Пауза между запросами задаётся планировщиком: растёт после ошибок и медленных ответов
+        limiter.acquire('query')
+        started = time.time()
 
-            # Приводим названия колонок к нижнему регистру и заменяем точки на подчеркивания (для БД)
-            df.columns = [col.lower().replace(" ", "_").replace(".", "_") for col in df.columns]
-            df['category'] = category
-            df['insert_date'] = str(datetime.now().date())
-            print(df)
+        with metrics.timer('query', category=category):
+            success = run(query, category, result_queue=result_queue)
 
+        if success:
+            limiter.report_success('query', time.time() - started)
+            metrics.inc('queries_total', status='ok')
+            metrics.write_prometheus()
+            print(f"Данные по категории {category} переданы в {', '.join(OUTPUT_FORMATS)}")
+            init_driver()  # Возвращаем драйвер в пул и берём тёплый для следующего запроса
+            return True
+        limiter.report_failure('query')
+        metrics.inc('retries_total', script='scraper', level='query')
+        print(f"Попытка {attempt + 1} не удалась")
+
+    metrics.inc('queries_total', status='failed')
+    metrics.write_prometheus()
+    print(f"Не удалось обработать запрос: {query} после 3 попыток")
+    return False
+
+def pool_worker(worker_id, task_queue, result_queue):
+    """
+    Процесс пула: поднимает собственный драйвер и забирает запросы из общей очереди,
+    пока она не опустеет. Результаты и статистика уходят писателю через result_queue.
+    """
+    metrics.set_job(f"scraper_worker{worker_id}")
+    setup_dirs()
+    init_driver()
+    started = time.time()
+    done = 0
+    failed = 0
+
+    try:
+        while True:
             try:
-                print('Попытка записать данные в файл')
-                df.to_csv(f'output.csv', index=False, encoding='utf-8', mode='a')
+                query, category, *map_url = task_queue.get_nowait()
+            except queue.Empty:
+                break
 
-            except Exception as e:
-                print("Ошибка записи в файл через pandas:", e)
+            if process_query(query, category, result_queue, *map_url):
+                done += 1
+            else:
+                failed += 1
+    finally:
+        get_limiter().report()
+        close_driver()
+        metrics.write_prometheus()
+        result_queue.put(('stats', worker_id, done, failed, time.time() - started))
 
-            # Сохранение в JSON (опционально)
-            # with open(f'results/{output_table}.json', 'w', encoding='utf-8') as f:
-            #     json.dump(unique_results, f, ensure_ascii=False, indent=2)
+def run_pool(queries, workers=POOL_WORKERS):
+    """
+    Запускает запросы на пуле из workers браузеров. Запись в CSV делает только
+    главный процесс, в конце печатается пропускная способность каждого воркера.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    task_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    for item in queries:
+        task_queue.put(item)
+
+    workers = max(1, min(workers, len(queries)))
+    processes = [
+        ctx.Process(target=pool_worker, args=(worker_id, task_queue, result_queue))
+        for worker_id in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    print(f"Запущено воркеров: {workers}, запросов в очереди: {len(queries)}")
+
+    stats = {}
+    while len(stats) < workers:
+        try:
+            message = result_queue.get(timeout=5)
+        except queue.Empty:
+            # Воркер мог упасть, не отправив статистику
+            if not any(p.is_alive() for p in processes):
+                break
+            continue
 
-            return True
+        if message[0] == 'rows':
+            _, df, remember = message
+            try:
+                write_results(df, remember_written(df) if remember else None)
+            except Exception as e:
+                # Повторить запись за воркер нельзя; организации не попали в индекс и соберутся снова
+                print(f"Ошибка записи результатов воркера: {e}")
+        elif message[0] == 'stats':
+            _, worker_id, done, failed, elapsed = message
+            stats[worker_id] = (done, failed, elapsed)
 
-        except Exception as e:
-            print(f"Критическая ошибка: {str(e)}")
-            driver.save_screenshot(f"screenshots/error_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png")
-            attempt += 1
-            print(f"Произошла ошибка. Попытка {attempt} из {max_retries}. Перезапуск...")
-            driver.quit()
-            driver = init_driver()  # Пересоздаем драйвер
+    for p in processes:
+        p.join()
+    flush_results()
 
-    print("Достигнуто максимальное количество попыток. Завершение работы.")
-    return False
+    print("\n=== Производительность воркеров ===")
+    for worker_id in sorted(stats):
+        done, failed, elapsed = stats[worker_id]
+        per_hour = done / (elapsed / 3600) if elapsed > 0 else 0.0
+        print(f"Воркер {worker_id}: успешно {done}, неудачно {failed}, "
+              f"время {elapsed:.0f} с, {per_hour:.1f} запросов/час")
+
+    return stats
 
 if __name__ == "__main__":
     setup_dirs()
-    init_driver()
     
     queries = [
     ("pims Москва", "moscow_pims")
@@ -453,22 +798,21 @@ if __name__ == "__main__":
         # ("кафе Зеленоградский административный округ", "moscow_zelenograd"),
         # ("кафе Троицкий административный округ", "moscow_troitsk"),
         # ("кафе Новомосковский административный округ", "moscow_novomoskovsk")
-    
-    for query, category in queries:
-        print(f"\n=== Обрабатываем запрос: {query} ===")
-        success = False
-        
-        for attempt in range(3):
-            if scrape(query, category):
-                success = True
-                print(f"Данные по категории {category} сохранены в output_raw.csv")
-                init_driver()  # Пересоздаем драйвер для следующего запроса
-                break
-            else:
-                print(f"Попытка {attempt + 1} не удалась")
-                time.sleep(10)
-                
-        if not success:
-            print(f"Не удалось обработать запрос: {query} после 3 попыток")
-            
-        time.sleep(random.randint(15, 30))
\ No newline at end of file
+
+    if metrics.METRICS_PORT:
+        metrics.start_http_server(metrics.METRICS_PORT)
+
+    if SEARCH_MODE == 'url' and not TILED_MODE:
+        # Запрос x регион x масштаб -> готовые ссылки на выдачу
+        centers = {REGION: MAP_CENTER} if MAP_CENTER else None
+        queries = plan_search_urls(queries, SEARCH_REGIONS, SEARCH_ZOOMS, centers)
+
+    if POOL_WORKERS > 1:
+        run_pool(queries, POOL_WORKERS)
+    else:
+        init_driver()
+        for query, category, *map_url in queries:
+            process_query(query, category, None, *map_url)
+        get_limiter().report()
+        close_driver()
+        flush_results()
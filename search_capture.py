@@ -0,0 +1,257 @@
+import os
+import json
+import base64
+import uuid
+from datetime import datetime
+
+from parsing import parse_avg_price, format_rating
+
+# Ответы, которые страница карт запрашивает при поиске и прокрутке списка
+SEARCH_API_MARKER = '/maps/api/search'
+ORG_URL_TEMPLATE = 'https://yandex.ru/maps/org/{seoname}/{org_id}/'
+
+
+def enable_performance_logging(chrome_options):
+    """Включает performance-лог Chrome DevTools (только сетевые события), из которого читаются ответы и трафик"""
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    chrome_options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+    return chrome_options
+
+
+class PerformanceLog:
+    """
+    Накопленное из performance-лога драйвера. Лог при чтении очищается, поэтому его
+    вычитывает только pull(), а потребители (перехват ответов, статистика страниц)
+    берут своё отсюда: ответы поиска и суммарный трафик по Network.loadingFinished.
+    """
+
+    def __init__(self, marker=SEARCH_API_MARKER):
+        self.marker = marker
+        self.search_request_ids = []
+        self.bytes = 0  # encodedDataLength всех завершённых запросов, включая чужие домены
+        self.requests = 0
+        self.traffic_mark = (0, 0)
+
+    def pull(self, driver):
+        """Вычитывает новые записи лога. :return: False, если лог недоступен"""
+        try:
+            entries = driver.get_log('performance')
+        except Exception as e:
+            print(f"[CAPTURE] Performance-лог недоступен: {e}")
+            return False
+
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+
+            method = message.get('method')
+            params = message.get('params', {})
+            if method == 'Network.loadingFinished':
+                self.bytes += int(params.get('encodedDataLength') or 0)
+                self.requests += 1
+            elif method == 'Network.responseReceived':
+                response = params.get('response', {})
+                if self.marker in response.get('url', '') and 'json' in response.get('mimeType', ''):
+                    self.search_request_ids.append(params['requestId'])
+        return True
+
+    def take_traffic(self):
+        """Байты и число запросов с прошлого вызова"""
+        bytes_mark, requests_mark = self.traffic_mark
+        self.traffic_mark = (self.bytes, self.requests)
+        return self.bytes - bytes_mark, self.requests - requests_mark
+
+    def take_search_request_ids(self):
+        """Отдаёт накопленные id ответов поиска и забывает их"""
+        request_ids, self.search_request_ids = self.search_request_ids, []
+        return request_ids
+
+
+def get_performance_log(driver):
+    """Общий PerformanceLog драйвера (хранится на самом объекте драйвера)"""
+    log = getattr(driver, 'performance_log', None)
+    if log is None:
+        log = driver.performance_log = PerformanceLog()
+    return log
+
+
+def drain_performance_log(driver):
+    """Забывает накопленные ответы поиска (например, перед новым поиском); трафик продолжает считаться"""
+    log = get_performance_log(driver)
+    log.pull(driver)
+    log.take_search_request_ids()
+
+
+def collect_search_responses(driver):
+    """
+    Достаёт через CDP тела JSON-ответов поискового API, пришедших с прошлого вызова.
+    :return: list[dict] — разобранные JSON-ответы
+    """
+    log = get_performance_log(driver)
+    if not log.pull(driver):
+        return []
+
+    payloads = []
+    for request_id in log.take_search_request_ids():
+        try:
+            body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        except Exception as e:
+            print(f"[CAPTURE] Не удалось получить тело ответа {request_id}: {e}")
+            continue
+
+        text = body.get('body', '')
+        if body.get('base64Encoded'):
+            text = base64.b64decode(text).decode('utf-8')
+
+        try:
+            payloads.append(json.loads(text))
+        except ValueError:
+            print(f"[CAPTURE] Ответ {request_id} не является JSON")
+
+    print(f"[CAPTURE] Перехвачено ответов поиска: {len(payloads)}")
+    return payloads
+
+
+def save_responses(payloads, directory='captured'):
+    """Сохраняет перехваченные ответы в JSON-файлы (для офлайн-отладки парсера)"""
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    paths = []
+    for i, payload in enumerate(payloads):
+        path = os.path.join(directory, f"search_{timestamp}_{uuid.uuid4().hex[:8]}_{i}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        paths.append(path)
+    return paths
+
+
+def load_responses(path):
+    """Загружает сохранённые ответы из файла или из всех *.json в директории"""
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.endswith('.json')
+        )
+    else:
+        files = [path]
+
+    payloads = []
+    for file in files:
+        with open(file, encoding='utf-8') as f:
+            payloads.append(json.load(f))
+    return payloads
+
+
+def _find_feature(item, keywords):
+    """Ищет значение характеристики организации (features) по ключевым словам в id/названии"""
+    for feature in item.get('features') or []:
+        label = f"{feature.get('id', '')} {feature.get('name', '')}".lower()
+        if any(keyword in label for keyword in keywords):
+            value = feature.get('value')
+            if isinstance(value, list):
+                value = ' '.join(str(v.get('name', v)) if isinstance(v, dict) else str(v) for v in value)
+            return str(value) if value is not None else None
+    return None
+
+
+def parse_search_item(item):
+    """
+    Превращает одну организацию из ответа поискового API в запись того же вида,
+    что возвращает scraper.parse_organization. Типы полей совпадают с DOM-путём:
+    рейтинг — строка с запятой, как на бейдже, количество оценок и средний чек — строки.
+    Имена полей сверены с fixtures/search_response.json.
+    """
+    name = item.get('title') or item.get('name')
+    address = item.get('address') or item.get('fullAddress')
+    if not name or not address:
+        return None
+
+    link = None
+    org_id = item.get('id')
+    if org_id:
+        link = ORG_URL_TEMPLATE.format(seoname=item.get('seoname') or 'org', org_id=org_id)
+
+    rating_data = item.get('ratingData') or {}
+    rating = rating_data.get('ratingValue')
+    reviews_count = rating_data.get('ratingCount')
+
+    coordinates = None
+    coords = item.get('coordinates')
+    if isinstance(coords, (list, tuple)) and len(coords) == 2:
+        # Как и в data-coordinates, порядок — lon, lat
+        coordinates = {'lat': float(coords[1]), 'lon': float(coords[0])}
+
+    return {
+        'name': name,
+        'address': address,
+        'rating': format_rating(rating),
+        'avg_price': parse_avg_price(_find_feature(item, ('average_bill', 'чек'))),
+        'reviews_count': str(reviews_count) if reviews_count is not None else None,
+        'link': link,
+        'coordinates': coordinates
+    }
+
+
+def parse_search_response(payload):
+    """Разбирает один JSON-ответ поискового API в список записей"""
+    data = payload.get('data', payload) if isinstance(payload, dict) else {}
+    items = data.get('items') or []
+
+    records = []
+    for item in items:
+        # В выдаче бывают не только организации (топонимы, реклама)
+        if item.get('type') not in (None, 'business'):
+            continue
+        record = parse_search_item(item)
+        if record:
+            records.append(record)
+    return records
+
+
+def records_from_responses(payloads):
+    """Разбирает все перехваченные ответы в один список записей"""
+    records = []
+    for payload in payloads:
+        records.extend(parse_search_response(payload))
+    return records
+
+
+def stream_captured(driver, dom_records, batch_size=50, save_dir=None):
+    """
+    Поток записей режима перехвата: DOM-записи копятся пачками по batch_size, после каждой
+    пачки забираются ответы поиска, пришедшие за это время. Сначала отдаются записи из
+    ответов, затем DOM-записи пачки — их повторы отсеет дедупликация пайплайна, а
+    организации, которых в ответах нет, останутся. В памяти не больше одной пачки.
+    :param save_dir: каталог для сохранения ответов (save_responses); None — не сохранять
+    """
+    captured = 0
+
+    def take_captured():
+        nonlocal captured
+        responses = collect_search_responses(driver)
+        if save_dir and responses:
+            save_responses(responses, save_dir)
+        records = records_from_responses(responses)
+        captured += len(records)
+        return records
+
+    pending = []
+    for record in dom_records:
+        pending.append(record)
+        if len(pending) >= batch_size:
+            yield from take_captured()
+            yield from pending
+            pending = []
+    yield from take_captured()
+    yield from pending
+    print(f"[CAPTURE] Организаций из ответов поиска: {captured}")
+
+
+if __name__ == '__main__':
+    import sys
+    import pandas as pd
+
+    # Офлайн-разбор сохранённых ответов: python3 search_capture.py captured/
+    records = records_from_responses(load_responses(sys.argv[1] if len(sys.argv) > 1 else 'captured'))
+    print(pd.DataFrame(records).to_string())
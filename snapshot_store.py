@@ -0,0 +1,211 @@
+"""
+Сжатые снимки страниц для офлайн-перепарсинга (см. reparse.py).
+
+Содержимое хранится по хэшу (одинаковые страницы — один файл) в snapshots/objects,
+сжатое zstd (если установлен zstandard) или gzip. Индекс снимков — snapshots/index.sqlite.
+Включается переменной окружения SNAPSHOTS=1 или SNAPSHOTS_ENABLED = True.
+
+    python3 snapshot_store.py            # статистика
+    python3 snapshot_store.py --evict    # удалить снимки старше SNAPSHOT_TTL_DAYS
+
+Очистка выполняется и сама: при открытии хранилища в начале запуска (get_store),
+не чаще раза в EVICT_INTERVAL_HOURS на все процессы.
+"""
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOTS_ENABLED = os.environ.get('SNAPSHOTS', '0') == '1'  # Сохранять ли страницы при парсинге
+SNAPSHOT_TTL_DAYS = 30  # Сколько дней хранить снимки
+EVICT_INTERVAL_HOURS = 24  # Как часто очищать устаревшие снимки автоматически
+CODEC = 'zst' if zstandard else 'gz'
+
+_store = None
+
+
+def compress(data, codec=CODEC):
+    if codec == 'zst':
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def read_blob(path):
+    """Читает и распаковывает файл снимка (кодек — по расширению); индекс для этого не нужен"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith('.zst'):
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    return gzip.decompress(data).decode('utf-8')
+
+
+class SnapshotStore:
+    """Хранилище снимков: файлы по хэшу содержимого + индекс (вид, ссылка, ключ, время) в SQLite"""
+
+    def __init__(self, root=SNAPSHOT_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, 'index.sqlite'), timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                url TEXT,
+                key TEXT,
+                content_hash TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                captured_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS snapshots_kind ON snapshots (kind, captured_at)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.root, 'objects', content_hash[:2], f"{content_hash}.html.{CODEC}")
+
+    def save(self, kind, url, html, key=None):
+        """
+        Сохраняет страницу. Файл с таким содержимым пишется один раз (временный файл + rename).
+        :param kind: 'search', 'org' или 'reviews' — какой парсер применять при перепарсинге
+        :return: хэш содержимого
+        """
+        data = html.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            with open(tmp_path, 'wb') as f:
+                f.write(compress(data))
+            os.replace(tmp_path, path)
+        else:
+            os.utime(path)  # Свежий mtime защищает файл от параллельной очистки (см. evict)
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO snapshots (kind, url, key, content_hash, path, size, captured_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, url, key, content_hash, os.path.relpath(path, self.root), len(data),
+                 datetime.now().isoformat())
+            )
+        return content_hash
+
+    def entries(self, kind, since=None):
+        """Снимки одного вида: список (url, key, абсолютный путь к файлу, время)"""
+        query = "SELECT url, key, path, captured_at FROM snapshots WHERE kind = ?"
+        params = [kind]
+        if since:
+            query += " AND captured_at >= ?"
+            params.append(since)
+        rows = self.conn.execute(query + " ORDER BY id", params)
+        return [(url, key, os.path.join(self.root, path), captured_at) for url, key, path, captured_at in rows]
+
+    def evict(self, ttl_days=SNAPSHOT_TTL_DAYS):
+        """Удаляет записи старше ttl_days и файлы, на которые больше никто не ссылается"""
+        cutoff = (datetime.now() - timedelta(days=ttl_days)).isoformat()
+        with self.conn:
+            deleted = self.conn.execute("DELETE FROM snapshots WHERE captured_at < ?", (cutoff,)).rowcount
+        referenced = {path for (path,) in self.conn.execute("SELECT DISTINCT path FROM snapshots")}
+
+        fresh_after = time.time() - 3600
+        removed = 0
+        freed = 0
+        objects = os.path.join(self.root, 'objects')
+        for directory, _, files in os.walk(objects):
+            for name in files:
+                path = os.path.join(directory, name)
+                # Свежие файлы не трогаем: запись в индекс могла ещё не случиться (парсер работает параллельно)
+                if os.path.getmtime(path) > fresh_after:
+                    continue
+                if os.path.relpath(path, self.root) not in referenced:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+
+        print(f"[SNAPSHOT] Удалено записей: {deleted}, файлов: {removed}, освобождено {freed / 1024 / 1024:.1f} МБ")
+        return deleted, removed
+
+    def maybe_evict(self, ttl_days=SNAPSHOT_TTL_DAYS, interval_hours=EVICT_INTERVAL_HOURS):
+        """
+        Очищает хранилище, если с прошлой очистки прошло больше interval_hours.
+        Время очистки помечается в meta одной транзакцией, поэтому из параллельных
+        процессов очистку выполняет только один.
+        :return: результат evict() или None, если очищать рано
+        """
+        now = datetime.now()
+        due_before = (now - timedelta(hours=interval_hours)).isoformat()
+        with self.conn:
+            claimed = self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('last_evict', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value WHERE meta.value < ?",
+                (now.isoformat(), due_before)
+            ).rowcount
+        if not claimed:
+            return None
+        return self.evict(ttl_days)
+
+    def stats(self):
+        """Количество снимков, исходный объём и объём на диске по видам"""
+        rows = self.conn.execute(
+            "SELECT kind, COUNT(*), COUNT(DISTINCT path), SUM(size) FROM snapshots GROUP BY kind"
+        ).fetchall()
+        on_disk = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, files in os.walk(os.path.join(self.root, 'objects')) for name in files
+        )
+        for kind, count, unique, size in rows:
+            print(f"[SNAPSHOT] {kind}: снимков {count}, уникальных {unique}, {size / 1024 / 1024:.1f} МБ без сжатия")
+        print(f"[SNAPSHOT] На диске: {on_disk / 1024 / 1024:.1f} МБ ({CODEC})")
+        return rows
+
+    def close(self):
+        self.conn.close()
+
+
+def get_store():
+    """Общее хранилище процесса"""
+    global _store
+    if _store is None:
+        _store = SnapshotStore()
+        _store.maybe_evict()
+    return _store
+
+
+def capture(kind, url, html, key=None):
+    """Сохраняет снимок, если снимки включены. Ошибки записи не прерывают парсинг"""
+    if not SNAPSHOTS_ENABLED or not html:
+        return None
+    try:
+        return get_store().save(kind, url, html, key)
+    except Exception as e:
+        print(f"[SNAPSHOT] Не удалось сохранить снимок {url}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Хранилище снимков страниц")
+    parser.add_argument('--evict', action='store_true', help="Удалить снимки старше --ttl-days")
+    parser.add_argument('--ttl-days', type=float, default=SNAPSHOT_TTL_DAYS)
+    args = parser.parse_args()
+
+    store = SnapshotStore()
+    if args.evict:
+        store.evict(args.ttl_days)
+    store.stats()
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Пространственный индекс (равномерная сетка) по координатам организаций.
+
+- near-дубликаты: одна и та же точка под немного разными названиями/адресами из разных
+  запросов и участков. Сравниваются только организации из соседних ячеек сетки в радиусе
+  DUPLICATE_RADIUS_M, поэтому пар не O(n²), а по числу соседей.
+- отчёт о покрытии: ячейки в границах поиска, где организаций подозрительно мало по
+  сравнению с соседними, — со ссылкой на карту для повторного сбора по участку.
+
+    python3 spatial_index.py merged_cafe_data.csv
+    python3 spatial_index.py output_parquet --duplicates near_duplicates.csv --coverage coverage.csv
+    python3 spatial_index.py merged_cafe_data.csv --region spb
+"""
+import os
+import re
+import math
+import argparse
+import statistics
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+from org_index import org_index_key
+from tiling import MOSCOW_BBOX, MAP_BASE_URL, REGIONS, Tile, tile_url, region_base_url
+
+# --- НАСТРОЙКИ ---
+DUPLICATE_RADIUS_M = 50  # Организации ближе этого расстояния проверяются на дубликат
+NAME_SIMILARITY = 0.8  # Минимальная похожесть названий (0..1), чтобы считать пару дубликатом
+COVERAGE_CELL_M = 1000  # Размер ячейки отчёта о покрытии
+SPARSE_RATIO = 0.2  # Ячейка подозрительна, если в ней меньше этой доли от медианы соседей
+MIN_NEIGHBOR_MEDIAN = 5  # ...и соседи при этом достаточно плотные (иначе это просто пустая окраина)
+
+METERS_PER_DEGREE = 111320
+EARTH_RADIUS_M = 6371000
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Расстояние между точками в метрах"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """
+    Равномерная сетка с ячейками cell_m x cell_m метров. Запрос по радиусу не больше
+    cell_m просматривает только ячейку точки и 8 соседних.
+    """
+
+    def __init__(self, cell_m, ref_lat=55.75, origin=(0.0, 0.0)):
+        self.cell_m = cell_m
+        self.lat_step = cell_m / METERS_PER_DEGREE
+        self.lon_step = cell_m / (METERS_PER_DEGREE * math.cos(math.radians(ref_lat)))
+        self.origin_lon, self.origin_lat = origin
+        self.cells = {}
+        self.points = {}
+
+    def cell_of(self, lat, lon):
+        return (math.floor((lat - self.origin_lat) / self.lat_step),
+                math.floor((lon - self.origin_lon) / self.lon_step))
+
+    def add(self, item_id, lat, lon):
+        self.points[item_id] = (lat, lon)
+        self.cells.setdefault(self.cell_of(lat, lon), []).append(item_id)
+
+    def query_radius(self, lat, lon, radius_m):
+        """[(item_id, расстояние в метрах)] в радиусе radius_m от точки"""
+        reach = max(1, math.ceil(radius_m / self.cell_m))
+        row, col = self.cell_of(lat, lon)
+        found = []
+        for d_row in range(-reach, reach + 1):
+            for d_col in range(-reach, reach + 1):
+                for item_id in self.cells.get((row + d_row, col + d_col), ()):
+                    other_lat, other_lon = self.points[item_id]
+                    distance = haversine_m(lat, lon, other_lat, other_lon)
+                    if distance <= radius_m:
+                        found.append((item_id, distance))
+        return found
+
+    def counts(self):
+        return {cell: len(items) for cell, items in self.cells.items()}
+
+
+def normalize_name(name):
+    """Название для сравнения: нижний регистр, ё -> е, без кавычек и знаков препинания"""
+    name = str(name or '').lower().replace('ё', 'е')
+    name = re.sub(r'[«»"\'“”„.,!?()\-–—&/]+', ' ', name)
+    return ' '.join(name.split())
+
+
+def name_similarity(a, b):
+    """Похожесть названий: доля совпадения, либо высокая, если одно название содержит другое"""
+    a, b = normalize_name(a), normalize_name(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    shorter, longer = sorted((a, b), key=len)
+    if len(shorter) >= 4 and shorter in longer:
+        return 0.9
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _valid_coords(df):
+    df = df.copy()
+    df['lat'] = pd.to_numeric(df['lat'], errors='coerce')
+    df['lon'] = pd.to_numeric(df['lon'], errors='coerce')
+    return df.dropna(subset=['lat', 'lon']).reset_index(drop=True)
+
+
+def find_near_duplicates(df, radius_m=DUPLICATE_RADIUS_M, min_similarity=NAME_SIMILARITY):
+    """
+    Ищет пары разных записей в радиусе radius_m с похожими названиями.
+    :return: DataFrame пар с расстоянием, похожестью и номером группы (cluster) —
+             записи одной группы, скорее всего, одна и та же организация
+    """
+    df = _valid_coords(df)
+    keys = [org_index_key(record) for record in df[['link', 'name', 'address']].to_dict('records')]
+    index = GridIndex(radius_m, ref_lat=df['lat'].mean() if len(df) else 55.75)
+    for i, (lat, lon) in enumerate(zip(df['lat'], df['lon'])):
+        index.add(i, lat, lon)
+
+    parent = list(range(len(df)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    pairs = []
+    names = df['name'].tolist()
+    for i, (lat, lon) in enumerate(zip(df['lat'], df['lon'])):
+        for j, distance in index.query_radius(lat, lon, radius_m):
+            if j <= i or keys[i] == keys[j]:
+                continue
+            similarity = name_similarity(names[i], names[j])
+            if similarity >= min_similarity:
+                pairs.append((i, j, distance, similarity))
+                parent[find(j)] = find(i)
+
+    rows = [{
+        'cluster': find(i),
+        'key_a': keys[i], 'name_a': names[i], 'address_a': df.at[i, 'address'],
+        'key_b': keys[j], 'name_b': names[j], 'address_b': df.at[j, 'address'],
+        'distance_m': round(distance, 1),
+        'name_similarity': round(similarity, 3),
+    } for i, j, distance, similarity in pairs]
+
+    result = pd.DataFrame(rows, columns=['cluster', 'key_a', 'name_a', 'address_a', 'key_b', 'name_b',
+                                         'address_b', 'distance_m', 'name_similarity'])
+    print(f"[SPATIAL] Проверено {len(df)} организаций, пар-дубликатов: {len(result)}, "
+          f"групп: {result['cluster'].nunique()}")
+    return result
+
+
+def coverage_report(df, bbox=MOSCOW_BBOX, cell_m=COVERAGE_CELL_M,
+                    sparse_ratio=SPARSE_RATIO, min_neighbor_median=MIN_NEIGHBOR_MEDIAN, base_url=MAP_BASE_URL):
+    """
+    Считает организации по ячейкам сетки в границах bbox и отмечает ячейки, где их
+    намного меньше, чем у соседей (вероятный пропуск выдачи).
+    :param base_url: карта региона, на которую ведут ссылки участков (tiling.region_base_url)
+    :return: DataFrame подозрительных ячеек с границами и ссылкой на карту участка
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    df = _valid_coords(df)
+    df = df[df['lon'].between(lon_min, lon_max) & df['lat'].between(lat_min, lat_max)]
+
+    index = GridIndex(cell_m, ref_lat=(lat_min + lat_max) / 2, origin=(lon_min, lat_min))
+    for i, (lat, lon) in enumerate(zip(df['lat'], df['lon'])):
+        index.add(i, lat, lon)
+    counts = index.counts()
+
+    rows_total = math.ceil((lat_max - lat_min) / index.lat_step)
+    cols_total = math.ceil((lon_max - lon_min) / index.lon_step)
+
+    gaps = []
+    for row in range(rows_total):
+        for col in range(cols_total):
+            neighbors = [
+                counts.get((row + d_row, col + d_col), 0)
+                for d_row in (-1, 0, 1) for d_col in (-1, 0, 1)
+                if (d_row or d_col) and 0 <= row + d_row < rows_total and 0 <= col + d_col < cols_total
+            ]
+            median = statistics.median(neighbors) if neighbors else 0
+            count = counts.get((row, col), 0)
+            if median >= min_neighbor_median and count < sparse_ratio * median:
+                tile = Tile(
+                    lon_min + col * index.lon_step, lat_min + row * index.lat_step,
+                    min(lon_max, lon_min + (col + 1) * index.lon_step),
+                    min(lat_max, lat_min + (row + 1) * index.lat_step), 0
+                )
+                gaps.append({
+                    'row': row, 'col': col, 'orgs': count, 'neighbor_median': median,
+                    'lon_min': tile.lon_min, 'lat_min': tile.lat_min,
+                    'lon_max': tile.lon_max, 'lat_max': tile.lat_max,
+                    'url': tile_url(tile, base_url),
+                })
+
+    result = pd.DataFrame(gaps)
+    print(f"[SPATIAL] Ячеек {rows_total}x{cols_total} по {cell_m} м, с организациями: {len(counts)}, "
+          f"подозрительно пустых: {len(result)}")
+    return result
+
+
+def load_dataset(path, sep=';'):
+    """Координаты и названия из итогового CSV (merge_data.py) или каталога Parquet"""
+    columns = ['name', 'address', 'link', 'lat', 'lon']
+    if os.path.isdir(path):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, sep=sep, usecols=lambda col: col in columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Дубликаты по близости и пробелы в покрытии")
+    parser.add_argument('input', help="Итоговый CSV или каталог Parquet")
+    parser.add_argument('--sep', default=';', help="Разделитель CSV")
+    parser.add_argument('--radius', type=float, default=DUPLICATE_RADIUS_M)
+    parser.add_argument('--cell', type=float, default=COVERAGE_CELL_M)
+    parser.add_argument('--region', default='moscow', choices=sorted(REGIONS),
+                        help="Регион (tiling.REGIONS): границы сетки покрытия и карта для ссылок")
+    parser.add_argument('--duplicates', default='near_duplicates.csv')
+    parser.add_argument('--coverage', default='coverage_gaps.csv')
+    args = parser.parse_args()
+
+    df = load_dataset(args.input, args.sep)
+    find_near_duplicates(df, args.radius).to_csv(args.duplicates, index=False, encoding='utf-8')
+    coverage_report(
+        df, REGIONS[args.region].bbox, cell_m=args.cell, base_url=region_base_url(args.region)
+    ).to_csv(args.coverage, index=False, encoding='utf-8')
+    print(f"[SPATIAL] Сохранено: {args.duplicates}, {args.coverage}")
+
+
+if __name__ == "__main__":
+    main()
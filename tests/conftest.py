@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# Скрипты лежат в корне репозитория и импортируются как модули верхнего уровня
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Скрипты пишут файлы (metrics/, *.sqlite, снимки) относительно текущего каталога"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,81 @@
+import os
+import gzip
+import json
+import time
+
+from artifacts import ArtifactRecorder
+
+
+class FakeDriver:
+    """Драйвер, который отдаёт состояние страницы и скриншот без браузера"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def execute_script(self, script, *args):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError('браузер упал')
+        return {'url': f"https://yandex.ru/maps/?step={self.calls}", 'snippet': '<div></div>', 'console': []}
+
+    def get_screenshot_as_png(self):
+        raise RuntimeError('скриншот недоступен')
+
+
+def make_bundle(root, name, size, age_days=0):
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    with open(os.path.join(path, 'state.json.gz'), 'wb') as f:
+        f.write(b'x' * size)
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_ring_keeps_last_states():
+    recorder = ArtifactRecorder(root='artifacts', ring_size=3, sample_rate=0)
+    driver = FakeDriver()
+    for step in range(5):
+        recorder.record(driver, 'scroll', step=step)
+
+    assert [entry['step'] for entry in recorder.ring] == [2, 3, 4]
+    assert recorder.ring[-1]['url'].endswith('step=5')
+
+    recorder.record(FakeDriver(fail=True), 'search')
+    assert recorder.ring[-1]['state_error'] == 'браузер упал'
+
+
+def test_capture_writes_ring_on_failure():
+    recorder = ArtifactRecorder(root='artifacts', ring_size=3, sample_rate=0)
+    driver = FakeDriver()
+    recorder.record(driver, 'search', query='кафе')
+    path = recorder.capture(driver, 'search_error', ValueError('нет выдачи'), query='кафе')
+    recorder.flush()
+
+    with gzip.open(os.path.join(path, 'state.json.gz'), 'rt', encoding='utf-8') as f:
+        state = json.load(f)
+    assert state['reason'] == 'search_error'
+    assert 'ValueError: нет выдачи' in state['error']
+    assert [entry['stage'] for entry in state['ring']] == ['search']
+    assert state['screenshot_error'] == 'скриншот недоступен'
+    assert os.listdir(path) == ['state.json.gz']
+
+
+def test_retention_removes_old_bundles():
+    recorder = ArtifactRecorder(root='artifacts', sample_rate=0)
+    old = make_bundle('artifacts', 'old', 10, age_days=10)
+    fresh = make_bundle('artifacts', 'fresh', 10)
+
+    assert recorder.enforce_retention(max_total_mb=1, max_age_days=7) == 1
+    assert not os.path.exists(old)
+    assert os.path.exists(fresh)
+
+
+def test_retention_trims_oldest_until_under_size_limit():
+    recorder = ArtifactRecorder(root='artifacts', sample_rate=0)
+    bundles = [make_bundle('artifacts', f"b{i}", 400 * 1024, age_days=3 - i) for i in range(3)]
+
+    # 3 x 400 КБ при пределе 1 МБ: удаляется только самый старый
+    assert recorder.enforce_retention(max_total_mb=1, max_age_days=7) == 1
+    assert [os.path.exists(path) for path in bundles] == [False, True, True]
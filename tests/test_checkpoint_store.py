@@ -0,0 +1,26 @@
+from checkpoint_store import CheckpointStore
+
+LINK = 'https://yandex.ru/maps/org/cafe_1/100001/'
+KEY = 'https://yandex.ru/maps/org/cafe_1/100001'
+
+
+def test_failed_lookup_is_retried():
+    store = CheckpointStore('enrichment.sqlite')
+    store.mark_failed('contacts', LINK, TimeoutError('таймаут'))
+
+    assert KEY not in store.done_links('contacts')
+    assert not store.is_done('contacts', LINK)
+    assert store.results('contacts') == {}
+    assert store.failed_links('contacts') == {KEY: 'таймаут'}
+
+    store.upsert('contacts', LINK, {'phone': '+7 000', 'telegram': None, 'vk': None})
+    assert store.done_links('contacts') == {KEY}
+    assert store.failed_links('contacts') == {}
+
+
+def test_failure_does_not_overwrite_success():
+    store = CheckpointStore('enrichment.sqlite')
+    store.upsert('reviews', LINK, {'negative': '', 'positive': 'хорошо'})
+    store.mark_failed('reviews', LINK, 'повтор упал')
+
+    assert store.results('reviews') == {KEY: {'negative': '', 'positive': 'хорошо'}}
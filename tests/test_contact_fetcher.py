@@ -0,0 +1,58 @@
+import os
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+from contact_fetcher import fetch_contacts_sync, parse_contacts_from_html
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'fixtures')
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Отдаёт карточку организации по пути /maps/org/<slug>/<id>/ из fixtures/"""
+
+    def translate_path(self, path):
+        pages = {'/maps/org/cafe_1/100001/': 'org_state.html', '/maps/org/cafe_1/100002/': 'org.html'}
+        return os.path.join(self.directory, pages.get(path.split('?')[0], 'missing.html'))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fixture_server():
+    handler = partial(FixtureHandler, directory=FIXTURES)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_state_contacts_only_from_org_node(fixture_server):
+    link = 'https://yandex.ru/maps/org/cafe_1/100001/'
+    contacts = fetch_contacts_sync([link], base_url=fixture_server)[link]
+    # Telegram есть только у похожей организации и в подвале — у самой организации его нет
+    assert contacts == {'phone': '+7 (495) 123-45-67', 'telegram': None, 'vk': 'https://vk.com/cafe_test'}
+
+
+def test_dom_contacts(fixture_server):
+    link = 'https://yandex.ru/maps/org/cafe_1/100002/'
+    contacts = fetch_contacts_sync([link], base_url=fixture_server)[link]
+    assert contacts == {
+        'phone': '+7 (495) 123-45-67', 'telegram': 'https://t.me/cafe_test', 'vk': 'https://vk.com/cafe_test'
+    }
+
+
+def test_missing_page_gives_empty_contacts(fixture_server):
+    link = 'https://yandex.ru/maps/org/cafe_9/100009/'
+    contacts = fetch_contacts_sync([link], base_url=fixture_server)[link]
+    assert contacts == {'phone': None, 'telegram': None, 'vk': None}
+
+
+def test_unknown_org_id_takes_nothing_from_other_orgs():
+    with open(os.path.join(FIXTURES, 'org_state.html'), encoding='utf-8') as f:
+        html = f.read()
+    assert parse_contacts_from_html(html, '999999') == {'phone': None, 'telegram': None, 'vk': None}
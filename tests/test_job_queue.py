@@ -0,0 +1,149 @@
+import time
+
+import pytest
+
+import job_queue
+from job_queue import RedisQueue, SqliteQueue
+
+LEASE = 0.2
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def queue(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'RETRY_DELAY', 0)
+    if request.param == 'sqlite':
+        q = SqliteQueue(str(tmp_path / 'jobs.sqlite'))
+    else:
+        fakeredis = pytest.importorskip('fakeredis')  # Без fakeredis sqlite-тесты всё равно идут
+        q = RedisQueue(fakeredis.FakeRedis(decode_responses=True))
+    yield q
+    q.close()
+
+
+def expire():
+    time.sleep(LEASE * 1.5)
+
+
+def test_enqueue_is_idempotent(queue):
+    assert queue.enqueue('reviews', {'link': 'a'})
+    assert not queue.enqueue('reviews', {'link': 'a'})
+    assert queue.enqueue('contacts', {'link': 'a'})
+
+
+def test_lease_respects_kinds(queue):
+    queue.enqueue('reviews', {'link': 'a'})
+    assert queue.lease(['contacts']) is None
+    job = queue.lease(['reviews'])
+    assert (job.kind, job.payload, job.attempts) == ('reviews', {'link': 'a'}, 1)
+    assert queue.lease() is None
+
+
+def test_expired_lease_is_reclaimed(queue):
+    queue.enqueue('reviews', {'link': 'a'})
+    stale = queue.lease(lease_seconds=LEASE)
+    assert queue.heartbeat(stale, lease_seconds=LEASE)
+    expire()
+
+    fresh = queue.lease(lease_seconds=60)
+    assert fresh.id == stale.id and fresh.attempts == 2 and fresh.lease != stale.lease
+
+    # Владелец потерянной аренды не может продлить или провалить задание
+    assert not queue.heartbeat(stale)
+    assert queue.fail(stale, 'late') is None
+    assert queue.heartbeat(fresh)
+
+
+def test_heartbeat_keeps_lease(queue):
+    queue.enqueue('reviews', {'link': 'a'})
+    job = queue.lease(lease_seconds=LEASE)
+    time.sleep(LEASE * 0.6)
+    assert queue.heartbeat(job, lease_seconds=LEASE)
+    time.sleep(LEASE * 0.6)
+    assert queue.lease() is None
+
+
+def test_stale_complete_keeps_new_holders_lease(queue):
+    queue.enqueue('reviews', {'link': 'a'})
+    stale = queue.lease(lease_seconds=LEASE)
+    expire()
+    fresh = queue.lease(lease_seconds=60)
+
+    assert queue.complete(stale, {'negative': 'old'})
+    assert queue.heartbeat(fresh)  # Аренда нового владельца не снята
+    assert not queue.complete(fresh, {'negative': 'new'})  # Результат фиксируется один раз
+    assert queue.results('reviews') == {stale.key: {'negative': 'old'}}
+    assert queue.lease() is None
+
+
+def test_complete_commits_once(queue):
+    queue.enqueue('contacts', {'link': 'a'})
+    job = queue.lease()
+    assert queue.complete(job, {'phone': '1'})
+    assert not queue.complete(job, {'phone': '2'})
+    assert queue.results('contacts') == {job.key: {'phone': '1'}}
+    assert queue.lease() is None
+
+
+def test_failures_retry_then_dead_letter(queue):
+    queue.enqueue('reviews', {'link': 'a'}, max_attempts=2)
+    assert queue.fail(queue.lease(), 'timeout') == 'queued'
+    job = queue.lease()
+    assert job.attempts == 2
+    assert queue.fail(job, 'timeout') == 'dead'
+    assert queue.lease() is None
+
+    [(_, kind, payload, attempts, error)] = queue.dead_letters()
+    assert (kind, payload, attempts, error) == ('reviews', {'link': 'a'}, 2, 'timeout')
+
+    assert queue.requeue_dead() == 1
+    assert queue.lease().attempts == 1
+
+
+def test_expired_lease_without_attempts_left_is_dead(queue):
+    queue.enqueue('reviews', {'link': 'a'}, max_attempts=1)
+    queue.lease(lease_seconds=LEASE)
+    expire()
+    assert queue.lease() is None
+    assert [kind for _, kind, _, _, _ in queue.dead_letters()] == ['reviews']
+
+
+def test_worker_fails_job_when_handler_raises(queue, monkeypatch):
+    def broken(payload):
+        raise TimeoutError('page did not load')
+
+    monkeypatch.setitem(job_queue.HANDLERS, 'reviews', broken)
+    monkeypatch.setattr(job_queue, 'close_resources', lambda: None)
+    queue.enqueue('reviews', {'link': 'a'}, max_attempts=1)
+
+    assert job_queue.run_worker(queue, ['reviews']) == {'done': 0, 'failed': 1}
+    assert queue.results('reviews') == {}
+    assert len(queue.dead_letters()) == 1
+
+
+def test_reclaim_yields_to_concurrent_heartbeat():
+    fakeredis = pytest.importorskip('fakeredis')
+    queue = RedisQueue(fakeredis.FakeRedis(decode_responses=True))
+    queue.enqueue('reviews', {'link': 'a'})
+    job = queue.lease(lease_seconds=LEASE)
+    expire()
+
+    atomic = queue._atomic
+    raced = []
+
+    def racing_step(step):
+        def step_then_heartbeat(pipe):
+            result = step(pipe)
+            if not raced:
+                # Владелец продлевает аренду между чтением срока и EXEC возврата в очередь
+                queue._atomic = atomic
+                raced.append(queue.heartbeat(job, lease_seconds=60))
+            return result
+        return step_then_heartbeat
+
+    queue._atomic = lambda watch, step: atomic(watch, racing_step(step))
+    queue._reclaim_expired(time.time())
+    queue._atomic = atomic
+
+    assert raced == [True]
+    assert queue.lease() is None
+    assert queue.heartbeat(job)
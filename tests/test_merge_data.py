@@ -0,0 +1,56 @@
+import pandas as pd
+
+from merge_data import merge_files, iter_csv_records
+
+
+def org(i, address=None):
+    return {
+        'name': f"Кафе {i}", 'address': address or f"ул. Тестовая, {i}", 'rating': '4,5',
+        'link': f"https://yandex.ru/maps/org/cafe_{i}/{100000 + i}/", 'category': 'moscow_cafe',
+    }
+
+
+def append(path, rows, header=False):
+    pd.DataFrame(rows).to_csv(path, mode='a', index=False, header=header)
+
+
+def merged_names():
+    return sorted(pd.read_csv('merged.csv', sep=';')['name'])
+
+
+def test_resume_after_multiline_quoted_fields():
+    append('raw.csv', [org(1, 'ул. Тестовая, 1\nвход со двора'), org(2)], header=True)
+    merge_files(['raw.csv'], 'merged.csv', 'state.sqlite')
+
+    append('raw.csv', [org(3, 'ул. Тестовая, 3\n"Синий" подъезд\n2 этаж'), org(4)])
+    result = merge_files(['raw.csv'], 'merged.csv', 'state.sqlite')
+
+    assert result == {'read': 2, 'added': 2, 'seconds': result['seconds']}
+    assert merged_names() == ['Кафе 1', 'Кафе 2', 'Кафе 3', 'Кафе 4']
+    assert merge_files(['raw.csv'], 'merged.csv', 'state.sqlite')['read'] == 0
+
+
+def test_unfinished_record_is_left_for_next_run():
+    append('raw.csv', [org(1)], header=True)
+    with open('raw.csv', 'a', encoding='utf-8') as f:
+        f.write('Кафе 2,"ул. Тестовая, 2\n')  # Запись дописывается прямо сейчас
+
+    positions = [position for position, _ in iter_csv_records('raw.csv', chunk_rows=1)]
+    with open('raw.csv', 'rb') as f:
+        assert positions == [f.read().index('Кафе 2'.encode('utf-8'))]
+
+
+def test_existing_output_without_state_is_adopted():
+    # Файл из Spark-пути scraper.ipynb: другой набор колонок и дубль организации 1
+    old = {'name': 'Кафе 1', 'address': 'ул. Тестовая, 1', 'rating': 4.5,
+           'link': 'https://yandex.ru/maps/org/cafe_1/100001/', 'reviews_count': 10}
+    pd.DataFrame([old, old]).to_csv('merged.csv', index=False, sep=';')
+    append('raw.csv', [org(1), org(2)], header=True)
+
+    result = merge_files(['raw.csv'], 'merged.csv', 'state.sqlite')
+
+    merged = pd.read_csv('merged.csv', sep=';')
+    assert list(merged.columns) == ['name', 'address', 'rating', 'avg_price', 'reviews_count',
+                                    'link', 'lat', 'lon', 'category', 'insert_date']
+    assert sorted(merged['name']) == ['Кафе 1', 'Кафе 2']
+    assert result['added'] == 1
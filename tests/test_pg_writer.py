@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pg_writer import PostgresWriter, merge_sql
+
+TEST_TABLE = 'pg_writer_test'
+
+
+def test_merge_keeps_last_loaded_row_per_key():
+    sql = merge_sql('orgs', ['org_key', 'name', 'rating'])
+    assert 'SELECT DISTINCT ON ("org_key") "org_key", "name", "rating" FROM "stage_orgs"' in sql
+    assert 'ORDER BY "org_key", "_load_seq" DESC' in sql
+    assert sql.endswith('ON CONFLICT ("org_key") DO UPDATE SET "name" = EXCLUDED."name", "rating" = EXCLUDED."rating"')
+
+
+def test_merge_without_value_columns_does_nothing_on_conflict():
+    sql = merge_sql('orgs', ['org_key'])
+    assert sql.endswith('ON CONFLICT ("org_key") DO NOTHING')
+    assert 'SET' not in sql
+
+
+@pytest.fixture
+def pg_engine():
+    """Настоящий PostgreSQL: тесты запускаются, только если задан PG_TEST_DSN (postgresql://...)"""
+    dsn = os.environ.get('PG_TEST_DSN')
+    if not dsn:
+        pytest.skip('PG_TEST_DSN не задан')
+    pytest.importorskip('psycopg2')
+    from sqlalchemy import create_engine
+
+    engine = create_engine(dsn)
+    yield engine
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{TEST_TABLE}"')
+    engine.dispose()
+
+
+def read_table(engine):
+    return pd.read_sql_query(f'SELECT * FROM "{TEST_TABLE}" ORDER BY "org_key"', engine)
+
+
+def test_repeated_upsert_is_idempotent(pg_engine):
+    df = pd.DataFrame([
+        {'name': 'Кафе 1', 'address': 'ул. Ленина, 1', 'link': 'https://yandex.ru/maps/org/cafe/1001/', 'rating': 4.5},
+        {'name': 'Кафе 2', 'address': 'ул. Ленина, 2', 'link': 'https://yandex.ru/maps/org/cafe/1002/', 'rating': 4.0},
+    ])
+    writer = PostgresWriter(TEST_TABLE, engine=pg_engine)
+
+    writer.add(df)
+    writer.flush()
+    first = read_table(pg_engine)
+    writer.add(df)
+    writer.flush()
+
+    pd.testing.assert_frame_equal(read_table(pg_engine), first)
+    assert list(first['org_key']) == ['id:1001', 'id:1002']
+
+
+def test_new_column_is_added_to_existing_table(pg_engine):
+    writer = PostgresWriter(TEST_TABLE, engine=pg_engine)
+    writer.add(pd.DataFrame([{'name': 'Кафе 1', 'link': 'https://yandex.ru/maps/org/cafe/1001/'}]))
+    writer.flush()
+
+    writer.add(pd.DataFrame([{'name': 'Кафе 1', 'link': 'https://yandex.ru/maps/org/cafe/1001/', 'phone': '+7 495 000-00-00'}]))
+    writer.flush()
+
+    table = read_table(pg_engine)
+    assert len(table) == 1
+    assert table.loc[0, 'phone'] == '+7 495 000-00-00'
@@ -0,0 +1,42 @@
+import pytest
+
+from org_index import OrgIndex
+from parquet_sink import ParquetSink, get_sink, read_dataset
+from pipeline import run_pipeline
+
+RECORDS = [
+    {'name': f'Кафе {i}', 'address': f'ул. Ленина, {i}', 'link': f'https://yandex.ru/maps/org/cafe/{1000 + i}/'}
+    for i in range(5)
+]
+
+
+def test_failed_write_is_not_remembered():
+    index = OrgIndex()
+    seen = set()
+
+    def broken_sink(df, on_written=None):
+        raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        run_pipeline(iter(RECORDS), broken_sink, 'cafe', 2, seen, index, 'skip')
+
+    assert index.lookup(['id:1000', 'id:1001']) == {}
+    assert seen == set()  # Повторная попытка снова отправит эти организации в sink
+
+
+def test_buffered_rows_are_remembered_after_flush():
+    index = OrgIndex()
+    sink = ParquetSink('dataset', batch_size=100)
+
+    run_pipeline(iter(RECORDS), sink.add, 'cafe', 2, None, index, 'skip')
+    assert index.lookup(f'id:{1000 + i}' for i in range(5)) == {}
+
+    sink.flush()
+    assert len(read_dataset('dataset')) == 5
+    assert len(index.lookup(f'id:{1000 + i}' for i in range(5))) == 5
+
+
+def test_sink_cache_respects_batch_size():
+    assert get_sink('dataset', 10) is get_sink('dataset', 10)
+    assert get_sink('dataset', 10).batch_size == 10
+    assert get_sink('dataset', 20).batch_size == 20
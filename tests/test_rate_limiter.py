@@ -0,0 +1,38 @@
+import rate_limiter
+from rate_limiter import AdaptiveRateLimiter
+
+BUDGETS = {'org_page': (1.0, 1)}
+
+
+def test_processes_sharing_a_database_share_the_bucket(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(rate_limiter, 'JITTER', 0.0)
+    first = AdaptiveRateLimiter(BUDGETS, path='limiter.sqlite')
+    second = AdaptiveRateLimiter(BUDGETS, path='limiter.sqlite')
+
+    assert first.acquire('org_page') == 0
+    # Токен уже взят первым процессом, второй ждёт, а не идёт в полную скорость
+    assert second.acquire('org_page') > 0.9
+
+
+def test_failure_in_one_process_delays_the_other(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(rate_limiter, 'JITTER', 0.0)
+    first = AdaptiveRateLimiter(BUDGETS, path='limiter.sqlite')
+    second = AdaptiveRateLimiter(BUDGETS, path='limiter.sqlite')
+
+    first.report_failure('org_page')
+
+    assert second.acquire('org_page') >= rate_limiter.BACKOFF_BASE / 2
+    assert second.stats()['rates']['org_page'] == rate_limiter.SLOWDOWN
+
+
+def test_without_path_state_stays_in_process(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, 'sleep', lambda seconds: None)
+    first = AdaptiveRateLimiter(BUDGETS)
+    second = AdaptiveRateLimiter(BUDGETS)
+
+    first.report_failure('org_page')
+
+    assert second.acquire('org_page') == 0
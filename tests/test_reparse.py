@@ -0,0 +1,62 @@
+from parsing import build_organization_records
+from reparse import parse_search_html, parse_reviews_html
+
+# Сниппет в том виде, в каком его рисует fixtures/search.html (с переносами внутри полей)
+SEARCH_HTML = """
+<ul>
+<li class="search-snippet-view" data-coordinates="37.501000,55.700500">
+    <div class="search-business-snippet-view">
+        <a class="search-business-snippet-view__head" href="/maps/org/cafe_1/100001/">
+            <div class="search-business-snippet-view__title">Кафе
+                1</div>
+        </a>
+        <div class="search-business-snippet-view__address">ул. Тестовая, 1</div>
+        <div class="business-rating-badge-view">
+            <span class="business-rating-badge-view__rating-text">4,1</span>
+        </div>
+        <span class="business-rating-amount-view">4 оценки</span>
+        <div class="search-business-snippet-subtitle-view">
+            <span class="search-business-snippet-subtitle-view__title">Ср. чек</span>
+            <span class="search-business-snippet-subtitle-view__description">501–1501 ₽</span>
+        </div>
+    </div>
+</li>
+</ul>
+"""
+
+REVIEWS_HTML = """
+<div>
+<div class="business-review-view">
+    <div class="business-review-view__author-name">Автор 0</div>
+    <meta itemprop="datePublished" content="2024-05-01T10:00:00Z">
+    <span class="business-review-view__date">1 мая 2024</span>
+    <div class="business-rating-badge-view__stars" aria-label="Оценка 5 Из 5"></div>
+    <span class="spoiler-view__text-container">Хорошо</span>
+</div>
+<div class="business-review-view">
+    <span itemprop="name">Автор 1</span>
+    <span class="business-review-view__date">2 мая 2024</span>
+    <div class="business-rating-badge-view__stars"><span class="_full"></span><span class="_full"></span></div>
+    <div class="business-review-view__body-text">Так себе</div>
+</div>
+</div>
+"""
+
+
+def test_search_snapshot_matches_live_records():
+    live = build_organization_records([{
+        'name': 'Кафе 1', 'address': 'ул. Тестовая, 1', 'rating': '4,1', 'reviews_text': '4 оценки',
+        'price_text': '501–1501 ₽', 'coordinates': '37.501000,55.700500',
+        'link': 'https://yandex.ru/maps/org/cafe_1/100001/',
+    }])
+    assert parse_search_html(SEARCH_HTML, 'https://yandex.ru/maps/') == live
+
+
+def test_reviews_snapshot_uses_fallback_selectors():
+    first, second = parse_reviews_html(REVIEWS_HTML)
+    assert (first['author'], first['date'], first['stars'], first['text']) == (
+        'Автор 0', '2024-05-01T10:00:00Z', 5.0, 'Хорошо'
+    )
+    assert (second['author'], second['date'], second['stars'], second['text']) == (
+        'Автор 1', '2 мая 2024', 2.0, 'Так себе'
+    )
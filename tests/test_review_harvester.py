@@ -0,0 +1,14 @@
+from review_harvester import ReviewStore
+
+
+def test_same_review_is_kept_for_each_branch():
+    store = ReviewStore()
+    review = {'review_id': 'abc', 'author': 'Анна', 'date': '2024-05-01', 'stars': 5.0, 'text': 'Вкусно'}
+
+    store.save('branch-1', 'negative', [review])
+    store.save('branch-2', 'negative', [review])
+    store.save('branch-1', 'positive', [review])
+
+    assert store.known_ids('branch-1') == {'abc'}
+    assert store.known_ids('branch-2') == {'abc'}
+    assert len(store.to_frame()) == 2
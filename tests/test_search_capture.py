@@ -0,0 +1,110 @@
+import os
+import json
+
+from parsing import build_organization_records
+from search_capture import load_responses, save_responses, records_from_responses, get_performance_log, stream_captured
+
+FIXTURE = os.path.join(os.path.dirname(__file__), os.pardir, 'fixtures', 'search_response.json')
+
+
+def dom_items(numbers):
+    """Сырые поля EXTRACT_SNIPPETS_JS для тех же организаций, что рисует fixtures/search.html"""
+    return [{
+        'name': f"Кафе {i}",
+        'address': f"ул. Тестовая, {i}",
+        'link': f"https://yandex.ru/maps/org/cafe_{i}/{100000 + i}/",
+        'rating': f"4,{i % 10}",
+        'price_text': f"{500 + i}–{1500 + i} ₽",
+        'reviews_text': f"{i * 3 + 1} оценка",
+        'coordinates': f"{37.5 + i * 0.001:.6f},{55.7 + i * 0.0005:.6f}",
+    } for i in numbers]
+
+
+def test_json_path_matches_dom_path():
+    captured = records_from_responses(load_responses(FIXTURE))
+    assert captured == build_organization_records(dom_items([1, 2, 3]))
+
+
+def test_non_business_items_skipped():
+    captured = records_from_responses(load_responses(FIXTURE))
+    assert [record['name'] for record in captured] == ['Кафе 1', 'Кафе 2', 'Кафе 3']
+
+
+def test_column_types_match_dom_path():
+    captured = records_from_responses(load_responses(FIXTURE))
+    for record in captured:
+        assert isinstance(record['rating'], str)
+        assert isinstance(record['reviews_count'], str)
+        assert isinstance(record['avg_price'], str)
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    payloads = load_responses(FIXTURE)
+    save_responses(payloads * 2, str(tmp_path))
+    assert load_responses(str(tmp_path)) == payloads * 2
+
+
+class FakeDriver:
+    """Драйвер, у которого есть только performance-лог"""
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+
+    def get_log(self, kind):
+        return self.batches.pop(0) if self.batches else []
+
+
+def log_entry(method, **params):
+    return {'message': json.dumps({'message': {'method': method, 'params': params}})}
+
+
+def test_performance_log_counts_cross_origin_traffic_since_last_mark():
+    search = {'url': 'https://yandex.ru/maps/api/search?text=x', 'mimeType': 'application/json'}
+    driver = FakeDriver(
+        [log_entry('Network.responseReceived', requestId='1', response=search),
+         log_entry('Network.loadingFinished', requestId='1', encodedDataLength=1000),
+         log_entry('Network.loadingFinished', requestId='2', encodedDataLength=500)],
+        [log_entry('Network.loadingFinished', requestId='3', encodedDataLength=250)],
+    )
+    log = get_performance_log(driver)
+
+    assert log.pull(driver)
+    assert log.take_traffic() == (1500, 2)
+    assert log.pull(driver)
+    assert log.take_traffic() == (250, 1)
+    assert log.take_search_request_ids() == ['1']
+    assert log.take_search_request_ids() == []
+
+
+class CapturingDriver(FakeDriver):
+    """Драйвер с performance-логом и телами ответов поиска"""
+
+    def __init__(self, bodies, *batches):
+        super().__init__(*batches)
+        self.bodies = bodies
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {'body': json.dumps(self.bodies[params['requestId']])}
+
+
+def test_stream_captured_interleaves_responses_with_dom_batches():
+    search = {'url': 'https://yandex.ru/maps/api/search?text=x', 'mimeType': 'application/json'}
+    driver = CapturingDriver(
+        {'1': load_responses(FIXTURE)[0]},
+        [log_entry('Network.responseReceived', requestId='1', response=search)],
+    )
+    pulled = []
+
+    def dom_records():
+        for record in build_organization_records(dom_items([3, 4, 5, 6])):
+            pulled.append(record['name'])
+            yield record
+
+    stream = stream_captured(driver, dom_records(), batch_size=2)
+    first = [next(stream) for _ in range(5)]
+
+    # Ответ пришёл после первой пачки DOM: его записи идут раньше неё, остальное DOM ещё не прокручено
+    assert [record['name'] for record in first] == ['Кафе 1', 'Кафе 2', 'Кафе 3', 'Кафе 3', 'Кафе 4']
+    assert pulled == ['Кафе 3', 'Кафе 4']
+    assert [record['name'] for record in stream] == ['Кафе 5', 'Кафе 6']
+    assert get_performance_log(driver).take_search_request_ids() == []
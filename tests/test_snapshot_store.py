@@ -0,0 +1,30 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from snapshot_store import SnapshotStore
+
+
+def age(store, content_hash, days):
+    """Состаривает снимок и его файл на days дней"""
+    captured_at = (datetime.now() - timedelta(days=days)).isoformat()
+    with store.conn:
+        store.conn.execute("UPDATE snapshots SET captured_at = ? WHERE content_hash = ?", (captured_at, content_hash))
+    path = store._blob_path(content_hash)
+    old = time.time() - days * 86400
+    os.utime(path, (old, old))
+    return path
+
+
+def test_maybe_evict_removes_expired_once_per_interval():
+    store = SnapshotStore('snapshots')
+    old_path = age(store, store.save('org', 'https://x/1', '<html>старый</html>'), 40)
+    fresh_hash = store.save('org', 'https://x/2', '<html>свежий</html>')
+
+    assert store.maybe_evict(ttl_days=30) == (1, 1)
+    assert not os.path.exists(old_path)
+    assert os.path.exists(store._blob_path(fresh_hash))
+
+    age(store, fresh_hash, 40)
+    assert store.maybe_evict(ttl_days=30) is None  # С прошлой очистки не прошло EVICT_INTERVAL_HOURS
+    assert store.maybe_evict(ttl_days=30, interval_hours=0) == (1, 1)
@@ -0,0 +1,46 @@
+import math
+
+import pandas as pd
+
+from spatial_index import METERS_PER_DEGREE, GridIndex, coverage_report, find_near_duplicates
+from tiling import REGIONS, region_base_url
+
+
+def test_coverage_report_for_other_region():
+    lon_min, lat_min, lon_max, lat_max = bbox = REGIONS['spb'].bbox
+    # Равномерно по 3 организации в каждой точке сетки 0.01°, кроме одного участка в середине
+    points = [
+        (lat_min + 0.005 + 0.01 * row, lon_min + 0.005 + 0.01 * col)
+        for row in range(int((lat_max - lat_min) / 0.01)) for col in range(int((lon_max - lon_min) / 0.01))
+        if not (row == 10 and col == 20)
+    ]
+    df = pd.DataFrame([{'lat': lat, 'lon': lon} for lat, lon in points for _ in range(3)])
+
+    gaps = coverage_report(df, bbox, cell_m=1000, base_url=region_base_url('spb'))
+
+    assert len(gaps) >= 1
+    assert gaps['url'].str.startswith('https://yandex.ru/maps/2/saint-petersburg/?ll=').all()
+    assert gaps['lat_min'].between(lat_min, lat_max).all()
+
+
+def test_near_duplicates_across_neighbouring_cells():
+    radius_m = 50
+    grid = GridIndex(radius_m, ref_lat=55.75)
+    boundary = math.ceil(55.75 / grid.lat_step) * grid.lat_step  # Граница ячеек сетки по широте
+    meter = 1 / METERS_PER_DEGREE
+    lon = 37.6
+    df = pd.DataFrame([
+        # 45 м, по разные стороны границы ячеек — дубликат
+        {'name': 'Кофе Хауз', 'address': 'Тверская, 1', 'link': None, 'lat': boundary - 20 * meter, 'lon': lon},
+        {'name': 'Кофе-Хауз', 'address': 'Тверская ул., 1', 'link': None, 'lat': boundary + 25 * meter, 'lon': lon},
+        # 55 м — уже не дубликат, хотя название то же
+        {'name': 'Шоколадница', 'address': 'Арбат, 2', 'link': None, 'lat': boundary - 25 * meter, 'lon': lon + 0.01},
+        {'name': 'Шоколадница', 'address': 'Арбат, 4', 'link': None, 'lat': boundary + 30 * meter, 'lon': lon + 0.01},
+    ])
+    assert grid.cell_of(df.at[0, 'lat'], lon) != grid.cell_of(df.at[1, 'lat'], lon)
+
+    pairs = find_near_duplicates(df, radius_m=radius_m)
+
+    assert len(pairs) == 1
+    assert {pairs.at[0, 'name_a'], pairs.at[0, 'name_b']} == {'Кофе Хауз', 'Кофе-Хауз'}
+    assert 40 < pairs.at[0, 'distance_m'] <= radius_m
@@ -0,0 +1,43 @@
+from tiling import REGIONS, Tile, plan_search_urls, plan_tiles, run_tiles
+
+
+def test_plan_uses_custom_center_for_its_region():
+    plan = plan_search_urls([('кафе', 'cafe')], ('moscow', 'spb'), (12,), {'moscow': (37.5, 55.8)})
+    urls = {url.split('?')[0]: url for _, _, url in plan}
+
+    assert urls['https://yandex.ru/maps/213/moscow/'] == (
+        'https://yandex.ru/maps/213/moscow/?ll=37.500000%2C55.800000&z=12&text=%D0%BA%D0%B0%D1%84%D0%B5'
+    )
+    lon, lat = REGIONS['spb'].center
+    assert f"ll={lon:.6f}%2C{lat:.6f}&z=12" in urls['https://yandex.ru/maps/2/saint-petersburg/']
+
+
+def test_plan_without_centers_uses_region_center():
+    [(query, category, url)] = plan_search_urls([('кафе', 'cafe')], ('moscow',), (10,))
+    lon, lat = REGIONS['moscow'].center
+    assert (query, category) == ('кафе', 'cafe')
+    assert f"ll={lon:.6f}%2C{lat:.6f}&z=10" in url
+
+
+def test_run_tiles_splits_full_tiles_until_max_depth():
+    calls = []
+
+    def fetch(tile):
+        calls.append(tile)
+        # Полон только левый нижний угол: делится, пока не дойдёт до max_depth
+        if tile.lon_min == 0 and tile.lat_min == 0:
+            return [f'org-{len(calls)}-{i}' for i in range(3)]
+        return ['org']
+
+    results, page_loads = run_tiles(plan_tiles((0, 0, 8, 8)), fetch, ceiling=3, max_depth=2)
+
+    assert page_loads == len(calls) == 1 + 4 + 4
+    assert sorted(tile.depth for tile in calls) == [0, 1, 1, 1, 1, 2, 2, 2, 2]
+    assert Tile(0, 0, 2, 2, 2) in calls
+    assert not any(tile.depth > 2 for tile in calls)
+    assert len(results) == 3 + (3 + 3) + (3 + 3)
+
+
+def test_run_tiles_counts_failed_tile_as_empty():
+    results, page_loads = run_tiles(plan_tiles((0, 0, 1, 1), grid=2), lambda tile: None, ceiling=1)
+    assert (results, page_loads) == ([], 4)
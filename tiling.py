@@ -0,0 +1,123 @@
+import math
+from collections import namedtuple
+from urllib.parse import quote, urlparse, parse_qs
+
+# Границы старой Москвы (lon_min, lat_min, lon_max, lat_max)
+MOSCOW_BBOX = (37.35, 55.55, 37.90, 55.95)
+MAP_BASE_URL = "https://yandex.ru/maps/213/moscow/"
+VIEWPORT_PX = 1024  # Примерная ширина карты в пикселях, используется для подбора зума
+
+Tile = namedtuple('Tile', ['lon_min', 'lat_min', 'lon_max', 'lat_max', 'depth'])
+
+# Регион карты: id и имя в ссылке Яндекс Карт, центр (lon, lat) и границы для участков
+Region = namedtuple('Region', ['region_id', 'slug', 'center', 'bbox'])
+REGIONS = {
+    'moscow': Region(213, 'moscow', (37.622504, 55.752334), MOSCOW_BBOX),
+    'spb': Region(2, 'saint-petersburg', (30.315868, 59.939095), (30.10, 59.80, 30.55, 60.05)),
+}
+
+
+def zoom_for_span(lon_span, viewport_px=VIEWPORT_PX):
+    """Наибольший зум, при котором участок шириной lon_span градусов целиком помещается в окно"""
+    zoom = math.floor(math.log2(viewport_px * 360 / (256 * lon_span)))
+    return max(1, min(zoom, 19))
+
+
+def tile_url(tile, base_url=MAP_BASE_URL):
+    """Ссылка на карту, отцентрированную по участку: ll — центр, spn — размер, z — зум"""
+    lon = (tile.lon_min + tile.lon_max) / 2
+    lat = (tile.lat_min + tile.lat_max) / 2
+    lon_span = tile.lon_max - tile.lon_min
+    lat_span = tile.lat_max - tile.lat_min
+    return (f"{base_url}?ll={lon:.6f}%2C{lat:.6f}"
+            f"&spn={lon_span:.6f}%2C{lat_span:.6f}&z={zoom_for_span(lon_span)}")
+
+
+def region_base_url(region='moscow'):
+    """Базовая ссылка на карту региона, например https://yandex.ru/maps/213/moscow/"""
+    info = REGIONS[region]
+    return f"https://yandex.ru/maps/{info.region_id}/{info.slug}/"
+
+
+def region_map_url(region='moscow', center=None, zoom=10):
+    """Ссылка на карту региона: центр региона или заданный center=(lon, lat), масштаб zoom"""
+    lon, lat = center or REGIONS[region].center
+    return f"{region_base_url(region)}?ll={lon:.6f}%2C{lat:.6f}&z={zoom}"
+
+
+def with_search_text(url, query):
+    """Добавляет к ссылке на карту текст запроса: страница открывается сразу с результатами поиска"""
+    if 'text' in parse_qs(urlparse(url).query):
+        return url  # Ссылка уже ведёт на выдачу (например, из plan_search_urls)
+    separator = '&' if '?' in url else '?'
+    return f"{url}{separator}text={quote(query)}"
+
+
+def plan_search_urls(queries, regions=('moscow',), zooms=(10,), centers=None):
+    """
+    Раскрывает план запрос x регион x масштаб в готовые ссылки на выдачу.
+    :param queries: список (запрос, метка)
+    :param centers: dict регион -> свой центр карты (lon, lat); для остальных — центр региона
+    :return: list (запрос, метка, ссылка)
+    """
+    centers = centers or {}
+    return [
+        (query, category, with_search_text(region_map_url(region, centers.get(region), zoom), query))
+        for query, category in queries for region in regions for zoom in zooms
+    ]
+
+
+def split_bbox(bbox, rows, cols, depth=0):
+    """Делит прямоугольник на сетку rows x cols участков"""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    lon_step = (lon_max - lon_min) / cols
+    lat_step = (lat_max - lat_min) / rows
+
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            tiles.append(Tile(
+                lon_min + col * lon_step,
+                lat_min + row * lat_step,
+                lon_min + (col + 1) * lon_step,
+                lat_min + (row + 1) * lat_step,
+                depth
+            ))
+    return tiles
+
+
+def subdivide(tile):
+    """Делит участок на четыре, уровень вложенности увеличивается на 1"""
+    return split_bbox(tile[:4], 2, 2, depth=tile.depth + 1)
+
+
+def plan_tiles(bbox=MOSCOW_BBOX, grid=1):
+    """Начальный план обхода: сетка grid x grid участков"""
+    return split_bbox(bbox, grid, grid)
+
+
+def run_tiles(tiles, fetch, ceiling, max_depth=3):
+    """
+    Обходит участки и рекурсивно дробит те, где выдача упёрлась в потолок.
+    :param tiles: начальный план (list[Tile])
+    :param fetch: функция tile -> list результатов (или None при ошибке)
+    :param ceiling: сколько результатов означает, что выдача обрезана
+    :param max_depth: максимальная глубина дробления
+    :return: (list результатов всех участков, количество загрузок страниц)
+    """
+    stack = list(reversed(tiles))
+    results = []
+    page_loads = 0
+
+    while stack:
+        tile = stack.pop()
+        found = fetch(tile) or []
+        page_loads += 1
+        results.extend(found)
+
+        if len(found) >= ceiling and tile.depth < max_depth:
+            print(f"[TILES] Участок {tile_url(tile)} упёрся в потолок ({len(found)}), делим на 4")
+            stack.extend(reversed(subdivide(tile)))
+
+    print(f"[TILES] Обойдено участков: {page_loads}, найдено записей: {len(results)}")
+    return results, page_loads